@@ -0,0 +1,97 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Benchmark of mails queue storage memory usage.
+
+Compare memory allocated by the objects based store and the columnar store
+to hold the same mails queue, measured with :mod:`tracemalloc`. Each store is
+loaded in a dedicated python process from a synthetic postqueue output file.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_columnar.py [-n MAILS]
+"""
+
+import os
+import gc
+import sys
+import time
+import argparse
+import subprocess
+import tempfile
+import tracemalloc
+
+import samples
+
+METHODS = ["objects", "columnar"]
+
+
+def run(method, filename):
+    """Load store from sample using method and print measures"""
+    from pymailq import store, columnar
+
+    if method == "columnar":
+        pstore = columnar.ColumnarPostqueueStore()
+    else:
+        pstore = store.PostqueueStore()
+
+    tracemalloc.start()
+    start = time.time()
+    pstore.load(filename=filename)
+    len(pstore.mails)
+    elapsed = time.time() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("%-10s %8d mails  %8.3f s  %8.1f MB held  %8.1f MB peak  "
+          "%6d B/mail" % (method, len(pstore.mails), elapsed,
+                          current / 1024.0 / 1024, peak / 1024.0 / 1024,
+                          current // max(1, len(pstore.mails))))
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    parser.add_argument("--run", nargs=2, metavar=("METHOD", "FILE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run(*args.run)
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        for method in METHODS:
+            subprocess.check_call([sys.executable, __file__,
+                                   "--run", method, filename])
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main()
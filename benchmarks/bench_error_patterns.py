@@ -0,0 +1,95 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of mails classification by errors signatures.
+
+Compare wall time of one error scan of selected mails by signature against
+a single classification of mails with a patterns matcher, and show the
+number of distinct errors and error templates of the sample.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_error_patterns.py [-n MAILS]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+from collections import Counter
+
+from pymailq import store, selector, patterns
+
+import samples
+
+SIGNATURES = ["timed out", "Try again later", "transport unavailable",
+              "lost connection", "initial server greeting"]
+SIGNATURES += ["remote%d.org" % (idx,) for idx in range(1, 46)]
+
+
+def scan_signatures(mails):
+    """Scan mails errors once by signature"""
+    return [(signature, [mail for mail in mails
+                         if [err for err in mail.errors if signature in err]])
+            for signature in SIGNATURES]
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        pstore = store.PostqueueStore()
+        pstore.load(method="file", filename=filename)
+    finally:
+        os.unlink(filename)
+
+    pselector = selector.MailSelector(pstore)
+    pselector.lookup_status("deferred")
+
+    start = time.time()
+    scanned = scan_signatures(pselector.mails)
+    print("%-10s %8d mails  %8.3f s" % (
+        "scan", len(pstore.mails), time.time() - start))
+
+    start = time.time()
+    classified = pselector.classify_errors(SIGNATURES)
+    print("%-10s %8d mails  %8.3f s" % (
+        "matcher", len(pstore.mails), time.time() - start))
+    assert classified == scanned
+
+    errors = Counter()
+    for mail in pstore.mails:
+        errors.update(mail.errors)
+    start = time.time()
+    templates = patterns.count_templates(errors)
+    print("%-10s %8d errors %8d templates  %8.3f s" % (
+        "templates", len(errors), len(templates), time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
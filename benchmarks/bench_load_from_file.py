@@ -0,0 +1,88 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Benchmark of mails queue loading from archived postqueue output dumps.
+
+Compare peak memory usage (RSS) and wall time of the ``readlines`` based
+loading (``load(method="postqueue", filename=...)``) against the memory-mapped
+bytes parser (``load(method="file", filename=...)``). Each method is run in a
+dedicated python process to measure its own peak RSS.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_load_from_file.py [-n MAILS]
+"""
+
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+import samples
+
+METHODS = ["postqueue", "file"]
+
+
+def run(method, filename):
+    """Load store from dump using method and print measures"""
+    from pymailq import store
+
+    pstore = store.PostqueueStore()
+    start = time.time()
+    pstore.load(method=method, filename=filename)
+    elapsed = time.time() - start
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("%-10s %8d mails  %8.3f s  %10.1f MB peak RSS" % (
+        method, len(pstore.mails), elapsed, maxrss / 1024.0))
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    parser.add_argument("--run", nargs=2, metavar=("METHOD", "FILE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run(*args.run)
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        print("dump: %d mails, %.1f MB" % (
+            args.mails, os.path.getsize(filename) / 1024.0 / 1024))
+        for method in METHODS:
+            subprocess.check_call([sys.executable, __file__,
+                                   "--run", method, filename])
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main()
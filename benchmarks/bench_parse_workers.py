@@ -0,0 +1,79 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Benchmark of mails content parsing with a pool of worker processes.
+
+Measure wall time of :meth:`PostqueueStore.parse_mails` with an increasing
+number of worker processes. The postcat command is replaced with the
+``fake_postcat.py`` script printing synthetic mails contents.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_parse_workers.py [-n MAILS]
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+import pymailq
+from pymailq import store
+
+import samples
+
+WORKERS = [1, 2, 4, 8]
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=20000,
+                        help="number of mails to parse (default: 20000)")
+    args = parser.parse_args()
+
+    fake_postcat = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "fake_postcat.py")
+    pymailq.CONFIG['commands']['use_sudo'] = False
+    pymailq.CONFIG['commands']['cat_message'] = [sys.executable,
+                                                 fake_postcat, "-qv"]
+    pymailq.CONFIG['core']['max_parse_workers'] = max(WORKERS)
+
+    print("cpus: %d" % multiprocessing.cpu_count())
+    for workers in WORKERS:
+        pstore = store.PostqueueStore()
+        pstore.mails = [pstore.MailClass(mail['qid'])
+                        for mail in samples.sample_mails(args.mails)]
+
+        start = time.time()
+        pstore.parse_mails(workers=workers)
+        elapsed = time.time() - start
+
+        parsed = len([mail for mail in pstore.mails if mail.parsed])
+        print("%d workers  %8d mails parsed  %8.3f s" % (
+            workers, parsed, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Benchmark of parsed mails memory usage.
+
+Measure memory allocated per parsed :class:`~store.Mail` object with
+:mod:`tracemalloc`. Mails are loaded from a synthetic postqueue output file
+and parsed from fake postcat outputs, without calling any command.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_parsed_mails.py [-n MAILS]
+"""
+
+import os
+import gc
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from pymailq import store
+
+import samples
+import fake_postcat
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=100000,
+                        help="number of mails in sample (default: 100000)")
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        outputs = {}
+        tracemalloc.start()
+        start = time.time()
+        pstore = store.PostqueueStore()
+        pstore.load(filename=filename)
+        loaded = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        for mail in pstore.mails:
+            outputs[mail.qid] = fake_postcat.postcat(mail.qid)
+
+        tracemalloc.start()
+        for mail in pstore.mails:
+            mail._parse_postcat_output(outputs.pop(mail.qid))
+        gc.collect()
+        parsed = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        elapsed = time.time() - start
+    finally:
+        os.unlink(filename)
+
+    print("%8d mails  %8.3f s  %6d B/mail loaded  %6d B/mail headers" % (
+        len(pstore.mails), elapsed, loaded // len(pstore.mails),
+        parsed // len(pstore.mails)))
+
+
+if __name__ == "__main__":
+    main()
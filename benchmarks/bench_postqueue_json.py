@@ -0,0 +1,85 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Benchmark of mails queue loading from postqueue text and JSON outputs.
+
+Compare the per mail loading time of the ``postqueue`` text output parser
+against the ``postqueue -j`` JSON output parser, on the same synthetic mails
+queue. The postqueue commands are replaced with ``cat`` on samples.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_postqueue_json.py [-n MAILS]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import samples
+from pymailq import store
+
+
+def measure(method, command, repeat):
+    """Return best loading time per mail in microseconds"""
+    best = None
+    for _ in range(repeat):
+        pstore = store.PostqueueStore()
+        pstore.postqueue_cmd = command
+        pstore.postqueue_json_cmd = command
+        start = time.time()
+        pstore.load(method=method)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(pstore.mails), best * 1000000 / max(len(pstore.mails), 1)
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=100000,
+                        help="number of mails in sample (default: 100000)")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of runs, best is kept (default: 3)")
+    args = parser.parse_args()
+
+    files = []
+    try:
+        for writer, method in ((samples.write_mailq, "postqueue"),
+                               (samples.write_postqueue_json,
+                                "postqueue_json")):
+            fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+            os.close(fd)
+            files.append(filename)
+            writer(filename, args.mails)
+            count, per_mail = measure(method, ["cat", filename], args.repeat)
+            print("%-15s %8d mails  %8.2f us/mail" % (method, count,
+                                                        per_mail))
+    finally:
+        for filename in files:
+            os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Benchmark of mails parsing from Postfix queue files.
+
+Compare wall time of mails loading from a synthetic spool with the batched
+postcat parsing against the direct queue files reading. The postcat command
+is replaced with the ``fake_postcat.py`` script, real Postfix parsing costs
+are then underestimated for the postcat based method.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_queue_file.py [-n MAILS]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import pymailq
+from pymailq import store
+
+import samples
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=20000,
+                        help="number of mails in spool (default: 20000)")
+    args = parser.parse_args()
+
+    fake_postcat = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "fake_postcat.py")
+    pymailq.CONFIG['commands']['use_sudo'] = False
+    pymailq.CONFIG['commands']['cat_message'] = [sys.executable,
+                                                 fake_postcat, "-qv"]
+
+    spool = tempfile.mkdtemp(prefix="pymailq-bench-")
+    try:
+        samples.write_spool(spool, args.mails)
+
+        pstore = store.PostqueueStore()
+        pstore.spool_path = spool
+        start = time.time()
+        pstore.load(method="spool")
+        pstore.parse_mails()
+        elapsed = time.time() - start
+        print("%-12s %8d mails  %8.3f s" % ("postcat", len(pstore.mails),
+                                           elapsed))
+
+        pstore = store.PostqueueStore()
+        pstore.spool_path = spool
+        start = time.time()
+        pstore.load(method="spool", parse=True)
+        elapsed = time.time() - start
+        print("%-12s %8d mails  %8.3f s" % ("queue files", len(pstore.mails),
+                                           elapsed))
+    finally:
+        shutil.rmtree(spool)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of MailSelector exact lookups.
+
+Compare wall time of exact sender, recipient and status lookups, of
+partial sender, recipient and error lookups, and of size range lookups and
+sorts by date, made with a linear scan of selected mails against lookups
+using the store indexes. The first indexed
+lookup of each kind includes the index build time.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_selector_index.py [-n MAILS]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from pymailq import store, selector
+
+import samples
+
+ROUNDS = 20
+PARTIAL_SENDER = "@domain12."
+PARTIAL_RECIPIENT = "user-42"
+PARTIAL_ERROR = "timed out"
+
+
+def scan_lookups(mails, sender, recipient):
+    """Exact lookups with a linear scan"""
+    selected = [mail for mail in mails if mail.sender == sender]
+    selected = [mail for mail in mails if recipient in mail.recipients]
+    selected = [mail for mail in mails if mail.status in ["deferred"]]
+    selected = [mail for mail in mails if PARTIAL_SENDER in mail.sender]
+    selected = [mail for mail in mails
+                if [rcpt for rcpt in mail.recipients
+                    if PARTIAL_RECIPIENT in rcpt]]
+    selected = [mail for mail in mails
+                if [err for err in mail.errors if PARTIAL_ERROR in err]]
+    selected = [mail for mail in mails if mail.size <= 200000]
+    selected = [mail for mail in selected if mail.size >= 10000]
+    selected = sorted(mails, key=lambda x: getattr(x, "date"), reverse=True)
+    return selected
+
+
+def index_lookups(pselector, sender, recipient):
+    """Exact lookups with store indexes"""
+    pselector.reset()
+    pselector.lookup_sender(sender)
+    pselector.reset()
+    pselector.lookup_recipient(recipient)
+    pselector.reset()
+    pselector.lookup_status(["deferred"])
+    pselector.reset()
+    pselector.lookup_sender(PARTIAL_SENDER, exact=False)
+    pselector.reset()
+    pselector.lookup_recipient(PARTIAL_RECIPIENT, exact=False)
+    pselector.reset()
+    pselector.lookup_error(PARTIAL_ERROR)
+    pselector.reset()
+    pselector.lookup_size(10000, 200000)
+    pselector.reset()
+    return pselector.sorted_mails("date", True)
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        pstore = store.PostqueueStore()
+        pstore.load(method="file", filename=filename)
+    finally:
+        os.unlink(filename)
+
+    pselector = selector.MailSelector(pstore)
+    sender = pstore.mails[0].sender
+    recipient = pstore.mails[0].recipients[0]
+
+    start = time.time()
+    index_lookups(pselector, sender, recipient)
+    print("%-10s %8d mails  %8.3f s" % (
+        "build", len(pstore.mails), time.time() - start))
+
+    for name, lookups, target in (("scan", scan_lookups, pstore.mails),
+                                  ("index", index_lookups, pselector)):
+        start = time.time()
+        for _ in range(ROUNDS):
+            lookups(target, sender, recipient)
+        print("%-10s %8d mails  %8.3f s per round" % (
+            name, len(pstore.mails), (time.time() - start) / ROUNDS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of MailSelector filters replay.
+
+Compare wall time of a full filters replay against a replay reusing
+cached filters results, the removal of the last filter, and a replay
+after a store reload where one mail out of a hundred was held.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_selector_replay.py [-n MAILS]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from pymailq import store, selector
+
+import samples
+
+ROUNDS = 10
+
+
+def hold_mails(source, target, every=100):
+    """Copy a mailq sample, holding one mail every ``every`` mails"""
+    count = 0
+    with open(source) as sample, open(target, "w") as output:
+        for line in sample:
+            if line[0] not in " -\n" and line[12] == " ":
+                count += 1
+                if not count % every:
+                    line = line[:12] + "!" + line[13:]
+            output.write(line)
+
+
+def apply_filters(pselector):
+    """Register benchmarked filters"""
+    pselector.lookup_status("deferred")
+    pselector.lookup_error("timed out")
+    pselector.lookup_sender("@domain1", exact=False)
+    pselector.lookup_size(10000, 1000000)
+
+
+def timed(function, *args):
+    """Average wall time of function calls"""
+    start = time.time()
+    for _ in range(ROUNDS):
+        function(*args)
+    return (time.time() - start) / ROUNDS
+
+
+def full_replay(pselector):
+    """Replay filters without cached results"""
+    pselector.store.touch()
+    pselector.replay_filters()
+
+
+def remove_filter(pselector):
+    """Remove last filter and register it again"""
+    pselector.remove_filter(-1)
+    pselector.lookup_size(10000, 1000000)
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    fd, held = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        hold_mails(filename, held)
+        pstore = store.PostqueueStore()
+        pstore.load(method="file", filename=filename)
+        pselector = selector.MailSelector(pstore)
+        apply_filters(pselector)
+
+        for name, function in (("full", full_replay),
+                               ("cached", selector.MailSelector.replay_filters),
+                               ("rmfilter", remove_filter)):
+            print("%-10s %8d mails  %8.3f s per round" % (
+                name, len(pstore.mails), timed(function, pselector)))
+
+        elapsed = 0
+        for idx in range(ROUNDS):
+            pstore.reload(method="file",
+                          filename=held if idx % 2 else filename)
+            start = time.time()
+            pselector.replay_filters()
+            elapsed += time.time() - start
+        print("%-10s %8d mails  %8.3f s per round" % (
+            "reload", len(pstore.mails), elapsed / ROUNDS))
+    finally:
+        os.unlink(filename)
+        os.unlink(held)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of streamed mails selections.
+
+Compare wall time and peak memory of chained lookups, each building a list
+of selected mails, against a mails stream checking the same filters on
+each mail, with and without a limit.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_selector_stream.py [-n MAILS]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from pymailq import store, selector
+
+import samples
+
+LIMIT = 100
+
+
+def lookups(pselector):
+    """Chained lookups"""
+    pselector.reset()
+    pselector.lookup_status("deferred")
+    pselector.lookup_sender("@domain1", exact=False)
+    pselector.lookup_recipient("user-4", exact=False)
+    return [mail.qid for mail in pselector.mails]
+
+
+def stream(pselector, limit=None):
+    """Streamed selection"""
+    pselector.reset()
+    mails = pselector.stream().status("deferred").sender(
+        "@domain1", exact=False).recipient("user-4", exact=False)
+    if limit is not None:
+        mails.limit(limit)
+    return [mail.qid for mail in mails]
+
+
+def measure(name, function, *args):
+    """Print wall time and peak memory of a selection"""
+    tracemalloc.start()
+    start = time.time()
+    qids = function(*args)
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("%-10s %8d mails  %8.3f s  %8.1f MB peak" % (
+        name, len(qids), elapsed, peak / 1048576.0))
+    return qids
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        pstore = store.PostqueueStore()
+        pstore.load(method="file", filename=filename)
+    finally:
+        os.unlink(filename)
+
+    pselector = selector.MailSelector(pstore)
+    expected = measure("lookups", lookups, pselector)
+    assert measure("stream", stream, pselector) == expected
+    assert measure("limit", stream, pselector, LIMIT) == expected[:LIMIT]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Benchmark of mails queue loading from spool queue files.
+
+Compare wall time of spool loading with envelope only reading and headers
+reading, with an increasing number of spool walking threads. Loading of the
+same mails queue from a postqueue output file is given as reference.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_spool_walker.py [-n MAILS]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+from pymailq import store
+
+import samples
+
+WORKERS = [1, 2, 4, 8]
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=50000,
+                        help="number of mails in spool (default: 50000)")
+    args = parser.parse_args()
+
+    spool = tempfile.mkdtemp(prefix="pymailq-bench-")
+    try:
+        samples.write_spool(spool, args.mails)
+        mailq = os.path.join(spool, "mailq.sample")
+        samples.write_mailq(mailq, args.mails)
+
+        pstore = store.PostqueueStore()
+        start = time.time()
+        pstore.load(method="postqueue", filename=mailq)
+        print("%-24s %8d mails  %8.3f s" % ("postqueue output file",
+                                           len(pstore.mails),
+                                           time.time() - start))
+
+        for parse in (False, True):
+            for workers in WORKERS:
+                pstore = store.PostqueueStore()
+                pstore.spool_path = spool
+                pstore.spool_workers = workers
+                start = time.time()
+                pstore.load(method="spool", parse=parse)
+                print("%-24s %8d mails  %8.3f s" % (
+                    "%s, %d threads" % ("headers" if parse else "envelope",
+                                        workers),
+                    len(pstore.mails), time.time() - start))
+    finally:
+        shutil.rmtree(spool)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of vectorized mails queue statistics.
+
+Compare wall time of store summaries and of date and size range lookups
+computed with Python loops over mails against the ones computed on
+:mod:`numpy` arrays, for both mails stores. Summaries only use arrays once
+exported, so lookups run first and their time includes the arrays export.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/bench_vectorized.py [-n MAILS]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from pymailq import store, columnar, selector
+
+import samples
+
+ROUNDS = 5
+
+
+def run(pstore, use_arrays):
+    """Summaries and range lookups of a store"""
+    pstore.use_arrays = use_arrays
+    pstore.touch()
+    pselector = selector.MailSelector(pstore)
+    start = time.time()
+    since = datetime.now() - timedelta(days=2)
+    lookups = []
+    for _ in range(ROUNDS):
+        pselector.reset()
+        lookups.append(pselector.lookup_size(smin=2000, smax=20000))
+        pselector.reset()
+        lookups.append(pselector.lookup_date(start=since))
+    lookups_time = (time.time() - start) / ROUNDS
+
+    start = time.time()
+    summary = pstore.summary()
+    # mails ages depend on the time of the summary
+    del summary['mails_by_age']
+    first = time.time() - start
+    start = time.time()
+    for _ in range(ROUNDS):
+        pstore.summary()
+    summaries = (time.time() - start) / ROUNDS
+    return summary, lookups, first, summaries, lookups_time
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--mails", type=int, default=200000,
+                        help="number of mails in sample (default: 200000)")
+    args = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp(prefix="pymailq-bench-")
+    os.close(fd)
+    try:
+        samples.write_mailq(filename, args.mails)
+        for store_class in (store.PostqueueStore,
+                            columnar.ColumnarPostqueueStore):
+            pstore = store_class()
+            pstore.load(method="file", filename=filename)
+            results = {}
+            for use_arrays in (False, True):
+                results[use_arrays] = run(pstore, use_arrays)
+                print("%-22s %-7s %8d mails  first %7.3f s  summary %7.3f s"
+                      "  lookups %7.3f s" % ((
+                          store_class.__name__,
+                          "arrays" if use_arrays else "python",
+                          len(pstore.mails)) + results[use_arrays][2:]))
+            assert results[True][:2] == results[False][:2]
+    finally:
+        os.unlink(filename)
+
+
+if __name__ == "__main__":
+    main()
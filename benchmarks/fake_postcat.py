@@ -0,0 +1,81 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Fake postcat command for benchmarks.
+
+Print postcat-like contents of synthetic mails for each queue ID given on
+command line, without the need of a real Postfix mails queue.
+
+Usage::
+
+    python benchmarks/fake_postcat.py -qv QUEUE_ID [QUEUE_ID ...]
+"""
+
+import sys
+import time
+
+HEADERS = 20
+
+
+def postcat(qid):
+    """Generate postcat output lines of a synthetic mail"""
+    date = time.strftime("%a %b %d %H:%M:%S %Y")
+    path = "deferred/%s/%s" % (qid[0], qid)
+    lines = [
+        "*** ENVELOPE RECORDS %s ***" % path,
+        "message_size:             263             186               1"
+        "               0             263",
+        "message_arrival_time: %s" % date,
+        "create_time: %s" % date,
+        "sender: sender@%s.tld" % qid.lower(),
+        "recipient: user@remote.org",
+        "*** MESSAGE CONTENTS %s ***" % path,
+        "regular_text: Received: by test.local (Postfix, from userid 0)",
+        "regular_text: \tid %s; %s +0200 (CEST)" % (qid, date),
+        "regular_text: From: Sender <sender@%s.tld>" % qid.lower(),
+        "regular_text: To: User <user@remote.org>",
+        "regular_text: Subject: Test email %s" % qid,
+    ]
+    lines += ["regular_text: X-Header-%d: value %d" % (idx, idx)
+              for idx in range(HEADERS)]
+    lines += [
+        "regular_text: ",
+        "regular_text: This is test.",
+        "*** HEADER EXTRACTED %s ***" % path,
+        "*** MESSAGE FILE END %s ***" % path,
+    ]
+    return lines
+
+
+def main():
+    """main function"""
+    output = []
+    for qid in sys.argv[1:]:
+        if qid.startswith("-"):
+            continue
+        output += postcat(qid)
+    sys.stdout.write("\n".join(output) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Synthetic mails queue samples for benchmarks.
+
+Generated samples mimic the output of a real Postfix mails queue: a few
+thousands of distinct senders, recipients and error messages repeated across
+every queued mails. Generation is seeded to produce the same samples on each
+run.
+"""
+
+import os
+import json
+import time
+import random
+from datetime import datetime, timedelta
+
+from pymailq.queuefile import write_record
+
+ERRORS = [
+    "connect to mx.remote%d.org[192.0.2.%d]:25: Connection timed out",
+    "host mx.remote%d.org[198.51.100.%d] said: 450 4.7.1 Try again later",
+    "mail transport unavailable",
+    "delivery temporarily suspended: lost connection with mx%d.remote.org"
+    "[203.0.113.%d] while receiving the initial server greeting",
+]
+STATUS_MARKS = ["", "", "", "", "", "", "*", "!"]
+
+
+def sample_mails(count, seed=42):
+    """
+    Generate synthetic mails informations.
+
+    :param int count: Number of mails to generate
+    :param int seed: Random generator seed
+    :return: Generator of mails informations as :func:`dict`
+    """
+    rand = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    senders = ["sender-%d@domain%d.tld" % (idx, rand.randint(1, 200))
+               for idx in range(3000)]
+    recipients_pool = ["user-%d@remote%d.org" % (idx, rand.randint(1, 300))
+                       for idx in range(5000)]
+    errors = []
+    for idx in range(2000):
+        error = rand.choice(ERRORS)
+        if "%d" in error:
+            error = error % (rand.randint(1, 300), rand.randint(1, 254))
+        errors.append(error)
+
+    for idx in range(count):
+        date = now - timedelta(seconds=rand.randint(60, 10 * 86400))
+        recipients = [rand.choice(recipients_pool)
+                      for _ in range(rand.randint(1, 3))]
+        error = rand.choice(errors)
+        yield {
+            'qid': "%012X" % (0x10000000000 + idx * 7919),
+            'mark': rand.choice(STATUS_MARKS),
+            'size': rand.randint(300, 2000000),
+            'date': date,
+            'sender': rand.choice(senders),
+            'recipients': recipients,
+            'error': error,
+        }
+
+
+def write_mailq(path, count, seed=42):
+    """
+    Write a synthetic mails queue in the Postfix mailq output format.
+
+    :param str path: Output file path
+    :param int count: Number of mails to generate
+    :param int seed: Random generator seed
+    """
+    with open(path, "w") as output:
+        output.write("-Queue ID-  --Size-- ----Arrival Time---- "
+                     "-Sender/Recipient-------\n")
+        for mail in sample_mails(count, seed):
+            output.write("%-12s %8d %s  %s\n" % (
+                mail['qid'] + mail['mark'], mail['size'],
+                mail['date'].strftime("%a %b %d %H:%M:%S"), mail['sender']))
+            if mail['mark'] != '*':
+                output.write("%50s(%s)\n" % ("", mail['error']))
+            for rcpt in mail['recipients']:
+                output.write("%41s%s\n" % ("", rcpt))
+            output.write("\n")
+        output.write("-- %d Kbytes in %d Requests.\n" % (count, count))
+
+
+def write_postqueue_json(path, count, seed=42):
+    """
+    Write a synthetic mails queue in the Postfix ``postqueue -j`` format.
+
+    :param str path: Output file path
+    :param int count: Number of mails to generate
+    :param int seed: Random generator seed
+    """
+    queues = {'': "deferred", '*': "active", '!': "hold"}
+    with open(path, "w") as output:
+        for mail in sample_mails(count, seed):
+            reason = mail['error'] if mail['mark'] != '*' else None
+            recipients = []
+            for rcpt in mail['recipients']:
+                recipient = {"address": rcpt}
+                if reason is not None:
+                    recipient["delay_reason"] = reason
+                recipients.append(recipient)
+            output.write(json.dumps({
+                "queue_name": queues[mail['mark']],
+                "queue_id": mail['qid'],
+                "arrival_time": int(time.mktime(mail['date'].timetuple())),
+                "message_size": mail['size'],
+                "forced_expire": False,
+                "sender": mail['sender'],
+                "recipients": recipients,
+            }) + "\n")
+
+
+def write_spool(path, count, seed=42):
+    """
+    Write a synthetic Postfix spool of queue files.
+
+    Queue files are written in the ``deferred``, ``active`` and ``hold``
+    directories, hashed on the first character of the queue ID. Recipients
+    are appended after the message content and reached with pointer records
+    like in real Postfix queue files.
+
+    :param str path: Spool directory path
+    :param int count: Number of mails to generate
+    :param int seed: Random generator seed
+    """
+    queues = {'': "deferred", '*': "active", '!': "hold"}
+    for mail in sample_mails(count, seed):
+        directory = os.path.join(path, queues[mail['mark']], mail['qid'][0])
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        content = [
+            "Received: by test.local (Postfix, from userid 0)",
+            "From: Sender <%s>" % (mail['sender'],),
+            "To: %s" % (", ".join(mail['recipients']),),
+            "Subject: Test email %s" % (mail['qid'],),
+            "Message-Id: <%s@test.local>" % (mail['qid'],),
+            "",
+            "This is test.",
+        ]
+        ctime = int(time.mktime(mail['date'].timetuple()))
+        with open(os.path.join(directory, mail['qid']), "wb") as stream:
+            write_record(stream, b"C", ("%15d %15d %15d %15d %15d" % (
+                mail['size'], 0, len(mail['recipients']), 0, 0)).encode())
+            write_record(stream, b"T", ("%d 0" % (ctime,)).encode())
+            write_record(stream, b"c", ("%d 0" % (ctime,)).encode())
+            write_record(stream, b"S", mail['sender'].encode())
+            pointer = stream.tell()
+            write_record(stream, b"p", ("%15d" % (0,)).encode())
+            message = stream.tell()
+            write_record(stream, b"M", b"")
+            for line in content:
+                write_record(stream, b"N", line.encode())
+            write_record(stream, b"X", b"")
+            write_record(stream, b"E", b"")
+            recipients = stream.tell()
+            for rcpt in mail['recipients']:
+                write_record(stream, b"R", rcpt.encode())
+            write_record(stream, b"p", ("%15d" % (message,)).encode())
+            stream.seek(pointer)
+            write_record(stream, b"p", ("%15d" % (recipients,)).encode())
@@ -38,11 +38,18 @@ VERSION = "0.9.0"
 #: Module configuration as :class:`dict`.
 CONFIG = {
     "core": {
-        "postfix_spool": "/var/spool/postfix"
+        "postfix_spool": "/var/spool/postfix",
+        "load_method": "postqueue",
+        "parse_workers": 1,
+        "max_parse_workers": 4,
+        "header_cache": "",
+        "hash_queue_depth": 1,
+        "hash_queue_names": ["deferred", "defer"]
     },
     "commands": {
         "use_sudo": False,
         "list_queue": ["mailq"],
+        "list_queue_json": ["postqueue", "-j"],
         "cat_message": ["postcat", "-qv"],
         "hold_message": ["postsuper", "-h"],
         "release_message": ["postsuper", "-H"],
@@ -105,6 +112,16 @@ def load_config(cfg_file):
     if "core" in cfg.sections():
         if cfg.has_option("core", "postfix_spool"):
             CONFIG["core"]["postfix_spool"] = cfg.get("core", "postfix_spool")
+        for key in ("load_method", "header_cache"):
+            if cfg.has_option("core", key):
+                CONFIG["core"][key] = cfg.get("core", key)
+        for key in ("parse_workers", "max_parse_workers",
+                    "hash_queue_depth"):
+            if cfg.has_option("core", key):
+                CONFIG["core"][key] = cfg.getint("core", key)
+        if cfg.has_option("core", "hash_queue_names"):
+            names = cfg.get("core", "hash_queue_names").replace(",", " ")
+            CONFIG["core"]["hash_queue_names"] = names.split()
 
     if "commands" in cfg.sections():
         for key in cfg.options("commands"):
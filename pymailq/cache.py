@@ -0,0 +1,175 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import time
+import sqlite3
+from datetime import datetime
+from pymailq import CONFIG, debug
+
+#: Opened :class:`~cache.HeaderCache` instances by database path.
+CACHES = {}
+
+
+def get_header_cache():
+    """
+    Get the parsed headers cache from configuration.
+
+    The cache database path is read from :attr:`pymailq.CONFIG` attribute
+    under the key 'header_cache' of the 'core' section. An empty path
+    disables the cache. A single :class:`~cache.HeaderCache` instance is
+    opened for each database path.
+
+    :return: :class:`~cache.HeaderCache` instance or ``None``
+    """
+    path = CONFIG['core'].get('header_cache')
+    if not path:
+        return None
+    if path not in CACHES:
+        CACHES[path] = HeaderCache(path)
+    return CACHES[path]
+
+
+class HeaderCache(object):
+    """
+    Persistent cache of mails parsed informations.
+
+    Parsed headers and the :attr:`~store.Mail.size`, :attr:`~store.Mail.date`
+    and :attr:`~store.Mail.sender` fields are stored in a :mod:`sqlite3`
+    database. Entries are keyed by mail ID and a stamp of the mail's queue
+    file, usually its inode and modification time. Cached informations are
+    used only if the stamp is unchanged.
+
+    Entries of mails no longer in queue are removed with
+    :meth:`~cache.HeaderCache.evict`, so the cache size follows the mails
+    queue size.
+
+    The :class:`~cache.HeaderCache` instance provides the following
+    attributes:
+
+        .. attribute:: path
+
+            Path of the :mod:`sqlite3` database :func:`str`.
+
+        .. attribute:: connection
+
+            :class:`sqlite3.Connection` object to the database.
+
+    .. seealso::
+
+        Python modules:
+            :mod:`sqlite3` -- DB-API 2.0 interface for SQLite databases
+    """
+
+    def __init__(self, path):
+        """Init method"""
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS mails ("
+            "qid TEXT PRIMARY KEY, inode INTEGER, mtime REAL, size INTEGER, "
+            "date REAL, sender TEXT, headers TEXT)")
+        self.connection.commit()
+
+    def get(self, mail, stamp):
+        """
+        Update mail with cached informations.
+
+        Like with mails parsing, fields :attr:`~store.Mail.size`,
+        :attr:`~store.Mail.date` and :attr:`~store.Mail.sender` are only set
+        if still unknown.
+
+        :param mail: :class:`~store.Mail` object to update
+        :param tuple stamp: Queue file inode and modification time
+        :return: ``True`` if mail was found in cache
+        :rtype: :func:`bool`
+        """
+        row = self.connection.execute(
+            "SELECT size, date, sender, headers FROM mails "
+            "WHERE qid = ? AND inode = ? AND mtime = ?",
+            (mail.qid,) + tuple(stamp)).fetchone()
+        if row is None:
+            return False
+
+        size, date, sender, headers = row
+        if mail.size == 0:
+            mail.size = size
+        if mail.date is None and date is not None:
+            mail.date = datetime.fromtimestamp(date)
+        if not len(mail.sender):
+            mail.sender = sender
+        head = mail.head
+        for mailheader, value in json.loads(headers).items():
+            setattr(head, mailheader, value)
+        mail.head = head
+        mail.parsed = True
+        return True
+
+    @debug
+    def set(self, mails):
+        """
+        Store parsed informations of several mails.
+
+        :param list mails: :class:`~store.Mail` objects and their queue file
+                           stamp as :func:`tuple`
+        """
+        rows = []
+        for mail, stamp in mails:
+            date = None
+            if mail.date is not None:
+                date = time.mktime(mail.date.timetuple())
+            rows.append((mail.qid,) + tuple(stamp) + (
+                mail.size, date, mail.sender, json.dumps(vars(mail.head))))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO mails VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.commit()
+
+    @debug
+    def evict(self, qids):
+        """
+        Remove entries of mails which are not in mails queue anymore.
+
+        :param list qids: Mails IDs currently in queue
+        :return: Number of removed entries
+        :rtype: :func:`int`
+        """
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS queued (qid TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM queued")
+        self.connection.executemany("INSERT OR IGNORE INTO queued VALUES (?)",
+                                    [(qid,) for qid in qids])
+        cursor = self.connection.execute(
+            "DELETE FROM mails WHERE qid NOT IN (SELECT qid FROM queued)")
+        self.connection.execute("DELETE FROM queued")
+        self.connection.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """
+        Close the database connection.
+
+        The instance is removed from opened caches, so next
+        :func:`~cache.get_header_cache` call opens the database again.
+        """
+        if CACHES.get(self.path) is self:
+            del CACHES[self.path]
+        self.connection.close()
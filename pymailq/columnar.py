@@ -0,0 +1,570 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+from array import array
+from datetime import datetime, timedelta
+from pymailq import debug
+from pymailq.store import PostqueueStore, Mail, MailHeaders
+
+try:
+    array('q')
+    INT64_TYPECODE = 'q'
+except ValueError:  # python 2 has no 'q' type code, 'l' is 64 bits on LP64
+    INT64_TYPECODE = 'l'
+
+#: Reference of mails dates, stored as seconds since this naive date.
+EPOCH = datetime(1970, 1, 1)
+
+#: Value stored for unknown mails dates.
+UNKNOWN_DATE = -1
+
+
+class StringTable(object):
+    """
+    Table of interned strings.
+
+    Each distinct string is stored once and identified by its integer
+    position in the table.
+
+    The :class:`~columnar.StringTable` instance provides the following
+    attributes:
+
+        .. attribute:: strings
+
+            Interned strings :func:`list`, indexed by their ID.
+
+        .. attribute:: ids
+
+            :class:`dict` of strings IDs by strings.
+    """
+
+    def __init__(self):
+        """Init method"""
+        self.strings = []
+        self.ids = {}
+
+    def __len__(self):
+        """Number of interned strings"""
+        return len(self.strings)
+
+    def __getitem__(self, string_id):
+        """Get string from its ID"""
+        return self.strings[string_id]
+
+    def intern(self, value):
+        """
+        Get the ID of a string, adding it to table if unknown.
+
+        :param str value: String to intern
+        :return: String ID
+        :rtype: :func:`int`
+        """
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[value] = string_id
+            self.strings.append(value)
+        return string_id
+
+
+class MailColumns(object):
+    """
+    Columnar storage of mails, used as a :func:`list` of mails.
+
+    Mails fields are stored in :class:`array.array` columns instead of one
+    :class:`~store.Mail` object per mail. Sizes and dates are stored as 64
+    bits integers, dates as seconds since :data:`~columnar.EPOCH`. Status
+    are stored as 8 bits codes, senders, recipients and errors as integer IDs
+    in a shared :class:`~columnar.StringTable`. Recipients and errors lists of
+    every mails are concatenated in a single column, with a column of
+    offsets to find each mail's ones.
+
+    :class:`~store.Mail` objects appended to columns are only converted on
+    next access to columns, allowing mails loaders to complete appended mails
+    like with a :func:`list`. Accessing a mail returns a
+    :class:`~columnar.MailView` flyweight object created on demand.
+
+    Parsed mails headers, parsing status and errors are kept per mail index
+    as they are only known for a few mails.
+
+    The :class:`~columnar.MailColumns` instance provides the following
+    attributes:
+
+        .. attribute:: qids
+
+            Mails IDs :func:`list`.
+
+        .. attribute:: sizes
+
+            Mails sizes :class:`array.array`.
+
+        .. attribute:: dates
+
+            Mails dates :class:`array.array`, as seconds since
+            :data:`~columnar.EPOCH` or :data:`~columnar.UNKNOWN_DATE`.
+
+        .. attribute:: statuses
+
+            Mails status codes :class:`array.array` in
+            :attr:`~MailColumns.status_table`.
+
+        .. attribute:: senders
+
+            Mails senders IDs :class:`array.array` in
+            :attr:`~MailColumns.strings`.
+
+        .. attribute:: recipients
+
+            Concatenated mails recipients IDs :class:`array.array` in
+            :attr:`~MailColumns.strings`.
+
+        .. attribute:: recipients_offsets
+
+            Offsets :class:`array.array` of each mail's recipients in
+            :attr:`~MailColumns.recipients`, with a last entry for the end of
+            the last mail's recipients.
+
+        .. attribute:: errors
+
+            Concatenated mails errors IDs :class:`array.array` in
+            :attr:`~MailColumns.strings`.
+
+        .. attribute:: errors_offsets
+
+            Offsets :class:`array.array` of each mail's errors in
+            :attr:`~MailColumns.errors`.
+
+        .. attribute:: strings
+
+            :class:`~columnar.StringTable` of senders, recipients and errors.
+
+        .. attribute:: status_table
+
+            :class:`~columnar.StringTable` of mails status.
+
+        .. attribute:: parsed
+
+            :class:`dict` of parsed mails status by mail index.
+
+        .. attribute:: parse_errors
+
+            :class:`dict` of mails parse errors by mail index.
+
+        .. attribute:: heads
+
+            :class:`dict` of mails :class:`~store.MailHeaders` by mail index.
+
+        .. attribute:: ViewClass
+
+            The class used to view mails stored in columns.
+            Default is :class:`~columnar.MailView`.
+    """
+
+    def __init__(self, mails=()):
+        """Init method"""
+        self.qids = []
+        self.sizes = array(INT64_TYPECODE)
+        self.dates = array(INT64_TYPECODE)
+        self.statuses = array('B')
+        self.senders = array('i')
+        self.recipients = array('i')
+        self.recipients_offsets = array(INT64_TYPECODE, [0])
+        self.errors = array('i')
+        self.errors_offsets = array(INT64_TYPECODE, [0])
+        self.strings = StringTable()
+        self.status_table = StringTable()
+        self.parsed = {}
+        self.parse_errors = {}
+        self.heads = {}
+        self._pending = None
+
+        self.extend(mails)
+
+    def __len__(self):
+        """Number of stored mails"""
+        self.flush()
+        return len(self.qids)
+
+    def __getitem__(self, index):
+        """Get mail view at index, or list of mails views for slices"""
+        self.flush()
+        if isinstance(index, slice):
+            return [self.ViewClass(self, position)
+                    for position in range(*index.indices(len(self.qids)))]
+        if index < 0:
+            index += len(self.qids)
+        if not 0 <= index < len(self.qids):
+            raise IndexError("mail index out of range")
+        return self.ViewClass(self, index)
+
+    def __iter__(self):
+        """Iterate over mails views"""
+        self.flush()
+        for index in range(len(self.qids)):
+            yield self.ViewClass(self, index)
+
+    def append(self, mail):
+        """
+        Append a mail to columns.
+
+        Mail is converted on next access to columns.
+
+        :param mail: :class:`~store.Mail` object to append
+        """
+        self.flush()
+        self._pending = mail
+
+    def extend(self, mails):
+        """
+        Append several mails to columns.
+
+        :param list mails: :class:`~store.Mail` objects to append
+        """
+        for mail in mails:
+            self.append(mail)
+
+    def flush(self):
+        """Convert the last appended mail to columns"""
+        mail = self._pending
+        if mail is None:
+            return
+        self._pending = None
+
+        index = len(self.qids)
+        self.qids.append(mail.qid)
+        self.sizes.append(mail.size)
+        self.dates.append(self.encode_date(mail.date))
+        self.statuses.append(self.status_table.intern(mail.status))
+        self.senders.append(self.strings.intern(mail.sender))
+        self.recipients.extend([self.strings.intern(recipient)
+                                for recipient in mail.recipients])
+        self.recipients_offsets.append(len(self.recipients))
+        self.errors.extend([self.strings.intern(error)
+                            for error in mail.errors])
+        self.errors_offsets.append(len(self.errors))
+        if mail.parsed:
+            self.parsed[index] = True
+            self.heads[index] = mail.head
+        if mail.parse_error:
+            self.parse_errors[index] = mail.parse_error
+
+    @staticmethod
+    def encode_date(date):
+        """
+        Convert a mail date to its stored value.
+
+        :param date: :class:`datetime.datetime` object or ``None``
+        :return: Seconds since :data:`~columnar.EPOCH`
+        :rtype: :func:`int`
+        """
+        if date is None:
+            return UNKNOWN_DATE
+        delta = date - EPOCH
+        return delta.days * 86400 + delta.seconds
+
+    @staticmethod
+    def decode_date(value):
+        """
+        Convert a stored mail date value to a date.
+
+        :param int value: Seconds since :data:`~columnar.EPOCH`
+        :return: :class:`datetime.datetime` object or ``None``
+        """
+        if value == UNKNOWN_DATE:
+            return None
+        return EPOCH + timedelta(seconds=value)
+
+    def copy_parsed(self, columns, source, index):
+        """
+        Copy parsing informations of a mail stored in other columns.
+
+        :param columns: Source :class:`~columnar.MailColumns` object
+        :param int source: Source mail index
+        :param int index: Destination mail index
+        """
+        if source in columns.parsed:
+            self.parsed[index] = columns.parsed[source]
+        if source in columns.heads:
+            self.heads[index] = columns.heads[source]
+        if source in columns.parse_errors:
+            self.parse_errors[index] = columns.parse_errors[source]
+
+
+class MailView(object):
+    """
+    Flyweight view of a mail stored in :class:`~columnar.MailColumns`.
+
+    Views are light proxies providing the :class:`~store.Mail` attributes and
+    methods, reading and writing fields in columns. As columns store
+    recipients and errors contiguously, :attr:`~store.Mail.recipients` and
+    :attr:`~store.Mail.errors` attributes are read only.
+    """
+    __slots__ = ('_columns', '_index')
+
+    # Mail methods only use mails attributes, they work the same on views
+    postcat_cmd = vars(Mail)['postcat_cmd']
+    show = vars(Mail)['show']
+    parse = vars(Mail)['parse']
+    queue_file_stamp = vars(Mail)['queue_file_stamp']
+    parse_queue_file = vars(Mail)['parse_queue_file']
+    dump = vars(Mail)['dump']
+    _parse_postcat_output = vars(Mail)['_parse_postcat_output']
+    _parse_content = vars(Mail)['_parse_content']
+    _merge_parsed = vars(Mail)['_merge_parsed']
+
+    def __init__(self, columns, index):
+        """Init method"""
+        self._columns = columns
+        self._index = index
+
+    def _get_columns(self):
+        """Get viewed columns, converting the last appended mail first"""
+        columns = self._columns
+        if columns._pending is not None:
+            columns.flush()
+        return columns
+
+    @property
+    def qid(self):
+        """Mail ID"""
+        return self._get_columns().qids[self._index]
+
+    @property
+    def size(self):
+        """Mail size"""
+        return self._get_columns().sizes[self._index]
+
+    @size.setter
+    def size(self, value):
+        self._get_columns().sizes[self._index] = int(value)
+
+    @property
+    def date(self):
+        """Mail date"""
+        columns = self._get_columns()
+        return columns.decode_date(columns.dates[self._index])
+
+    @date.setter
+    def date(self, value):
+        columns = self._get_columns()
+        columns.dates[self._index] = columns.encode_date(value)
+
+    @property
+    def status(self):
+        """Mail status"""
+        columns = self._get_columns()
+        return columns.status_table[columns.statuses[self._index]]
+
+    @status.setter
+    def status(self, value):
+        columns = self._get_columns()
+        columns.statuses[self._index] = columns.status_table.intern(value)
+
+    @property
+    def sender(self):
+        """Mail sender"""
+        columns = self._get_columns()
+        return columns.strings[columns.senders[self._index]]
+
+    @sender.setter
+    def sender(self, value):
+        columns = self._get_columns()
+        columns.senders[self._index] = columns.strings.intern(value)
+
+    @property
+    def recipients(self):
+        """Mail recipients"""
+        columns = self._get_columns()
+        offsets = columns.recipients_offsets
+        return [columns.strings[string_id] for string_id in
+                columns.recipients[offsets[self._index]:
+                                   offsets[self._index + 1]]]
+
+    @property
+    def errors(self):
+        """Mail errors"""
+        columns = self._get_columns()
+        offsets = columns.errors_offsets
+        return [columns.strings[string_id] for string_id in
+                columns.errors[offsets[self._index]:
+                               offsets[self._index + 1]]]
+
+    @property
+    def parsed(self):
+        """Mail parsing status"""
+        return self._get_columns().parsed.get(self._index, False)
+
+    @parsed.setter
+    def parsed(self, value):
+        self._get_columns().parsed[self._index] = value
+
+    @property
+    def parse_error(self):
+        """Mail parse error"""
+        return self._get_columns().parse_errors.get(self._index, "")
+
+    @parse_error.setter
+    def parse_error(self, value):
+        parse_errors = self._get_columns().parse_errors
+        if value:
+            parse_errors[self._index] = value
+        else:
+            parse_errors.pop(self._index, None)
+
+    @property
+    def head(self):
+        """
+        Mail headers. Unparsed mails get empty headers, which are not stored
+        in columns until set back to :attr:`~store.Mail.head`.
+        """
+        head = self._get_columns().heads.get(self._index)
+        if head is None:
+            head = MailHeaders()
+        return head
+
+    @head.setter
+    def head(self, value):
+        self._get_columns().heads[self._index] = value
+
+    def __eq__(self, other):
+        """Views of the same mail are equal"""
+        if isinstance(other, MailView):
+            return (self._columns is other._columns and
+                    self._index == other._index)
+        return NotImplemented
+
+    def __ne__(self, other):
+        """Views of different mails are not equal"""
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __hash__(self):
+        """Hash of viewed mail"""
+        return hash((id(self._columns), self._index))
+
+
+MailColumns.ViewClass = MailView
+
+
+class ColumnarPostqueueStore(PostqueueStore):
+    """
+    Postfix mails queue informations storage in columns.
+
+    This :class:`~store.PostqueueStore` stores mails in a
+    :class:`~columnar.MailColumns` object instead of a :func:`list` of
+    :class:`~store.Mail` objects, dividing memory usage of huge mails queues.
+    Mails are accessed through :class:`~columnar.MailView` objects, so
+    :class:`~selector.MailSelector` and the shell work the same way on both
+    stores.
+
+    The :class:`~columnar.ColumnarPostqueueStore` class defines the same
+    attributes than :class:`~store.PostqueueStore`, with the following
+    default value:
+
+        .. attribute:: MailListClass
+
+            Default is :class:`~columnar.MailColumns`.
+    """
+    MailListClass = MailColumns
+
+    def get_qids(self):
+        """
+        Get IDs of loaded mails, read from the mails IDs column.
+
+        :return: Mails IDs, in :attr:`~PostqueueStore.mails` order
+        :rtype: :func:`list`
+        """
+        self.mails.flush()
+        return self.mails.qids
+
+    @property
+    @debug
+    def known_headers(self):
+        """Return known headers from loaded mails
+
+        :return: headers as :func:`set`
+        """
+        headers = set()
+        for head in self.mails.heads.values():
+            for mailheader in dir(head):
+                if not mailheader.startswith("_"):
+                    headers.add(mailheader)
+        return headers
+
+    @debug
+    def reload(self, method=None, filename=None, parse=False):
+        """
+        Reload content from postfix mails queue, keeping parsed mails.
+
+        Mails queue is loaded again and compared to current content using
+        mails IDs. Parsed headers of mails still present in queue are kept.
+
+        :param str method: Method used to load mails from Postfix queue
+        :param str filename: File to load mails from
+        :param bool parse: Controls whether added mails are parsed or not.
+        :return: Added and removed mails IDs :func:`list` under the ``added``
+                 and ``removed`` keys of a :func:`dict`
+
+        .. seealso::
+
+            :meth:`store.PostqueueStore.reload`
+        """
+        generation = self.generation
+        columns = self.mails
+        columns.flush()
+        known_mails = dict((qid, index)
+                           for index, qid in enumerate(columns.qids))
+        positions = [-1] * len(known_mails)
+        self.load(method, filename, parse=False)
+        self.mails.flush()
+
+        added = []
+        changed = []
+        for index, qid in enumerate(self.mails.qids):
+            source = known_mails.pop(qid, None)
+            if source is None:
+                added.append(index)
+                changed.append(index)
+                continue
+            self.mails.copy_parsed(columns, source, index)
+            known_mail, mail = columns[source], self.mails[index]
+            if (known_mail.status == mail.status and
+                    known_mail.recipients == mail.recipients and
+                    known_mail.errors == mail.errors):
+                positions[source] = index
+            else:
+                changed.append(index)
+        self.updates = {
+            'generation': generation,
+            'positions': positions,
+            'changed': changed,
+        }
+
+        if parse and len(added):
+            self.parse_mails([self.mails[index] for index in added])
+
+        return {
+            'added': [self.mails.qids[index] for index in added],
+            'removed': sorted(known_mails),
+        }
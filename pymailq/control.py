@@ -95,15 +95,17 @@ class QueueControl(object):
         Operations can be one of Postfix known operations stored in
         PyMailq module configuration.
 
+        Messages are read once, before the command is run, so they can be
+        given by any iterable like a :class:`~selector.MailStream`.
+
         :param str operation: Known operation from :attr:`pymailq.CONFIG`.
-        :param list messages: List of :class:`~store.Mail` objects targetted
-                              for operation.
+        :param list messages: Iterable of :class:`~store.Mail` objects
+                              targetted for operation.
         :return: Command's *stderr* output lines
         :rtype: :func:`list`
         """
         # validate that object's attribute "qid" exist. Raise AttributeError.
-        for msg in messages:
-            getattr(msg, "qid")
+        qids = "".join([msg.qid + '\n' for msg in messages]).encode()
 
         # We may modify this part to improve security.
         # It should not be possible to inject commands, but who knows...
@@ -127,9 +129,7 @@ class QueueControl(object):
             raise RuntimeError(child.communicate()[1].strip().decode())
 
         try:
-            for msg in messages:
-                child.stdin.write((msg.qid+'\n').encode())
-            stderr = child.communicate()[1].strip()
+            stderr = child.communicate(qids)[1].strip()
         except BrokenPipeError:
             raise RuntimeError("Unexpected error: child process has crashed")
 
@@ -0,0 +1,536 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+from bisect import bisect_left, bisect_right
+from pymailq import debug
+
+#: Positions of set bits for each byte value
+BYTE_BITS = [tuple([bit for bit in range(8) if value >> bit & 1])
+             for value in range(256)]
+
+
+def mask_bytes(mask, size):
+    """
+    Get little-endian bytes of a positions bitmap.
+
+    :param int mask: Positions bitmap
+    :param int size: Number of positions in bitmap
+    :return: Bitmap bytes as :func:`bytearray`
+    """
+    length = (size + 7) // 8
+    try:
+        return bytearray(mask.to_bytes(length, "little"))
+    except AttributeError:
+        # python 2 long objects have no to_bytes method
+        data = binascii.unhexlify("%0*x" % (length * 2, mask))
+        return bytearray(data[::-1])
+
+
+def positions_mask(positions, size):
+    """
+    Get bitmap of positions.
+
+    :param list positions: Positions of bits to set
+    :param int size: Number of positions in bitmap
+    :return: Positions bitmap as :func:`int`
+    """
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    try:
+        return int.from_bytes(bytes(bits), "little")
+    except AttributeError:
+        return int(binascii.hexlify(bytes(bits[::-1])) or b"0", 16)
+
+
+def mask_positions(mask, size):
+    """
+    Get positions of set bits in a bitmap.
+
+    :param int mask: Positions bitmap
+    :param int size: Number of positions in bitmap
+    :return: Sorted positions :func:`list`
+    """
+    positions = []
+    for offset, value in enumerate(mask_bytes(mask, size)):
+        if value:
+            base = offset << 3
+            positions.extend([base + bit for bit in BYTE_BITS[value]])
+    return positions
+
+
+def iter_positions(mask, size):
+    """
+    Iterate over positions of set bits in a bitmap.
+
+    Positions are generated one by one, without building a positions list.
+
+    :param int mask: Positions bitmap
+    :param int size: Number of positions in bitmap
+    :return: Sorted positions generator
+    """
+    for offset, value in enumerate(mask_bytes(mask, size)):
+        if value:
+            base = offset << 3
+            for bit in BYTE_BITS[value]:
+                yield base + bit
+
+
+def mask_count(mask):
+    """
+    Count set bits in a bitmap.
+
+    :param int mask: Positions bitmap
+    :return: Number of set bits
+    """
+    return bin(mask).count("1")
+
+
+class NgramIndex(object):
+    """
+    N-gram index of distinct strings for substring searches.
+
+    Each string is split in overlapping n-grams of :attr:`size` characters.
+    A substring search intersects the lists of strings containing every
+    n-gram of the searched pattern, then verifies remaining candidates.
+    Patterns shorter than :attr:`size` are checked against every string.
+
+    The :class:`~index.NgramIndex` instance provides the following
+    attributes:
+
+        .. attribute:: size
+
+            Length of indexed n-grams. Default is ``3``.
+
+        .. attribute:: values
+
+            Indexed strings :func:`list`.
+
+        .. attribute:: ngrams
+
+            Sorted :attr:`values` positions :func:`list` by n-gram
+            :class:`dict`.
+    """
+
+    def __init__(self, values, size=3):
+        """Init method"""
+        self.size = size
+        self.values = list(values)
+        self.ngrams = {}
+        for position, value in enumerate(self.values):
+            for ngram in self.split(value):
+                positions = self.ngrams.get(ngram)
+                if positions is None:
+                    self.ngrams[ngram] = [position]
+                else:
+                    positions.append(position)
+
+    def split(self, value):
+        """
+        Get distinct n-grams of a string.
+
+        :param str value: String to split
+        :return: N-grams as :func:`set`
+        """
+        size = self.size
+        return set([value[idx:idx + size]
+                    for idx in range(len(value) - size + 1)])
+
+    def count_candidates(self, pattern):
+        """
+        Get an upper bound of the number of strings containing a pattern.
+
+        :param str pattern: Substring to search
+        :return: Number of strings containing the rarest n-gram of pattern
+        """
+        if len(pattern) < self.size:
+            return len(self.values)
+        return min([len(self.ngrams.get(ngram, ()))
+                    for ngram in self.split(pattern)])
+
+    def search(self, pattern):
+        """
+        Search strings containing a pattern.
+
+        :param str pattern: Substring to search
+        :return: Matching strings :func:`list`
+        """
+        if len(pattern) < self.size:
+            return [value for value in self.values if pattern in value]
+
+        postings = sorted([self.ngrams.get(ngram, [])
+                           for ngram in self.split(pattern)], key=len)
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(positions)
+
+        values = self.values
+        return [values[position] for position in sorted(candidates)
+                if pattern in values[position]]
+
+
+class StoreIndex(object):
+    """
+    Hash indexes of mails stored in a :class:`~store.PostqueueStore`.
+
+    Indexes associate a key, like a sender or a status, to positions of
+    matching mails in the store's :attr:`~store.PostqueueStore.mails`. Each
+    index is built on its first use and dropped when the store's
+    :attr:`~store.PostqueueStore.generation` changes, so indexes always
+    reflect the store content after a load or a reload.
+
+    Known indexes are:
+
+        - ``qid``: Mails by :attr:`~store.Mail.qid`
+        - ``sender``: Mails by :attr:`~store.Mail.sender`
+        - ``recipient``: Mails by :attr:`~store.Mail.recipients` entries
+        - ``sender_domain``: Mails by sender domain
+        - ``recipient_domain``: Mails by recipients domains
+        - ``status``: Mails by :attr:`~store.Mail.status`
+        - ``error``: Mails by :attr:`~store.Mail.errors` entries
+
+    Mails can also be ordered by ``date`` or ``size`` with sorted indexes
+    of mails positions, used for range lookups with :mod:`bisect`.
+
+    Substring searches of index keys are made with a
+    :class:`~index.NgramIndex` of each index distinct keys, built on the
+    first :meth:`~index.StoreIndex.search` call.
+
+    The :class:`~index.StoreIndex` instance provides the following
+    attributes:
+
+        .. attribute:: store
+
+            Indexed :class:`~store.PostqueueStore` object.
+
+        .. attribute:: generation
+
+            Store generation of built indexes.
+
+        .. attribute:: indexes
+
+            Built indexes :class:`dict` by name. Each index is a
+            :class:`dict` of mails positions :func:`list` by key.
+
+        .. attribute:: ngrams
+
+            Built :class:`~index.NgramIndex` objects :class:`dict` by index
+            name.
+
+        .. attribute:: sorts
+
+            Built sorted indexes :class:`dict` by attribute name. Each sorted
+            index is a :func:`tuple` of sorted attribute values and matching
+            mails positions :func:`list`.
+
+        .. attribute:: reversed_sorts
+
+            Built mails positions :func:`list` sorted in descending order
+            :class:`dict` by attribute name.
+
+        .. attribute:: sortable
+
+            Mail attributes :func:`tuple` with sorted indexes support.
+            Default is ``("date", "size")``.
+
+        .. attribute:: ngram_size
+
+            Length of n-grams used for substring searches. Default is ``3``.
+
+        .. attribute:: use_ngrams
+
+            Controls whether substring searches use n-gram indexes or check
+            every distinct key of an index. Default is ``True``.
+    """
+    sortable = ("date", "size")
+    ngram_size = 3
+    use_ngrams = True
+
+    def __init__(self, store):
+        """Init method"""
+        self.store = store
+        self.generation = None
+        self.indexes = {}
+        self.ngrams = {}
+        self.sorts = {}
+        self.reversed_sorts = {}
+
+    def keys_qid(self, mail):
+        """Index keys of a mail in the ``qid`` index"""
+        return (mail.qid,)
+
+    def keys_sender(self, mail):
+        """Index keys of a mail in the ``sender`` index"""
+        return (mail.sender,)
+
+    def keys_recipient(self, mail):
+        """Index keys of a mail in the ``recipient`` index"""
+        return set(mail.recipients)
+
+    def keys_sender_domain(self, mail):
+        """Index keys of a mail in the ``sender_domain`` index"""
+        domain = self.store.strings.domain(mail.sender)
+        return () if domain is None else (domain,)
+
+    def keys_recipient_domain(self, mail):
+        """Index keys of a mail in the ``recipient_domain`` index"""
+        domain = self.store.strings.domain
+        return set([domain(rcpt) for rcpt in mail.recipients]) - set([None])
+
+    def keys_status(self, mail):
+        """Index keys of a mail in the ``status`` index"""
+        return (mail.status,)
+
+    def keys_error(self, mail):
+        """Index keys of a mail in the ``error`` index"""
+        return set(mail.errors)
+
+    def check_generation(self):
+        """Drop built indexes if the store generation has changed"""
+        if self.generation != self.store.generation:
+            self.indexes = {}
+            self.ngrams = {}
+            self.sorts = {}
+            self.reversed_sorts = {}
+            self.generation = self.store.generation
+
+    @debug
+    def get(self, name):
+        """
+        Get an index, building it if needed.
+
+        :param str name: Index name
+        :return: Mails positions :func:`list` by key
+        :rtype: :class:`dict`
+
+        :raise AttributeError: Index is unknown
+        """
+        self.check_generation()
+        index = self.indexes.get(name)
+        if index is None:
+            get_keys = getattr(self, "keys_%s" % (name,))
+            index = {}
+            for position, mail in enumerate(self.store.mails):
+                for key in get_keys(mail):
+                    positions = index.get(key)
+                    if positions is None:
+                        index[key] = [position]
+                    else:
+                        positions.append(position)
+            self.indexes[name] = index
+        return index
+
+    def positions(self, name, keys):
+        """
+        Get positions of mails matching any of the keys in an index.
+
+        :param str name: Index name
+        :param list keys: Keys to lookup
+        :return: Sorted mails positions
+        :rtype: :func:`list`
+        """
+        index = self.get(name)
+        if not len(keys):
+            return []
+        if len(keys) == 1:
+            return index.get(keys[0], [])
+        positions = set()
+        for key in keys:
+            positions.update(index.get(key, []))
+        return sorted(positions)
+
+    def lookup(self, name, keys):
+        """
+        Get mails matching any of the keys in an index.
+
+        Mails are returned in store order.
+
+        :param str name: Index name
+        :param list keys: Keys to lookup
+        :return: Matching mails
+        :rtype: :func:`list`
+        """
+        mails = self.store.mails
+        return [mails[position] for position in self.positions(name, keys)]
+
+    @debug
+    def search(self, name, pattern):
+        """
+        Search keys of an index containing a pattern.
+
+        :param str name: Index name
+        :param str pattern: Substring to search in index keys
+        :return: Matching keys
+        :rtype: :func:`list`
+        """
+        if not self.use_ngrams:
+            return [key for key in self.get(name) if pattern in key]
+        return self.get_ngrams(name).search(pattern)
+
+    @debug
+    def get_ngrams(self, name):
+        """
+        Get the n-gram index of an index keys, building it if needed.
+
+        :param str name: Index name
+        :return: :class:`~index.NgramIndex` of index keys
+        """
+        index = self.get(name)
+        ngrams = self.ngrams.get(name)
+        if ngrams is None:
+            ngrams = NgramIndex(index, self.ngram_size)
+            self.ngrams[name] = ngrams
+        return ngrams
+
+    @debug
+    def get_sorted(self, name):
+        """
+        Get a sorted index, building it if needed.
+
+        :param str name: Mail attribute name, from :attr:`sortable`
+        :return: Sorted attribute values and mails positions :func:`list`
+                 as a :func:`tuple`
+
+        :raise AttributeError: Attribute is not sortable
+        """
+        if name not in self.sortable:
+            raise AttributeError("no sorted index for %s" % (name,))
+
+        self.check_generation()
+        sort = self.sorts.get(name)
+        if sort is None:
+            values = [getattr(mail, name) for mail in self.store.mails]
+            positions = sorted(range(len(values)), key=values.__getitem__)
+            sort = ([values[position] for position in positions], positions)
+            self.sorts[name] = sort
+        return sort
+
+    def sorted_positions(self, name, reverse=False):
+        """
+        Get mails positions sorted by an attribute.
+
+        Sorting is stable in both orders: mails with equal values are kept
+        in store order, like with :func:`sorted`.
+
+        :param str name: Mail attribute name, from :attr:`sortable`
+        :param bool reverse: Sort in descending order
+        :return: Mails positions
+        :rtype: :func:`list`
+        """
+        values, positions = self.get_sorted(name)
+        if not reverse:
+            return positions
+
+        reversed_positions = self.reversed_sorts.get(name)
+        if reversed_positions is None:
+            ordered = [None] * len(values)
+            for value, position in zip(values, positions):
+                ordered[position] = value
+            reversed_positions = sorted(range(len(ordered)),
+                                        key=ordered.__getitem__,
+                                        reverse=True)
+            self.reversed_sorts[name] = reversed_positions
+        return reversed_positions
+
+    def get_arrays(self, name):
+        """
+        Get store arrays used for range lookups of an attribute.
+
+        Range lookups use boolean masks over the store's
+        :class:`~vectorized.MailArrays` instead of a sorted index, unless
+        the sorted index is already built.
+
+        :param str name: Mail attribute name, from :attr:`sortable`
+        :return: :class:`~vectorized.MailArrays` object or ``None``
+
+        :raise AttributeError: Attribute is not sortable
+        """
+        if name not in self.sortable:
+            raise AttributeError("no sorted index for %s" % (name,))
+
+        self.check_generation()
+        if name in self.sorts:
+            return None
+        return self.store.get_arrays()
+
+    def count_between(self, name, low=None, high=None):
+        """
+        Count mails with an attribute value in a range.
+
+        :param str name: Mail attribute name, from :attr:`sortable`
+        :param low: Minimum value, included. Ignored if ``None``
+        :param high: Maximum value, included. Ignored if ``None``
+        :return: Number of mails
+        :rtype: :func:`int`
+        """
+        arrays = self.get_arrays(name)
+        if arrays is not None:
+            return int(arrays.range_mask(name, low, high).sum())
+
+        values = self.get_sorted(name)[0]
+        start = 0 if low is None else bisect_left(values, low)
+        stop = len(values) if high is None else bisect_right(values, high)
+        return max(0, stop - start)
+
+    def between(self, name, low=None, high=None):
+        """
+        Get positions of mails with an attribute value in a range.
+
+        :param str name: Mail attribute name, from :attr:`sortable`
+        :param low: Minimum value, included. Ignored if ``None``
+        :param high: Maximum value, included. Ignored if ``None``
+        :return: Sorted mails positions
+        :rtype: :func:`list`
+        """
+        arrays = self.get_arrays(name)
+        if arrays is not None:
+            return arrays.positions(arrays.range_mask(name, low, high))
+
+        values, positions = self.get_sorted(name)
+        start = 0 if low is None else bisect_left(values, low)
+        stop = len(values) if high is None else bisect_right(values, high)
+        return sorted(positions[start:stop])
+
+    def count_search(self, name, pattern):
+        """
+        Estimate the number of mails with index keys containing a pattern.
+
+        The estimate is the number of keys which may contain the pattern,
+        according to n-gram indexes, times the average number of mails per
+        key. Every key is supposed to match when n-grams are not used.
+
+        :param str name: Index name
+        :param str pattern: Substring to search in index keys
+        :return: Estimated number of mails
+        :rtype: :func:`int`
+        """
+        index = self.get(name)
+        if not len(index):
+            return 0
+
+        candidates = len(index)
+        if self.use_ngrams:
+            candidates = self.get_ngrams(name).count_candidates(pattern)
+        mails = len(self.store.mails)
+        return min(mails, -(-candidates * mails // len(index)))
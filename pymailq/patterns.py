@@ -0,0 +1,195 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import re
+from collections import Counter, deque
+
+#: Variable parts of error messages replaced in error templates
+TEMPLATE_RE = re.compile(
+    r"(?P<ipv4>\b\d{1,3}(?:\.\d{1,3}){3}\b)"
+    r"|(?P<ipv6>(?<!\w)(?=[0-9A-Fa-f:]*(?:[A-Fa-f]|::))"
+    r"(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{1,4}\b)"
+    r"|(?P<qid>\b(?=[0-9A-F]*[A-F])(?=[A-F]*[0-9])[0-9A-F]{8,12}\b"
+    r"|\b(?=[0-9B-DF-HJ-NP-TV-Zb-df-hj-np-tv-z]*[0-9])"
+    r"[0-9B-DF-HJ-NP-TV-Zb-df-hj-np-tv-z]{11,16}\b)"
+    r"|(?P<code>\b[245]\.\d{1,3}\.\d{1,3}\b|\b[245]\d\d(?=[ -][245]\.)"
+    r"|(?:^|(?<=: ))[245]\d\d(?=[ -]|$))"
+    r"|(?P<number>\d+)")
+
+
+def error_template(error):
+    """
+    Get template of an error message.
+
+    IP addresses, queue IDs and numbers of the error message are replaced
+    with ``<ip>``, ``<qid>`` and ``<n>`` placeholders, so errors only
+    differing by those parts share the same template. SMTP reply codes,
+    followed by an enhanced status code or found at the start of the
+    message or of a remote server reply, and enhanced status codes are
+    kept::
+
+        >>> error_template("connect to mx.remote12.org[192.0.2.5]:25: "
+        ...                "Connection timed out")
+        'connect to mx.remote<n>.org[<ip>]:<n>: Connection timed out'
+        >>> error_template("host mx[198.51.100.7] said: 450 4.7.1 Busy")
+        'host mx[<ip>] said: 450 4.7.1 Busy'
+        >>> error_template("host mx[203.0.113.9] said: 550 User unknown")
+        'host mx[<ip>] said: 550 User unknown'
+
+    :param str error: Error message
+    :return: Error template
+    :rtype: :func:`str`
+    """
+    return TEMPLATE_RE.sub(_template_part, error)
+
+
+def _template_part(match):
+    """Get placeholder of a variable part of error message"""
+    kind = match.lastgroup
+    if kind == "code":
+        return match.group(0)
+    if kind == "number":
+        return "<n>"
+    if kind == "qid":
+        return "<qid>"
+    return "<ip>"
+
+
+def count_templates(errors):
+    """
+    Count error messages by template.
+
+    :param dict errors: Error messages counts, as a
+                        :class:`collections.Counter`
+    :return: Error templates counts
+    :rtype: :class:`collections.Counter`
+    """
+    templates = Counter()
+    for error, count in errors.items():
+        templates[error_template(error)] += count
+    return templates
+
+
+class PatternMatcher(object):
+    """
+    Multiple patterns matcher.
+
+    Patterns are searched at once in texts with an `Aho-Corasick`_
+    automaton built on matcher initialization, so the cost of a search
+    only depends on the text length and not on the number of patterns.
+
+    The :class:`~patterns.PatternMatcher` instance provides the following
+    attributes:
+
+        .. attribute:: patterns
+
+            Searched patterns :func:`list`.
+
+        .. attribute:: transitions
+
+            Automaton states :func:`list`. Each state is a :class:`dict` of
+            next states by character.
+
+        .. attribute:: fallbacks
+
+            Failure state :func:`list`, by state. Failure state of a state
+            is the state of its longest suffix in automaton.
+
+        .. attribute:: outputs
+
+            :func:`list` of indexes of patterns matched in each state.
+
+    .. _Aho-Corasick:
+        https://en.wikipedia.org/wiki/Aho%E2%80%93Corasick_algorithm
+    """
+
+    def __init__(self, patterns):
+        """Init method"""
+        self.patterns = list(patterns)
+        self.transitions = [{}]
+        self.fallbacks = [0]
+        self.outputs = [[]]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions.append({})
+                    self.fallbacks.append(0)
+                    self.outputs.append([])
+                    self.transitions[state][char] = next_state
+                state = next_state
+            self.outputs[state].append(index)
+
+        # failure states are set in breadth-first order of states
+        states = deque(self.transitions[0].values())
+        while len(states):
+            state = states.popleft()
+            for char, next_state in self.transitions[state].items():
+                states.append(next_state)
+                fallback = self.fallbacks[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                fallback = self.transitions[fallback].get(char, 0)
+                self.fallbacks[next_state] = fallback
+                self.outputs[next_state] = (self.outputs[next_state] +
+                                            self.outputs[fallback])
+
+    def search(self, text):
+        """
+        Search patterns in text.
+
+        :param str text: Text to search patterns in
+        :return: Sorted indexes of found patterns in
+                 :attr:`~PatternMatcher.patterns`
+        :rtype: :func:`list`
+        """
+        transitions = self.transitions
+        fallbacks = self.fallbacks
+        outputs = self.outputs
+        found = set(outputs[0])
+        state = 0
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fallbacks[state]
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return sorted(found)
+
+    def classify(self, texts):
+        """
+        Classify texts by found patterns.
+
+        Each distinct text is searched only once.
+
+        :param list texts: Texts to classify
+        :return: :func:`list` of texts containing each pattern, by pattern
+                 index in :attr:`~PatternMatcher.patterns`
+        :rtype: :func:`list`
+        """
+        classes = [[] for _ in self.patterns]
+        for text in set(texts):
+            for index in self.search(text):
+                classes[index].append(text)
+        return classes
@@ -0,0 +1,414 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+
+from datetime import datetime, timedelta
+from pymailq.index import positions_mask
+
+
+class Query(object):
+    """
+    Base class of query expressions.
+
+    Query expressions are evaluated by a :class:`~selector.MailSelector`
+    over every mail of its store. Each expression computes a bitmap of
+    matching mails positions, see :attr:`~selector.MailSelector.mask`.
+    Expressions are combined with the ``&``, ``|`` and ``~`` operators::
+
+        query = (Match("status", ["deferred"]) &
+                 (Match("sender_domain", "example.com") |
+                  Match("recipient_domain", "example.org")) &
+                 ~Match("error", "Connection timed out"))
+        selector.lookup_query(query)
+    """
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def mask(self, selector):
+        """
+        Evaluate expression over the store of a selector.
+
+        :param selector.MailSelector selector: Selector to evaluate with
+        :return: Bitmap of matching mails positions as :func:`int`
+        """
+        raise NotImplementedError
+
+    def estimate(self, selector):
+        """
+        Estimate number of store mails matching expression.
+
+        :param selector.MailSelector selector: Selector to estimate with
+        :return: Estimated number of mails
+        """
+        raise NotImplementedError
+
+
+class Match(Query):
+    """
+    Query predicate using a selector ``match_*`` method.
+
+    :param str name: Predicate name, used to find the
+                     *selector.match_<name>* method
+    :param args: Arguments passed to the method
+    :param kwargs: Keyword arguments passed to the method
+    """
+
+    def __init__(self, name, *args, **kwargs):
+        """Init method"""
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        args = [repr(arg) for arg in self.args]
+        args += ["%s=%r" % (key, self.kwargs[key])
+                 for key in sorted(self.kwargs)]
+        return "%s(%s)" % (self.name, ", ".join(args))
+
+    def mask(self, selector):
+        positions = getattr(selector, "match_%s" % (self.name,))(
+            *self.args, **self.kwargs)
+        return positions_mask(positions, len(selector.store.mails))
+
+    def estimate(self, selector):
+        return selector.estimate(self.name, self.args, self.kwargs)
+
+
+class And(Query):
+    """
+    Query matching mails matched by every operand.
+
+    Operands are evaluated from the most selective one, according to their
+    estimates, and evaluation stops as soon as no mail matches.
+    """
+
+    def __init__(self, *operands):
+        """Init method"""
+        self.operands = operands
+
+    def __str__(self):
+        return "(%s)" % (" and ".join([str(op) for op in self.operands]),)
+
+    def mask(self, selector):
+        operands = sorted([(operand.estimate(selector), idx, operand)
+                           for idx, operand in enumerate(self.operands)])
+        mask = (1 << len(selector.store.mails)) - 1
+        for _, _, operand in operands:
+            mask &= operand.mask(selector)
+            if not mask:
+                break
+        return mask
+
+    def estimate(self, selector):
+        return min([operand.estimate(selector) for operand in self.operands])
+
+
+class Or(Query):
+    """Query matching mails matched by any operand"""
+
+    def __init__(self, *operands):
+        """Init method"""
+        self.operands = operands
+
+    def __str__(self):
+        return "(%s)" % (" or ".join([str(op) for op in self.operands]),)
+
+    def mask(self, selector):
+        mask = 0
+        for operand in self.operands:
+            mask |= operand.mask(selector)
+        return mask
+
+    def estimate(self, selector):
+        return min(len(selector.store.mails),
+                   sum([operand.estimate(selector)
+                        for operand in self.operands]))
+
+
+class Not(Query):
+    """Query matching mails not matched by its operand"""
+
+    def __init__(self, operand):
+        """Init method"""
+        self.operand = operand
+
+    def __str__(self):
+        return "not %s" % (self.operand,)
+
+    def mask(self, selector):
+        full = (1 << len(selector.store.mails)) - 1
+        return full & ~self.operand.mask(selector)
+
+    def estimate(self, selector):
+        return len(selector.store.mails) - self.operand.estimate(selector)
+
+
+def parse_size_spec(size_a, size_b=None):
+    """
+    Parse size specifications.
+
+    Sizes are prefixed with ``-`` (lesser than) or ``+`` (greater than),
+    a size without prefix is an exact size and must be used alone.
+
+    :param str size_a: Size specification
+    :param str size_b: Optionnal second size specification
+    :return: Minimum and maximum sizes :func:`tuple`, ``0`` if unbounded
+
+    :raise SyntaxError: Invalid size specifications
+    """
+    smin = None
+    smax = None
+    exact = None
+    try:
+        for size in size_a, size_b:
+            if size is None:
+                continue
+            if exact is not None:
+                raise SyntaxError("exact size must be used alone")
+            if size.startswith("-"):
+                if smax is not None:
+                    raise SyntaxError("multiple max sizes specified")
+                smax = int(size[1:])
+            elif size.startswith("+"):
+                if smin is not None:
+                    raise SyntaxError("multiple min sizes specified")
+                smin = int(size[1:])
+            else:
+                exact = int(size)
+    except ValueError:
+        raise SyntaxError("specified sizes must be valid numbers")
+
+    if exact is not None:
+        smin = exact
+        smax = exact
+    if smax is None:
+        smax = 0
+    if smin is None:
+        smin = 0
+
+    if smin > smax > 0:
+        raise SyntaxError("minimum size is greater than maximum size")
+    return smin, smax
+
+
+def parse_date_spec(date_spec):
+    """
+    Parse a date specification.
+
+    Known specifications are ``YYYY-MM-DD`` (exact date),
+    ``YYYY-MM-DD..YYYY-MM-DD`` (within a date range, included),
+    ``+YYYY-MM-DD`` (after a date, included) and ``-YYYY-MM-DD`` (before a
+    date, included).
+
+    :param str date_spec: Date specification
+    :return: Start and stop :class:`datetime.datetime` :func:`tuple`
+
+    :raise SyntaxError: Invalid date specification
+    """
+    try:
+        if ".." in date_spec:
+            (str_start, str_stop) = date_spec.split("..", 1)
+            start = datetime.strptime(str_start, "%Y-%m-%d")
+            stop = datetime.strptime(str_stop, "%Y-%m-%d")
+        elif date_spec.startswith("+"):
+            start = datetime.strptime(date_spec[1:], "%Y-%m-%d")
+            stop = datetime.now()
+        elif date_spec.startswith("-"):
+            start = datetime(1970, 1, 1)
+            stop = datetime.strptime(date_spec[1:], "%Y-%m-%d")
+        else:
+            start = datetime.strptime(date_spec, "%Y-%m-%d")
+            stop = start + timedelta(1)
+    except ValueError as exc:
+        raise SyntaxError(str(exc))
+    return start, stop
+
+
+class QueryParser(object):
+    """
+    Parser of query expressions from words.
+
+    Expressions are made of predicates combined with ``and``, ``or`` and
+    ``not`` operators and grouped with parentheses, which must be separate
+    words. ``not`` binds tighter than ``and``, which binds tighter than
+    ``or``. Example::
+
+        status deferred and ( sender_domain example.com or
+        recipient_domain example.org ) and not error "timed out"
+
+    Known predicates are::
+
+        qids <qid>[,<qid>,...]
+        status <status>
+        sender <sender> [exact]
+        recipient <recipient> [exact]
+        sender_domain <domain>
+        recipient_domain <domain>
+        error <error_msg>
+        size <-n|n|+n>
+        date <datespec>
+
+    Like with shell ``select`` commands, sender and recipient lookups are
+    partial unless followed by ``exact``.
+    """
+    operators = ("and", "or", "not", "(", ")")
+
+    def __init__(self, words):
+        """Init method"""
+        self.words = list(words)
+        self.index = 0
+
+    def peek(self):
+        """Get next word without consuming it, ``None`` at end"""
+        if self.index < len(self.words):
+            return self.words[self.index]
+        return None
+
+    def next(self, expected="a word"):
+        """
+        Consume next word.
+
+        :raise SyntaxError: No word left
+        """
+        word = self.peek()
+        if word is None:
+            raise SyntaxError("unexpected end of query, %s expected" % (
+                expected,))
+        self.index += 1
+        return word
+
+    def parse(self):
+        """
+        Parse words as a query.
+
+        :return: :class:`~query.Query` expression
+
+        :raise SyntaxError: Invalid query
+        """
+        if not len(self.words):
+            raise SyntaxError("empty query")
+        query = self.parse_or()
+        if self.peek() is not None:
+            raise SyntaxError("unexpected word: %s" % (self.peek(),))
+        return query
+
+    def parse_or(self):
+        """Parse ``or`` operands"""
+        operands = [self.parse_and()]
+        while self.peek() == "or":
+            self.next()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(*operands)
+
+    def parse_and(self):
+        """Parse ``and`` operands"""
+        operands = [self.parse_not()]
+        while self.peek() == "and":
+            self.next()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else And(*operands)
+
+    def parse_not(self):
+        """Parse ``not`` operators, groups and predicates"""
+        word = self.next("a predicate")
+        if word == "not":
+            return Not(self.parse_not())
+        if word == "(":
+            query = self.parse_or()
+            if self.next("')'") != ")":
+                raise SyntaxError("')' expected")
+            return query
+
+        parser = getattr(self, "parse_%s" % (word,), None)
+        if word in self.operators or parser is None:
+            raise SyntaxError("unknown predicate: %s" % (word,))
+        return parser()
+
+    def value(self):
+        """Consume a predicate value"""
+        word = self.next("a value")
+        if word in self.operators:
+            raise SyntaxError("value expected, got: %s" % (word,))
+        return word
+
+    def exact(self):
+        """Consume an optionnal ``exact`` keyword"""
+        if self.peek() == "exact":
+            self.next()
+            return True
+        return False
+
+    def parse_qids(self):
+        """Parse ``qids`` predicate"""
+        return Match("qids", self.value().split(","))
+
+    def parse_status(self):
+        """Parse ``status`` predicate"""
+        return Match("status", [self.value()])
+
+    def parse_sender(self):
+        """Parse ``sender`` predicate"""
+        sender = self.value()
+        return Match("sender", sender, exact=self.exact())
+
+    def parse_recipient(self):
+        """Parse ``recipient`` predicate"""
+        recipient = self.value()
+        return Match("recipient", recipient, exact=self.exact())
+
+    def parse_sender_domain(self):
+        """Parse ``sender_domain`` predicate"""
+        return Match("sender_domain", self.value())
+
+    def parse_recipient_domain(self):
+        """Parse ``recipient_domain`` predicate"""
+        return Match("recipient_domain", self.value())
+
+    def parse_error(self):
+        """Parse ``error`` predicate"""
+        return Match("error", self.value())
+
+    def parse_size(self):
+        """Parse ``size`` predicate"""
+        return Match("size", *parse_size_spec(self.value()))
+
+    def parse_date(self):
+        """Parse ``date`` predicate"""
+        return Match("date", *parse_date_spec(self.value()))
+
+
+def parse_query(words):
+    """
+    Parse a query expression.
+
+    :param list words: Query words, see :class:`~query.QueryParser`
+    :return: :class:`~query.Query` expression
+
+    :raise SyntaxError: Invalid query
+    """
+    return QueryParser(words).parse()
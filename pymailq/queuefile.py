@@ -0,0 +1,340 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+import os
+from datetime import datetime
+from pymailq import debug
+
+#: Alphabet of the time fields of Postfix long queue IDs, in digits order
+LONG_ID_ALPHABET = "0123456789BCDFGHJKLMNPQRSTVWXYZbcdfghjklmnpqrstvwxyz"
+
+
+def queue_id_hash(queue_id):
+    """
+    Get hashed part of a Postfix queue ID.
+
+    Postfix hashed queue directories are named after the first characters
+    of the hashed part of queue IDs. Regular queue IDs start with the
+    hexadecimal microseconds of the queue file creation time and are hashed
+    as is. For long queue IDs, the microseconds field preceding the ``z``
+    separator is decoded and formatted as hexadecimal, like regular queue
+    IDs.
+
+    :param str queue_id: Postfix queue ID
+    :return: Hashed part of queue ID
+    :rtype: :func:`str`
+    """
+    separator = queue_id.rfind("z")
+    if separator < 10:
+        return queue_id
+
+    usec = 0
+    for char in queue_id[separator - 4:separator]:
+        usec = usec * len(LONG_ID_ALPHABET) + LONG_ID_ALPHABET.index(char)
+    return "%05X" % (usec,)
+
+
+def queue_id_directories(queue_id, depth):
+    """
+    Get hashed subdirectories of a queue file.
+
+    :param str queue_id: Postfix queue ID
+    :param int depth: Number of hashed subdirectories levels
+    :return: Subdirectories names, one character each
+    :rtype: :func:`list`
+    """
+    hashed = queue_id_hash(queue_id)
+    return [hashed[level] if level < len(hashed) else "_"
+            for level in range(depth)]
+
+
+def queue_file_path(spool_path, queue_name, queue_id, depth=1,
+                    hash_names=("deferred", "defer")):
+    """
+    Get path of a queue file in a Postfix spool.
+
+    Queue files of queues listed in ``hash_names`` are stored in ``depth``
+    levels of hashed subdirectories, see
+    :func:`~queuefile.queue_id_directories`.
+
+    :param str spool_path: Postfix spool path
+    :param str queue_name: Postfix queue name, like ``deferred``
+    :param str queue_id: Postfix queue ID
+    :param int depth: Number of hashed subdirectories levels
+    :param list hash_names: Names of hashed Postfix queues
+    :return: Queue file path
+    :rtype: :func:`str`
+    """
+    path = [spool_path, queue_name]
+    if queue_name in hash_names:
+        path += queue_id_directories(queue_id, depth)
+    return os.path.join(*(path + [queue_id]))
+
+
+class QueueFile(object):
+    """
+    Postfix queue file reader.
+
+    Postfix queue files are sequences of records made of a record type byte,
+    a payload length and the payload itself. The payload length is encoded on
+    a variable number of bytes, 7 bits per byte starting with the lowest
+    bits, with the highest bit set when more bytes follow. Records of type
+    ``p`` are pointers to the offset of the next record to read.
+
+    Records are decoded with no call to any Postfix command, so a copy of the
+    Postfix spool can be read on a system without Postfix.
+
+    The :class:`~queuefile.QueueFile` instance provides the following
+    attributes:
+
+        .. attribute:: path
+
+            Path of the queue file :func:`str`.
+
+        .. attribute:: size
+
+            Message content size in bytes as written in the size record.
+            Expected type is :func:`int`.
+
+        .. attribute:: date
+
+            :class:`~datetime.datetime` object of message creation date and
+            time, or arrival date and time for older queue files.
+
+        .. attribute:: sender
+
+            Envelope sender :func:`str`.
+
+        .. attribute:: recipients
+
+            Envelope recipients :func:`list` still to be delivered.
+
+        .. attribute:: content
+
+            Message content lines :func:`list`, headers and body.
+
+        .. attribute:: max_pointers
+
+            Maximum number of pointer records followed in a single file before
+            considering it corrupted. Default is ``1024``
+
+        .. attribute:: modes
+
+            Known reading modes :func:`tuple` of the
+            :meth:`~queuefile.QueueFile.load` method.
+
+    .. seealso::
+
+        Postfix source code:
+            `rec_type.h`_ -- Postfix record types
+    """
+    REC_TYPE_SIZE = b"C"
+    REC_TYPE_TIME = b"T"
+    REC_TYPE_CTIME = b"c"
+    REC_TYPE_FROM = b"S"
+    REC_TYPE_RCPT = b"R"
+    REC_TYPE_MESG = b"M"
+    REC_TYPE_XTRA = b"X"
+    REC_TYPE_END = b"E"
+    REC_TYPE_NORM = b"N"
+    REC_TYPE_CONT = b"L"
+    REC_TYPE_PTR = b"p"
+
+    max_pointers = 1024
+    modes = ("envelope", "headers", "full")
+
+    def __init__(self, path):
+        """Init method"""
+        self.path = path
+        self.size = 0
+        self.date = None
+        self.sender = ""
+        self.recipients = []
+        self.content = []
+
+    @staticmethod
+    def read_record(stream):
+        """
+        Read a single record from a queue file.
+
+        :param stream: File object opened in binary mode
+        :return: Record type and payload as :func:`bytes` :func:`tuple`, or
+                 ``None`` at the end of file.
+
+        :raise ValueError: Record is truncated
+        """
+        rectype = stream.read(1)
+        if not len(rectype):
+            return None
+
+        length = 0
+        shift = 0
+        while True:
+            byte = stream.read(1)
+            if not len(byte):
+                raise ValueError("truncated record length")
+            byte = ord(byte)
+            length |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                break
+            shift += 7
+            if shift > 56:
+                raise ValueError("invalid record length")
+
+        payload = stream.read(length)
+        if len(payload) != length:
+            raise ValueError("truncated record payload")
+        return rectype, payload
+
+    def records(self, stream):
+        """
+        Iterate over queue file records, following pointer records.
+
+        Pointers to offset ``0`` are unused placeholders and are ignored.
+
+        :param stream: File object opened in binary mode
+        :return: Generator of record type and payload :func:`tuple`
+
+        :raise ValueError: Queue file is corrupted
+        """
+        pointers = set()
+        while True:
+            record = self.read_record(stream)
+            if record is None:
+                return
+            rectype, payload = record
+            if rectype != self.REC_TYPE_PTR:
+                yield record
+                continue
+
+            try:
+                offset = int(payload)
+            except ValueError:
+                raise ValueError("invalid pointer record: %r" % (payload,))
+            if not offset:
+                continue
+            if offset in pointers or len(pointers) >= self.max_pointers:
+                raise ValueError("pointer loop at offset %d" % (offset,))
+            pointers.add(offset)
+            stream.seek(offset)
+
+    @debug
+    def load(self, mode="full"):
+        """
+        Load envelope and message content from queue file.
+
+        Records are read until the end record. Continued text records are
+        joined with the following text record to rebuild lines.
+
+        Optionnal argument ``mode`` controls how much of the queue file is
+        read:
+
+            - ``envelope``: Only envelope records are read, message content
+              is skipped.
+            - ``headers``: Message content is skipped after its first empty
+              line, only message headers are loaded.
+            - ``full``: The whole queue file is read.
+
+        Postfix appends recipients records after the message content, in the
+        extracted segment. When message content is skipped, reading goes on
+        from the extracted segment offset stored in the message content start
+        record, or with the next records when this offset is unknown, so all
+        envelope records are loaded whatever the reading mode.
+
+        :param str mode: Reading mode (Default: ``full``)
+
+        :raise IOError: Queue file cannot be read
+        :raise ValueError: Queue file is corrupted or unknown reading mode
+        """
+        if mode not in self.modes:
+            raise ValueError("unknown reading mode: %s" % (mode,))
+
+        arrival = None
+        creation = None
+        partial = []
+        in_message = False
+        xtra_offset = 0
+
+        with open(self.path, "rb") as stream:
+            for rectype, payload in self.records(stream):
+                if rectype == self.REC_TYPE_END:
+                    break
+                elif rectype == self.REC_TYPE_MESG:
+                    try:
+                        xtra_offset = int(payload or 0)
+                    except ValueError:
+                        raise ValueError("invalid message record: %r"
+                                         % (payload,))
+                    in_message = mode != "envelope"
+                    if not in_message and xtra_offset:
+                        stream.seek(xtra_offset)
+                elif rectype == self.REC_TYPE_XTRA:
+                    in_message = False
+                elif rectype == self.REC_TYPE_CONT and in_message:
+                    partial.append(payload)
+                elif rectype == self.REC_TYPE_NORM and in_message:
+                    partial.append(payload)
+                    line = b"".join(partial)
+                    partial = []
+                    if mode == "headers" and not len(line):
+                        in_message = False
+                        if xtra_offset:
+                            stream.seek(xtra_offset)
+                        continue
+                    self.content.append(line.decode('utf-8', 'replace'))
+                elif rectype == self.REC_TYPE_SIZE:
+                    self.size = int(payload.split()[0])
+                elif rectype == self.REC_TYPE_TIME:
+                    arrival = int(payload.split()[0])
+                elif rectype == self.REC_TYPE_CTIME:
+                    creation = int(payload.split()[0])
+                elif rectype == self.REC_TYPE_FROM:
+                    self.sender = payload.decode('utf-8', 'replace')
+                elif rectype == self.REC_TYPE_RCPT:
+                    self.recipients.append(payload.decode('utf-8', 'replace'))
+
+        timestamp = creation if creation is not None else arrival
+        if timestamp is not None:
+            self.date = datetime.fromtimestamp(timestamp)
+
+
+def write_record(stream, rectype, payload):
+    """
+    Write a single record to a queue file.
+
+    This function is the counterpart of :meth:`QueueFile.read_record`, it is
+    useful to build synthetic queue files.
+
+    :param stream: File object opened in binary mode
+    :param bytes rectype: Record type
+    :param bytes payload: Record payload
+    """
+    length = len(payload)
+    encoded = bytearray()
+    while True:
+        byte = length & 0x7f
+        length >>= 7
+        if length:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            break
+    stream.write(rectype + bytes(encoded) + payload)
@@ -19,10 +19,13 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program; if not, see <http://www.gnu.org/licenses/>.
 
-import gc
+import time
 from functools import wraps
 from datetime import datetime
 from pymailq import debug
+from pymailq.index import (iter_positions, mask_bytes, mask_count,
+                           mask_positions, positions_mask)
+from pymailq.patterns import PatternMatcher
 
 
 class MailSelector(object):
@@ -34,7 +37,20 @@ class MailSelector(object):
 
         .. attribute:: mails
 
-            Currently selected :class:`~store.Mail` objects :func:`list`
+            Currently selected :class:`~store.Mail` objects :func:`list`,
+            built from :attr:`~MailSelector.mask` when read.
+
+        .. attribute:: mask
+
+            Selection bitmap as :func:`int`. Bit ``n`` is set when the
+            mail at position ``n`` of :attr:`~MailSelector.store`'s
+            :attr:`~PostqueueStore.mails` attribute is selected. Filters
+            intersect this bitmap with bitmaps of matching mails.
+
+        .. attribute:: generation
+
+            :attr:`~store.PostqueueStore.generation` of the store when the
+            selection was made.
 
         .. attribute:: store
 
@@ -49,113 +65,540 @@ class MailSelector(object):
             :meth:`~selector.MailSelector.filter_registration` decorator while
             calling filtering methods. It is possible to replay registered
             filter using :meth:`~selector.MailSelector.replay_filters` method.
+
+        .. attribute:: lazy
+
+            Controls whether filters are run when registered or when the
+            selection is read. Lazy ``lookup_*`` methods return ``None``.
+            Default is ``False``.
+
+        .. attribute:: pending
+
+            Registered filters :func:`list` not run yet. Entries are tuples
+            containing ``(function, args, kwargs)``.
+
+        .. attribute:: plan
+
+            Steps :func:`list` of filters run on current selection, as
+            :class:`dict` objects with the following keys:
+
+                - ``filter``: ``(function.__name__, args, kwargs)`` tuple
+                - ``estimate``: Estimated number of mails matching filter
+                - ``method``: ``index`` if filter was run against the store
+                  indexes or ``scan`` if selected mails were checked
+                - ``mails``: Number of selected mails after filter
+                - ``time``: Filter run time in seconds
+                - ``cached``: Present and ``True`` when the step result was
+                  restored from :attr:`~MailSelector.prefixes`
+
+        .. attribute:: prefixes
+
+            Cached results :func:`list` of registered
+            :attr:`~MailSelector.filters` prefixes. Entry ``n`` is a
+            ``(mask, plan)`` :func:`tuple` of the selection after the
+            ``n + 1`` first registered filters, or ``None`` when unknown.
+            Cached results are used by
+            :meth:`~selector.MailSelector.replay_filters` and
+            :meth:`~selector.MailSelector.remove_filter` methods and are
+            only valid for the selection :attr:`~MailSelector.generation`.
+            Set to ``None`` when :attr:`~MailSelector.mails` are assigned.
+
+        .. attribute:: sorted_index_ratio
+
+            Minimum ratio of store mails to selected mails above which
+            :meth:`~selector.MailSelector.sorted_mails` sorts the selection
+            instead of reading a store sorted index. Default is ``16``.
     """
-    def __init__(self, store):
+    sorted_index_ratio = 16
+
+    def __init__(self, store, lazy=False):
         """Init method"""
-        self.mails = []
         self.store = store
+        self.lazy = lazy
         self.filters = []
+        self.pending = []
+        self.plan = []
+        self.prefixes = []
+        self.mask = 0
+        self.generation = None
+        self._mails = None
 
         self.reset()
 
+    def __len__(self):
+        """Number of selected mails"""
+        self.evaluate()
+        return mask_count(self.mask)
+
+    @property
+    def mails(self):
+        """
+        Currently selected :class:`~store.Mail` objects :func:`list`.
+
+        The list is built from :attr:`~MailSelector.mask` on first access
+        and kept until the selection changes. Assigned mails are selected
+        in store order.
+        """
+        self.evaluate()
+        if self._mails is None:
+            mails = self.store.mails
+            self._mails = [mails[position] for position in
+                           mask_positions(self.mask, len(mails))]
+        return self._mails
+
+    @mails.setter
+    def mails(self, mails):
+        """Select mails of the store"""
+        positions = self.match_qids([mail.qid for mail in mails])
+        self.mask = positions_mask(positions, len(self.store.mails))
+        self.generation = self.store.generation
+        self.pending = []
+        self.prefixes = None
+        self._mails = None
+
     def filter_registration(function):
         """
         Decorator to register applied filter.
 
         This decorated is used to wrap selection methods ``lookup_*``. It
         registers a ``(function.__name__, args, kwargs)`` :func:`tuple` in
-        the :attr:`~MailSelector.filters` attribute.
+        the :attr:`~MailSelector.filters` attribute and queues the filter
+        in :attr:`~MailSelector.pending` filters. Unless the selector is
+        :attr:`~MailSelector.lazy`, pending filters are then run and the
+        selected mails are returned.
+
+        The decorated function is kept in the ``lookup`` attribute of the
+        wrapper.
         """
         @wraps(function)
         def wrapper(self, *args, **kwargs):
+            self.check_generation()
             filterinfo = (function.__name__, args, kwargs)
             self.filters.append(filterinfo)
-            return function(self, *args, **kwargs)
+            self.pending.append((function, args, kwargs))
+            if self.lazy:
+                return None
+            return self.mails
+        wrapper.lookup = function
         return wrapper
 
+    def check_generation(self):
+        """
+        Replay registered filters if the store content has changed.
+
+        Selection :attr:`~MailSelector.mask` refers to positions of mails in
+        the store. When the store :attr:`~store.PostqueueStore.generation`
+        differs from the selection one, mails positions are no longer valid
+        and :meth:`~selector.MailSelector.replay_filters` is called.
+        """
+        if self.generation != self.store.generation:
+            self.replay_filters()
+
+    def estimate(self, name, args=(), kwargs=None):
+        """
+        Estimate the number of store mails matching a filter.
+
+        Estimates are read from the store :attr:`~store.PostqueueStore.index`
+        with the *self.estimate_<name>* method. Filters without such
+        method are estimated to match every store mail.
+
+        :param str name: Filter name, without the ``lookup_`` prefix
+        :param tuple args: Filter arguments
+        :param dict kwargs: Filter keyword arguments
+        :return: Estimated number of mails
+        :rtype: :func:`int`
+        """
+        estimate = getattr(self, "estimate_%s" % (name,), None)
+        if estimate is None:
+            return len(self.store.mails)
+        return estimate(*args, **(kwargs or {}))
+
+    def evaluate(self):
+        """
+        Run pending filters on current selection.
+
+        Pending filters are run from the most selective one to the least
+        selective one, according to
+        :meth:`~selector.MailSelector.estimate`. Each filter is run either
+        against the store indexes, or by checking currently selected mails
+        with the *self.check_<name>* method when fewer mails are selected
+        than the filter is estimated to match. Each run filter is recorded
+        in the selection :attr:`~MailSelector.plan`.
+        """
+        self.check_generation()
+        if not len(self.pending):
+            return
+
+        steps = []
+        for function, args, kwargs in self.pending:
+            estimate = self.estimate(function.__name__[7:], args, kwargs)
+            steps.append((estimate, len(steps), function, args, kwargs))
+        self.pending = []
+
+        mails = self.store.mails
+        for estimate, _, function, args, kwargs in sorted(steps):
+            start = time.time()
+            selected = mask_count(self.mask)
+            check = getattr(self, "check_%s" % (function.__name__[7:],),
+                            None)
+            if check is not None and selected < estimate:
+                method = "scan"
+                positions = [
+                    position for position in
+                    mask_positions(self.mask, len(mails))
+                    if check(mails[position], *args, **kwargs)]
+                self.mask = positions_mask(positions, len(mails))
+                self._mails = None
+            else:
+                method = "index"
+                function(self, *args, **kwargs)
+
+            self.plan.append({
+                'filter': (function.__name__, args, kwargs),
+                'estimate': estimate,
+                'method': method,
+                'mails': mask_count(self.mask),
+                'time': time.time() - start,
+            })
+
+        if self.prefixes is not None:
+            unknown = len(self.filters) - len(self.prefixes) - 1
+            self.prefixes.extend([None] * unknown)
+            self.prefixes.append((self.mask, list(self.plan)))
+
+    def explain(self):
+        """
+        Get the plan of current selection.
+
+        Pending filters are run before the plan is returned.
+
+        :return: Selection :attr:`~MailSelector.plan`
+        :rtype: :func:`list`
+        """
+        self.evaluate()
+        return self.plan
+
+    def select(self, positions):
+        """
+        Restrict selection to mails at positions of store mails.
+
+        The positions bitmap is intersected with the selection
+        :attr:`~MailSelector.mask`.
+
+        :param list positions: Positions in store
+                               :attr:`~store.PostqueueStore.mails`
+        """
+        self.mask &= positions_mask(positions, len(self.store.mails))
+        self._mails = None
+
     def reset(self):
         """
         Reset mail selector with initial store mails list.
 
-        Selected :class:`~store.Mail` objects are deleted and the
-        :attr:`~MailSelector.mails` attribute is removed for memory releasing
-        purpose (with help of :func:`gc.collect`). Attribute
-        :attr:`~MailSelector.mails` is then reinitialized a copy of
-        :attr:`~MailSelector.store`'s :attr:`~PostqueueStore.mails` attribute.
+        The selection :attr:`~MailSelector.mask` is set to select every
+        mail of :attr:`~MailSelector.store`'s
+        :attr:`~PostqueueStore.mails` attribute, which is not copied.
 
         Registered :attr:`~MailSelector.filters` are also emptied.
         """
-        del self.mails
-        gc.collect()
-
-        self.mails = [mail for mail in self.store.mails]
+        self.mask = (1 << len(self.store.mails)) - 1
+        self.generation = self.store.generation
+        self._mails = None
         self.filters = []
+        self.pending = []
+        self.plan = []
+        self.prefixes = []
 
     def replay_filters(self):
         """
         Reset selection with store content and replay registered filters.
 
-        Like with the :meth:`~selector.MailSelector.reset` method, selected
-        :class:`~store.Mail` objects are deleted and reinitialized with a copy
-        of :attr:`~MailSelector.store`'s :attr:`~PostqueueStore.mails`
-        attribute.
+        Like with the :meth:`~selector.MailSelector.reset` method, every
+        mail of :attr:`~MailSelector.store`'s :attr:`~PostqueueStore.mails`
+        attribute is selected again.
 
         However, registered :attr:`~MailSelector.filters` are kept and replayed
         on resetted selection. Use this method to refresh your store content
-        while keeping your filters.
+        while keeping your filters. Filters are replayed as a whole with
+        :meth:`~selector.MailSelector.evaluate`, unless the selector is
+        :attr:`~MailSelector.lazy`.
+
+        Filters are only replayed after the longest known prefix of
+        filters in :attr:`~MailSelector.prefixes`, updated with
+        :meth:`~selector.MailSelector.update_prefixes` if the store was
+        reloaded.
+        """
+        prefixes = self.get_prefixes()
+        filters = [entry for entry in self.filters]
+        self.reset()
+        self.filters = filters
+        self.restore_prefixes(prefixes)
+
+    def remove_filter(self, index):
         """
-        del self.mails
-        gc.collect()
+        Remove a registered filter and replay the following ones.
+
+        Selection is restored from the cached result of filters registered
+        before the removed one, so only following filters are replayed.
+
+        :param int index: Index of filter in :attr:`~MailSelector.filters`
 
-        self.mails = [mail for mail in self.store.mails]
+        :raise IndexError: No filter registered at index
+        """
+        index = range(len(self.filters))[index]
+        prefixes = self.get_prefixes()[:index]
         filters = [entry for entry in self.filters]
-        for filterinfo in filters:
-            name, args, kwargs = filterinfo
-            getattr(self, name)(*args, **kwargs)
+        filters.pop(index)
+        self.reset()
         self.filters = filters
+        self.restore_prefixes(prefixes)
+
+    def get_prefixes(self):
+        """
+        Get cached results of filters prefixes valid for the store content.
+
+        :return: :attr:`~MailSelector.prefixes` of current store
+                 :attr:`~store.PostqueueStore.generation`
+        :rtype: :func:`list`
+        """
+        if self.prefixes is None:
+            return []
+        if self.generation != self.store.generation:
+            return self.update_prefixes()
+        return self.prefixes
+
+    def update_prefixes(self):
+        """
+        Update cached results of filters prefixes after a store reload.
+
+        When the store was reloaded from the selection
+        :attr:`~MailSelector.generation`, known positions of unchanged mails
+        are moved according to :attr:`~store.PostqueueStore.updates` and
+        only added or modified mails are checked against the filters with
+        the *self.check_<name>* methods.
+
+        :return: Updated :attr:`~MailSelector.prefixes`, or an empty
+                 :func:`list` if the store content cannot be updated
+        :rtype: :func:`list`
+        """
+        updates = self.store.updates
+        if updates is None or updates['generation'] != self.generation:
+            return []
+
+        checks = []
+        for name, args, kwargs in self.filters[:len(self.prefixes)]:
+            check = getattr(self, "check_%s" % (name[7:],), None)
+            if check is None:
+                return []
+            checks.append((check, args, kwargs))
+
+        # number of leading filters matched by each changed mail
+        mails = self.store.mails
+        matched = []
+        for position in updates['changed']:
+            count = 0
+            for check, args, kwargs in checks:
+                if not check(mails[position], *args, **kwargs):
+                    break
+                count += 1
+            matched.append((position, count))
+
+        moves = updates['positions']
+        prefixes = []
+        for count, prefix in enumerate(self.prefixes):
+            if prefix is None:
+                prefixes.append(None)
+                continue
+            mask, plan = prefix
+            positions = [moves[position] for position in
+                         mask_positions(mask, len(moves))
+                         if moves[position] >= 0]
+            positions.extend([position for position, matches in matched
+                              if matches > count])
+            mask = positions_mask(positions, len(mails))
+            plan = [dict(step) for step in plan]
+            plan[-1]['mails'] = mask_count(mask)
+            prefixes.append((mask, plan))
+        return prefixes
+
+    def restore_prefixes(self, prefixes):
+        """
+        Restore selection from cached results of filters prefixes.
+
+        The selection is restored from the longest known prefix of
+        registered :attr:`~MailSelector.filters`. Following filters are
+        pending and run unless the selector is :attr:`~MailSelector.lazy`.
+
+        :param list prefixes: :attr:`~MailSelector.prefixes` to restore
+        """
+        known = len(prefixes)
+        while known and prefixes[known - 1] is None:
+            known -= 1
+        if known:
+            self.mask, plan = prefixes[known - 1]
+            self.plan = [dict(step, cached=True) for step in plan]
+        self.prefixes = prefixes[:known]
+        self.pending = [(getattr(self, name).lookup, args, kwargs)
+                        for name, args, kwargs in self.filters[known:]]
+        if not self.lazy:
+            self.evaluate()
+
+    def get_indexed_mails(self, name, keys):
+        """
+        Get selected mails matching keys in a store index.
+
+        Mails matching any of the keys are fetched from the
+        :attr:`~store.PostqueueStore.index` of the linked store and
+        intersected with the current selection, instead of scanning every
+        selected mail. Mails are returned in store order.
+
+        This function is not registered as filter.
+
+        :param str name: :class:`~index.StoreIndex` index name
+        :param list keys: Keys to lookup in index
+        :return: List of selected :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        return self.get_mails_by_positions(
+            self.store.index.positions(name, keys))
+
+    def get_mails_by_positions(self, positions):
+        """
+        Get selected mails at positions of store mails.
+
+        This function is not registered as filter.
+
+        :param list positions: Positions in store
+                               :attr:`~store.PostqueueStore.mails`
+        :return: List of selected :class:`~store.Mail` objects, in positions
+                 order
+        :rtype: :func:`list`
+        """
+        self.evaluate()
+        mails = self.store.mails
+        if self.mask == (1 << len(mails)) - 1:
+            return [mails[position] for position in positions]
+        bits = mask_bytes(self.mask, len(mails))
+        return [mails[position] for position in positions
+                if bits[position >> 3] >> (position & 7) & 1]
+
+    def sorted_mails(self, sortkey="date", reverse=True):
+        """
+        Get selected mails sorted by an attribute.
+
+        Selections sorted by an attribute with a sorted index in the
+        store :attr:`~store.PostqueueStore.index` are read from the index
+        instead of being sorted again. Other attributes and small
+        selections are sorted with :func:`sorted`.
+
+        This function is not registered as filter.
+
+        :param str sortkey: Mail attribute to sort on (Default: ``date``)
+        :param bool reverse: Sort in descending order (Default: ``True``)
+        :return: List of sorted :class:`~store.Mail` objects
+        :rtype: :func:`list`
+
+        :raise AttributeError: Mails have no such attribute
+        """
+        index = self.store.index
+        if (sortkey not in index.sortable or
+                len(self) * self.sorted_index_ratio < len(self.store.mails)):
+            return sorted(self.mails, key=lambda x: getattr(x, sortkey),
+                          reverse=reverse)
+
+        return self.get_mails_by_positions(
+            index.sorted_positions(sortkey, reverse))
 
     def get_mails_by_qids(self, qids):
         """
         Get mails with specified IDs.
 
+        Mails are found with the store :attr:`~store.PostqueueStore.qids`
+        map and returned in store order.
+
         This function is not registered as filter.
 
         :param list qids: List of mail IDs.
         :return: List of newly selected :class:`~store.Mail` objects
         :rtype: :func:`list`
         """
-        return [mail for mail in self.mails
-                if mail.qid in qids]
+        return self.get_mails_by_positions(self.match_qids(qids))
 
-    @debug
-    @filter_registration
-    def lookup_qids(self, qids):
+    def classify_errors(self, patterns):
         """
-        Lookup mails with specified IDs.
+        Classify selected mails by patterns found in their errors.
+
+        Patterns are searched at once in every distinct error of store
+        :attr:`~store.PostqueueStore.index` with a
+        :class:`~patterns.PatternMatcher`, instead of looking up each
+        pattern in every error of every selected mail.
+
+        This function is not registered as filter.
+
+        :param list patterns: Patterns to search in mails errors
+        :return: :func:`list` of ``(pattern, mails)`` tuples, in patterns
+                 order. Mails are selected :class:`~store.Mail` objects
+                 with errors containing the pattern.
+        :rtype: :func:`list`
+        """
+        matcher = PatternMatcher(patterns)
+        errors = matcher.classify(self.store.index.get("error"))
+        return [(pattern, self.get_indexed_mails("error", errors[index]))
+                for index, pattern in enumerate(matcher.patterns)]
+
+    def stream(self):
+        """
+        Get a lazy stream of selected mails.
+
+        Filters chained on the returned :class:`~selector.MailStream` are
+        checked on each selected mail while iterating, without building
+        intermediate mails lists nor modifying the selection::
+
+            >>> mails = selector.stream().status("deferred").sender(
+            ...     "@example.com", exact=False).size(smin=1e6).limit(100)
+            >>> QueueControl().hold_messages(mails)
+
+        This function is not registered as filter.
+
+        :return: :class:`~selector.MailStream` of selected mails
+        """
+        return MailStream(self)
+
+    def match_qids(self, qids):
+        """
+        Get positions of store mails with specified IDs.
+
+        This function is not registered as filter, as every ``match_*``
+        method. Those methods are used by ``lookup_*`` filters and by
+        :mod:`query` expressions.
 
         :param list qids: List of mail IDs.
-        :return: List of newly selected :class:`~store.Mail` objects
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
         :rtype: :func:`list`
         """
-        self.mails = self.get_mails_by_qids(qids)
-        return self.mails
+        positions = self.store.qids
+        return sorted(set([positions[qid] for qid in qids
+                           if qid in positions]))
 
-    @debug
-    @filter_registration
-    def lookup_header(self, header, value, exact=True):
+    def match_header(self, header, value, exact=True, positions=None):
         """
-        Lookup mail headers with specified value.
+        Get positions of store mails with specified header value.
 
         :param str header: Header name to filter on.
         :param str value: Header value to filter on.
         :param bool exact: Allow lookup with partial or exact match
-
-        :return: List of newly selected :class:`~store.Mail` objects
+        :param list positions: Positions of mails to check, every store mail
+                               is checked if ``None``
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
         :rtype: :func:`list`
         """
+        mails = self.store.mails
+        if positions is None:
+            positions = range(len(mails))
+
         matches = []
-        for mail in self.mails:
-            header_value = getattr(mail.head, header, None)
+        for position in positions:
+            header_value = getattr(mails[position].head, header, None)
             if not header_value:
                 continue
 
@@ -163,15 +606,252 @@ class MailSelector(object):
                 header_value = [header_value]
 
             if exact and value in header_value:
-                matches.append(mail)
+                matches.append(position)
             elif not exact:
                 for entry in header_value:
                     if value in entry:
-                        matches.append(mail)
+                        matches.append(position)
                         break
+        return matches
+
+    def match_status(self, status):
+        """
+        Get positions of store mails with specified postqueue status.
 
-        self.mails = matches
-        return self.mails
+        :param list status: List of matching status to filter on.
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        statuses = [key for key in self.store.index.get("status")
+                    if key in status]
+        return self.store.index.positions("status", statuses)
+
+    def match_sender(self, sender, exact=True):
+        """
+        Get positions of store mails send from a specific sender.
+
+        :param str sender: Sender address to lookup
+        :param bool exact: Allow lookup with partial or exact match
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        if exact is False:
+            senders = self.store.index.search("sender", sender)
+            return self.store.index.positions("sender", senders)
+        return self.store.index.positions("sender", [sender])
+
+    def match_recipient(self, recipient, exact=True):
+        """
+        Get positions of store mails send to a specific recipient.
+
+        :param str recipient: Recipient address to lookup
+        :param bool exact: Allow lookup with partial or exact match
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        if exact is False:
+            recipients = self.store.index.search("recipient", recipient)
+            return self.store.index.positions("recipient", recipients)
+        return self.store.index.positions("recipient", [recipient])
+
+    def match_sender_domain(self, domain):
+        """
+        Get positions of store mails send from a specific sender domain.
+
+        :param str domain: Sender domain to lookup
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        return self.store.index.positions("sender_domain", [domain])
+
+    def match_recipient_domain(self, domain):
+        """
+        Get positions of store mails send to a specific recipient domain.
+
+        :param str domain: Recipient domain to lookup
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        return self.store.index.positions("recipient_domain", [domain])
+
+    def match_error(self, error_msg):
+        """
+        Get positions of store mails with specific error message (message
+        may be partial).
+
+        :param str error_msg: Error message to filter on
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        errors = self.store.index.search("error", error_msg)
+        return self.store.index.positions("error", errors)
+
+    def match_date(self, start=None, stop=None):
+        """
+        Get positions of store mails send on specific date range.
+
+        :param datetime.date start: Start date (Default: None)
+        :param datetime.date stop: Stop date (Default: None)
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        if start is None:
+            start = datetime(1970, 1, 1)
+        if stop is None:
+            stop = datetime.now()
+        return self.store.index.between("date", start, stop)
+
+    def match_size(self, smin=0, smax=0):
+        """
+        Get positions of store mails send with specific size.
+
+        :param int smin: Minimum size (Default: ``0``)
+        :param int smax: Maximum size, ignored if ``0`` (Default: ``0``)
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        return self.store.index.between("size", smin,
+                                        smax if smax > 0 else None)
+
+    def estimate_qids(self, qids):
+        """Estimate number of store mails matching ``qids`` filter"""
+        return len(qids)
+
+    def estimate_status(self, status):
+        """Estimate number of store mails matching ``status`` filter"""
+        index = self.store.index.get("status")
+        return sum([len(index[key]) for key in index if key in status])
+
+    def estimate_sender(self, sender, exact=True):
+        """Estimate number of store mails matching ``sender`` filter"""
+        if exact is False:
+            return self.store.index.count_search("sender", sender)
+        return len(self.store.index.get("sender").get(sender, ()))
+
+    def estimate_recipient(self, recipient, exact=True):
+        """Estimate number of store mails matching ``recipient`` filter"""
+        if exact is False:
+            return self.store.index.count_search("recipient", recipient)
+        return len(self.store.index.get("recipient").get(recipient, ()))
+
+    def estimate_sender_domain(self, domain):
+        """Estimate number of store mails matching ``sender_domain`` filter"""
+        return len(self.store.index.get("sender_domain").get(domain, ()))
+
+    def estimate_recipient_domain(self, domain):
+        """
+        Estimate number of store mails matching ``recipient_domain`` filter
+        """
+        return len(self.store.index.get("recipient_domain").get(domain, ()))
+
+    def estimate_error(self, error_msg):
+        """Estimate number of store mails matching ``error`` filter"""
+        return self.store.index.count_search("error", error_msg)
+
+    def estimate_date(self, start=None, stop=None):
+        """Estimate number of store mails matching ``date`` filter"""
+        if start is None:
+            start = datetime(1970, 1, 1)
+        if stop is None:
+            stop = datetime.now()
+        return self.store.index.count_between("date", start, stop)
+
+    def estimate_size(self, smin=0, smax=0):
+        """Estimate number of store mails matching ``size`` filter"""
+        return self.store.index.count_between("size", smin,
+                                              smax if smax > 0 else None)
+
+    def estimate_query(self, query):
+        """Estimate number of store mails matching ``query`` filter"""
+        return query.estimate(self)
+
+    @staticmethod
+    def check_qids(mail, qids):
+        """Check if a mail matches ``qids`` filter"""
+        return mail.qid in qids
+
+    @staticmethod
+    def check_status(mail, status):
+        """Check if a mail matches ``status`` filter"""
+        return mail.status in status
+
+    @staticmethod
+    def check_sender(mail, sender, exact=True):
+        """Check if a mail matches ``sender`` filter"""
+        if exact is False:
+            return sender in mail.sender
+        return sender == mail.sender
+
+    @staticmethod
+    def check_recipient(mail, recipient, exact=True):
+        """Check if a mail matches ``recipient`` filter"""
+        if exact is False:
+            for value in mail.recipients:
+                if recipient in value:
+                    return True
+            return False
+        return recipient in mail.recipients
+
+    def check_sender_domain(self, mail, domain):
+        """Check if a mail matches ``sender_domain`` filter"""
+        return self.store.strings.domain(mail.sender) == domain
+
+    def check_recipient_domain(self, mail, domain):
+        """Check if a mail matches ``recipient_domain`` filter"""
+        for recipient in mail.recipients:
+            if self.store.strings.domain(recipient) == domain:
+                return True
+        return False
+
+    @staticmethod
+    def check_error(mail, error_msg):
+        """Check if a mail matches ``error`` filter"""
+        for error in mail.errors:
+            if error_msg in error:
+                return True
+        return False
+
+    @staticmethod
+    def check_date(mail, start=None, stop=None):
+        """Check if a mail matches ``date`` filter"""
+        if start is None:
+            start = datetime(1970, 1, 1)
+        if stop is None:
+            stop = datetime.now()
+        return start <= mail.date <= stop
+
+    @staticmethod
+    def check_size(mail, smin=0, smax=0):
+        """Check if a mail matches ``size`` filter"""
+        return smin <= mail.size and (smax <= 0 or mail.size <= smax)
+
+    @debug
+    @filter_registration
+    def lookup_qids(self, qids):
+        """
+        Lookup mails with specified IDs.
+
+        :param list qids: List of mail IDs.
+        :return: List of newly selected :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        self.select(self.match_qids(qids))
+
+    @debug
+    @filter_registration
+    def lookup_header(self, header, value, exact=True):
+        """
+        Lookup mail headers with specified value.
+
+        :param str header: Header name to filter on.
+        :param str value: Header value to filter on.
+        :param bool exact: Allow lookup with partial or exact match
+
+        :return: List of newly selected :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        positions = mask_positions(self.mask, len(self.store.mails))
+        self.select(self.match_header(header, value, exact, positions))
 
     @debug
     @filter_registration
@@ -183,10 +863,7 @@ class MailSelector(object):
         :return: List of newly selected :class:`~store.Mail` objects
         :rtype: :func:`list`
         """
-        self.mails = [mail for mail in self.mails
-                      if mail.status in status]
-
-        return self.mails
+        self.select(self.match_status(status))
 
     @debug
     @filter_registration
@@ -209,14 +886,7 @@ class MailSelector(object):
         :return: List of newly selected :class:`~store.Mail` objects
         :rtype: :func:`list`
         """
-        if exact is False:
-            self.mails = [mail for mail in self.mails
-                          if sender in mail.sender]
-        else:
-            self.mails = [mail for mail in self.mails
-                          if sender == mail.sender]
-
-        return self.mails
+        self.select(self.match_sender(sender, exact))
 
     @debug
     @filter_registration
@@ -239,18 +909,33 @@ class MailSelector(object):
         :return: List of newly selected :class:`~store.Mail` objects
         :rtype: :func:`list`
         """
-        if exact is False:
-            selected = []
-            for mail in self.mails:
-                for value in mail.recipients:
-                    if recipient in value:
-                        selected += [mail]
-            self.mails = selected
-        else:
-            self.mails = [mail for mail in self.mails
-                          if recipient in mail.recipients]
-
-        return self.mails
+        self.select(self.match_recipient(recipient, exact))
+
+    @debug
+    @filter_registration
+    def lookup_sender_domain(self, domain):
+        """
+        Lookup mails send from a specific sender domain.
+
+        :param str domain: Sender domain to lookup in :class:`~store.Mail`
+                           objects selection.
+        :return: List of newly selected :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        self.select(self.match_sender_domain(domain))
+
+    @debug
+    @filter_registration
+    def lookup_recipient_domain(self, domain):
+        """
+        Lookup mails send to at least one recipient of a specific domain.
+
+        :param str domain: Recipient domain to lookup in :class:`~store.Mail`
+                           objects selection.
+        :return: List of newly selected :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        self.select(self.match_recipient_domain(domain))
 
     @debug
     @filter_registration
@@ -262,10 +947,7 @@ class MailSelector(object):
         :return: List of newly selected :class:`~store.Mail` objects`
         :rtype: :func:`list`
         """
-        self.mails = [mail for mail in self.mails
-                      if True in [True for err in mail.errors
-                                  if error_msg in err]]
-        return self.mails
+        self.select(self.match_error(error_msg))
 
     @debug
     @filter_registration
@@ -279,15 +961,7 @@ class MailSelector(object):
         :return: List of newly selected :class:`~store.Mail` objects
         :rtype: :func:`list`
         """
-        if start is None:
-            start = datetime(1970, 1, 1)
-        if stop is None:
-            stop = datetime.now()
-
-        self.mails = [mail for mail in self.mails
-                      if start <= mail.date <= stop]
-
-        return self.mails
+        self.select(self.match_date(start, stop))
 
     @debug
     @filter_registration
@@ -306,10 +980,161 @@ class MailSelector(object):
         :rtype: :func:`list`
         """
         if smin == 0 and smax == 0:
-            return self.mails
+            return
+
+        self.select(self.match_size(smin, smax))
+
+    @debug
+    @filter_registration
+    def lookup_query(self, query):
+        """
+        Lookup mails matching a query expression.
+
+        The query is evaluated as a whole over the store, combining bitmaps
+        of its predicates, before being intersected with the current
+        selection. See :mod:`query` module to build query expressions.
+
+        :param query.Query query: Query expression
+        :return: List of newly selected :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        self.mask &= query.mask(self)
+        self._mails = None
+
 
-        if smax > 0:
-            self.mails = [mail for mail in self.mails if mail.size <= smax]
-        self.mails = [mail for mail in self.mails if mail.size >= smin]
+class MailStream(object):
+    """
+    Lazy stream of mails selected by a :class:`~selector.MailSelector`.
+
+    Filters methods register a check and return the stream itself, so
+    filters can be chained. Iterating over the stream generates selected
+    mails passing every registered check, in store order and in checks
+    registration order, and stops as soon as the :meth:`limit` is reached.
+    Mails are never collected in a list: a stream can be passed to
+    :class:`~control.QueueControl` operations or to any consumer of mails
+    iterables, and iterated again to run the checks on the current
+    selection.
+
+    Checks are the *check_<name>* methods of the selector, also used by
+    :meth:`~selector.MailSelector.evaluate` scans, so streamed mails match
+    the ones selected by the equivalent ``lookup_*`` methods.
+
+    The :class:`~selector.MailStream` instance provides the following
+    attributes:
+
+        .. attribute:: selector
+
+            :class:`~selector.MailSelector` providing the mails selection.
+
+        .. attribute:: checks
+
+            Registered checks :func:`list`. Entries are tuples containing
+            ``(function, args, kwargs)``.
+
+        .. attribute:: count
+
+            Maximum number of generated mails, or ``None`` for no limit.
+    """
+
+    def __init__(self, selector):
+        """Init method"""
+        self.selector = selector
+        self.checks = []
+        self.count = None
+
+    def __iter__(self):
+        """Generate selected mails passing registered checks"""
+        if self.count is not None and self.count <= 0:
+            return
+
+        selector = self.selector
+        selector.evaluate()
+        mails = selector.store.mails
+        checks = self.checks
+        generated = 0
+        for position in iter_positions(selector.mask, len(mails)):
+            mail = mails[position]
+            for function, args, kwargs in checks:
+                if not function(mail, *args, **kwargs):
+                    break
+            else:
+                yield mail
+                generated += 1
+                if generated == self.count:
+                    return
+
+    def filter(self, name, *args, **kwargs):
+        """
+        Register a selector check.
+
+        :param str name: Check name, without the ``check_`` prefix
+        :param args: Check arguments
+        :param kwargs: Check keyword arguments
+        :return: The :class:`~selector.MailStream` itself
+
+        :raise AttributeError: Selector has no such check
+        """
+        function = getattr(self.selector, "check_%s" % (name,))
+        self.checks.append((function, args, kwargs))
+        return self
+
+    def where(self, function):
+        """
+        Register a custom check.
+
+        :param func function: Function called with each mail, returning
+                              ``True`` for mails to keep
+        :return: The :class:`~selector.MailStream` itself
+        """
+        self.checks.append((function, (), {}))
+        return self
+
+    def limit(self, count):
+        """
+        Limit the number of generated mails.
+
+        :param int count: Maximum number of mails
+        :return: The :class:`~selector.MailStream` itself
+        """
+        self.count = count
+        return self
+
+    def qids(self, qids):
+        """Keep mails with specified IDs, see ``lookup_qids``"""
+        return self.filter("qids", set(qids))
+
+    def status(self, status):
+        """Keep mails with specified status, see ``lookup_status``"""
+        return self.filter("status", status)
+
+    def sender(self, sender, exact=True):
+        """Keep mails send from a sender, see ``lookup_sender``"""
+        return self.filter("sender", sender, exact)
+
+    def recipient(self, recipient, exact=True):
+        """Keep mails send to a recipient, see ``lookup_recipient``"""
+        return self.filter("recipient", recipient, exact)
+
+    def sender_domain(self, domain):
+        """Keep mails send from a domain, see ``lookup_sender_domain``"""
+        return self.filter("sender_domain", domain)
+
+    def recipient_domain(self, domain):
+        """Keep mails send to a domain, see ``lookup_recipient_domain``"""
+        return self.filter("recipient_domain", domain)
+
+    def error(self, error_msg):
+        """Keep mails with an error message, see ``lookup_error``"""
+        return self.filter("error", error_msg)
+
+    def date(self, start=None, stop=None):
+        """Keep mails send on a date range, see ``lookup_date``"""
+        if start is None:
+            start = datetime(1970, 1, 1)
+        if stop is None:
+            stop = datetime.now()
+        return self.filter("date", start, stop)
 
-        return self.mails
+    def size(self, smin=0, smax=0):
+        """Keep mails with a size range, see ``lookup_size``"""
+        return self.filter("size", smin, smax)
@@ -22,11 +22,11 @@
 
 import cmd
 from functools import partial
-from datetime import datetime, timedelta
 from subprocess import CalledProcessError
 import shlex
 import inspect
-from pymailq import store, control, selector, utils
+from collections import Counter
+from pymailq import store, control, selector, query, utils, patterns
 
 
 class PyMailqShell(cmd.Cmd):
@@ -47,7 +47,7 @@ class PyMailqShell(cmd.Cmd):
     do_super = None
 
     def __init__(self, completekey='tab', stdin=None, stdout=None,
-                 store_auto_load=False):
+                 store_auto_load=False, store_class=None):
         """Init method"""
         cmd.Cmd.__init__(self, completekey, stdin, stdout)
 
@@ -61,7 +61,9 @@ class PyMailqShell(cmd.Cmd):
         # show command is specific and cannot be build dynamically
         setattr(self, "help_show", partial(self._help_, "show"))
 
-        self.pstore = store.PostqueueStore()
+        if store_class is None:
+            store_class = store.PostqueueStore
+        self.pstore = store_class()
         self.selector = selector.MailSelector(self.pstore)
         self.qcontrol = control.QueueControl()
 
@@ -135,7 +137,7 @@ class PyMailqShell(cmd.Cmd):
 
         prompt = ['PyMailq']
         if self.selector is not None:
-            prompt.append(' (sel:%d)' % (len(self.selector.mails)))
+            prompt.append(' (sel:%d)' % (len(self.selector)))
         prompt.append('> ')
 
         return "".join(prompt)
@@ -207,7 +209,8 @@ class PyMailqShell(cmd.Cmd):
                 'sender': ['<sender> [exact]'],
                 'recipient': ['<recipient> [exact]'],
                 'size': ['<-n|n|+n> [-n]'],
-                'status': ['<status>']
+                'status': ['<status>'],
+                'where': ['<predicate> [and|or <predicate>] ...']
             }
         }
 
@@ -263,12 +266,22 @@ class PyMailqShell(cmd.Cmd):
         try:
             self.pstore.load(filename=filename)
             # Automatic load of selector if it is empty and never used.
-            if not len(self.selector.mails) and not len(self.selector.filters):
+            if not len(self.selector) and not len(self.selector.filters):
                 self.selector.reset()
             return ["%d mails loaded from queue" % (len(self.pstore.mails))]
         except (OSError, IOError, CalledProcessError) as exc:
             return ["*** Error: unable to load store", "    %s" % (exc,)]
 
+    def _store_reload(self):
+        """Reload Postfix queue content, keeping unchanged mails"""
+        try:
+            changes = self.pstore.reload()
+            return ["%d mails loaded from queue (%d added, %d removed)" % (
+                len(self.pstore.mails), len(changes['added']),
+                len(changes['removed']))]
+        except (OSError, IOError, CalledProcessError) as exc:
+            return ["*** Error: unable to load store", "    %s" % (exc,)]
+
     def _store_status(self):
         """Show store status"""
         if self.pstore is None or self.pstore.loaded_at is None:
@@ -280,7 +293,7 @@ class PyMailqShell(cmd.Cmd):
         """Reset content of selector with store content"""
         self.selector.reset()
         return ["Selector resetted with store content (%s mails)" % (
-                                                    len(self.selector.mails))]
+                                                    len(self.selector))]
 
     def _select_replay(self):
         """Reset content of selector with store content and replay filters"""
@@ -294,9 +307,7 @@ class PyMailqShell(cmd.Cmd):
           Usage: select rmfilter <filterid>
         """
         try:
-            idx = int(filterid)
-            self.selector.filters.pop(idx)
-            self.selector.replay_filters()
+            self.selector.remove_filter(int(filterid))
         # TODO: except should be more accurate
         except:
             raise SyntaxError("invalid filter ID: %s" % filterid)
@@ -344,39 +355,7 @@ class PyMailqShell(cmd.Cmd):
           Size range is allowed by using - (lesser than) and + (greater than)
           Usage: select size <-n|n|+n> [-n]
         """
-        smin = None
-        smax = None
-        exact = None
-        try:
-            for size in size_a, size_b:
-                if size is None:
-                    continue
-                if exact is not None:
-                    raise SyntaxError("exact size must be used alone")
-                if size.startswith("-"):
-                    if smax is not None:
-                        raise SyntaxError("multiple max sizes specified")
-                    smax = int(size[1:])
-                elif size.startswith("+"):
-                    if smin is not None:
-                        raise SyntaxError("multiple min sizes specified")
-                    smin = int(size[1:])
-                else:
-                    exact = int(size)
-        except ValueError:
-            raise SyntaxError("specified sizes must be valid numbers")
-
-        if exact is not None:
-            smin = exact
-            smax = exact
-        if smax is None:
-            smax = 0
-        if smin is None:
-            smin = 0
-
-        if smin > smax > 0:
-            raise SyntaxError("minimum size is greater than maximum size")
-
+        smin, smax = query.parse_size_spec(size_a, size_b)
         self.selector.lookup_size(smin=smin, smax=smax)
 
     def _select_date(self, date_spec):
@@ -390,23 +369,8 @@ class PyMailqShell(cmd.Cmd):
               +YYYY-MM-DD (after a date (included))
               -YYYY-MM-DD (before a date (included))
         """
-        try:
-            if ".." in date_spec:
-                (str_start, str_stop) = date_spec.split("..", 1)
-                start = datetime.strptime(str_start, "%Y-%m-%d")
-                stop = datetime.strptime(str_stop, "%Y-%m-%d")
-            elif date_spec.startswith("+"):
-                start = datetime.strptime(date_spec[1:], "%Y-%m-%d")
-                stop = datetime.now()
-            elif date_spec.startswith("-"):
-                start = datetime(1970, 1, 1)
-                stop = datetime.strptime(date_spec[1:], "%Y-%m-%d")
-            else:
-                start = datetime.strptime(date_spec, "%Y-%m-%d")
-                stop = start + timedelta(1)
-            self.selector.lookup_date(start, stop)
-        except ValueError as exc:
-            raise SyntaxError(str(exc))
+        start, stop = query.parse_date_spec(date_spec)
+        self.selector.lookup_date(start, stop)
 
     def _select_error(self, error_msg):
         """
@@ -416,17 +380,49 @@ class PyMailqShell(cmd.Cmd):
         """
         self.selector.lookup_error(str(error_msg))
 
+    def _select_where(self, *words):
+        """
+        Select mails matching a query expression
+          Predicates are combined with and, or, not and parentheses,
+          which must be separated by spaces.
+          Usage: select where <predicate> [and|or <predicate>] ...
+            Where <predicate> can be
+              [not] qids <qid>[,<qid>,...]
+              [not] status <status>
+              [not] sender <sender> [exact]
+              [not] recipient <recipient> [exact]
+              [not] sender_domain <domain>
+              [not] recipient_domain <domain>
+              [not] error <error_msg>
+              [not] size <-n|n|+n>
+              [not] date <datespec>
+              [not] ( <predicate> ... )
+        """
+        self.selector.lookup_query(query=query.parse_query(words))
+
     def _inspect_mails(self, *qids):
         """
         Show mails content
+          Mails are searched in the whole store, not only in selection.
+          Mails not loaded in store are read from Postfix spool.
           Usage: inspect mails <qid> [qid] ...
         """
-        mails = self.selector.get_mails_by_qids(qids)
+        mails = []
+        loaded = []
+        for qid in qids:
+            mail = self.pstore.get(qid)
+            if mail is None:
+                # Parsed from its queue file, mail may be out of store
+                mail = self.pstore.fetch(qid, parse=True)
+            else:
+                loaded.append(mail)
+            if mail is not None:
+                mails.append(mail)
         if not len(mails):
             return ['Mail IDs not found']
+        self.pstore.parse_mails(loaded)
         response = []
         for mail in mails:
-            mail.parse()
             if len(mail.parse_error):
                 return [mail.parse_error]
             response.append(mail.show())
@@ -445,7 +441,8 @@ class PyMailqShell(cmd.Cmd):
           sender        Mail sender
           recipients    Mail recipients (list, no sort)
           size          Mail size
-          errors        Postqueue deferred error messages (list, no sort)
+          errors        Postqueue deferred error messages (list, no sort,
+                        ranked by error template)
         """
         args = shlex.split(str_arg)
         if not len(args):
@@ -469,13 +466,45 @@ class PyMailqShell(cmd.Cmd):
 
     @utils.viewer
     @utils.ranker
-    @utils.sorter
-    def _show_selected(self):
+    @utils.sorter(sorts_itself=True)
+    def _show_selected(self, sortby=None):
         """
         Show selected mails
           Usage: show selected [modifiers]
         """
-        return self.selector.mails
+        if sortby is None:
+            return self.selector.mails
+        sortkey, reverse = sortby
+        try:
+            return self.selector.sorted_mails(sortkey, reverse)
+        except AttributeError:
+            msg = "elements cannot be sorted by %s" % sortkey
+            raise SyntaxError(msg)
+
+    @utils.viewer
+    def _show_errors(self, *signatures):
+        """
+        Show errors of selected mails
+          Selected mails errors are counted by error template, or selected
+          mails are counted by signature found in their errors when
+          signatures are given.
+          Usage: show errors [<signature> ...] [limit <n>]
+        """
+        if len(signatures):
+            field = "signature"
+            counts = [(signature, len(mails)) for signature, mails in
+                      self.selector.classify_errors(signatures)]
+        else:
+            field = "error"
+            errors = Counter()
+            for mail in self.selector.mails:
+                errors.update(mail.errors)
+            counts = patterns.count_templates(errors).most_common()
+
+        lines = ['%-40s  count' % field, '='*48]
+        for entry in counts:
+            lines.append('%-40s  %s' % entry)
+        return lines
 
     def _show_filters(self):
         """
@@ -494,6 +523,39 @@ class PyMailqShell(cmd.Cmd):
                 lines.append("    %s: %s" % (key, _kwargs[key]))
         return lines
 
+    def do_explain(self, str_arg):
+        """
+        Show the plan of current selection
+          Filters are listed in run order, with the estimated number of
+          matching mails, the method used to run them (index or scan), the
+          number of selected mails after each filter and its run time.
+          Filters results reused from a previous run are marked as cached.
+          Usage: explain
+        """
+        plan = self.selector.explain()
+        if not len(plan):
+            self.respond("No filters applied on current selection")
+            return
+
+        lines = []
+        for idx, step in enumerate(plan):
+            name, _args, _kwargs = step['filter']
+            method = step['method']
+            if step.get('cached'):
+                method += " (cached)"
+            # name should always be prefixed with lookup_
+            lines.append("%d: select %s: %s, estimated %d mails, "
+                         "%d mails selected in %.3f ms" % (
+                             idx, name[7:], method, step['estimate'],
+                             step['mails'], step['time'] * 1000))
+            for key in sorted(_kwargs):
+                lines.append("    %s: %s" % (key, _kwargs[key]))
+        self.respond("\n".join(lines))
+
+    def help_explain(self):
+        """Help of command explain"""
+        self.respond(inspect.cleandoc(self.do_explain.__doc__))
+
     # Postsuper generic command
     def __do_super(self, operation):
         """Postsuper generic command"""
@@ -509,7 +571,7 @@ class PyMailqShell(cmd.Cmd):
                 return [str(exc)]
 
             # reloads the data
-            self._store_load()
+            self._store_reload()
             self._select_replay()
 
         return [resp[-1]]
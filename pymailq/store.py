@@ -25,12 +25,31 @@ import sys
 import os
 import gc
 import re
+import json
+import mmap
 import subprocess
+import multiprocessing
 import email
+from multiprocessing.pool import ThreadPool
 from email import header
 from collections import Counter
 from datetime import datetime, timedelta
 from pymailq import CONFIG, debug
+from pymailq.queuefile import QueueFile, queue_file_path
+from pymailq.cache import get_header_cache
+from pymailq.patterns import count_templates
+from pymailq.index import StoreIndex
+from pymailq import vectorized
+
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
+try:
+    from sys import intern
+except ImportError:  # python 2 builtin
+    pass
 
 
 class MailHeaders(object):
@@ -58,6 +77,12 @@ class MailHeaders(object):
     :attr:`Mail.From` or :attr:`Mail.Received` for example. All those
     attributes will return *list* of values.
 
+    Headers are stored in a single :class:`dict`, also returned by the
+    ``__dict__`` attribute for :func:`vars` compatibility. Headers names are
+    interned, values strings of mails parsed by a
+    :class:`~store.PostqueueStore` are shared through its
+    :attr:`~PostqueueStore.strings` pool.
+
     .. seealso::
 
         Python modules:
@@ -67,6 +92,48 @@ class MailHeaders(object):
 
         :rfc:`822` -- Standard for ARPA Internet Text Messages
     """
+    __slots__ = ('_headers',)
+
+    def __init__(self):
+        """Init method"""
+        object.__setattr__(self, '_headers', {})
+
+    def __getattr__(self, name):
+        """Get header values"""
+        try:
+            return self._headers[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        """Set header values"""
+        if isinstance(name, str):
+            name = intern(name)
+        self._headers[name] = value
+
+    def __delattr__(self, name):
+        """Delete header"""
+        try:
+            del self._headers[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __dir__(self):
+        """Known headers names"""
+        return sorted(self._headers)
+
+    def __getstate__(self):
+        """Get headers for pickling"""
+        return self._headers
+
+    def __setstate__(self, state):
+        """Set headers from pickled state"""
+        object.__setattr__(self, '_headers', state)
+
+    @property
+    def __dict__(self):
+        """Headers :class:`dict`"""
+        return self._headers
 
 
 class Mail(object):
@@ -146,6 +213,9 @@ class Mail(object):
                 :ref:`pymailq-configuration`
     """
 
+    __slots__ = ('parsed', 'parse_error', 'qid', 'date', 'status', 'size',
+                 'sender', 'recipients', 'errors', 'head')
+
     def __init__(self, mail_id, size=0, date=None, sender=""):
         """Init method"""
         self.parsed = False
@@ -214,6 +284,12 @@ class Mail(object):
         :func:`~email.message_from_string` function provided by the
         :mod:`email` module.
 
+        If enabled, the :class:`~cache.HeaderCache` instance returned by
+        :func:`~cache.get_header_cache` is checked first with the stamp of
+        :meth:`~store.Mail.queue_file_stamp`, and parsed informations are
+        stored in it. The cache is not used when the mail's queue file
+        cannot be accessed.
+
         .. seealso::
 
             Postfix manual:
@@ -223,6 +299,13 @@ class Mail(object):
         # Reset parsing error message
         self.parse_error = ""
 
+        header_cache = get_header_cache()
+        stamp = None
+        if header_cache is not None:
+            stamp = self.queue_file_stamp()
+        if stamp is not None and header_cache.get(self, stamp):
+            return
+
         child = subprocess.Popen(self.postcat_cmd,
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE)
@@ -236,8 +319,53 @@ class Mail(object):
             self.parse_error = "\n".join(stderr.decode().split('\n')[3:])
             return
 
-        raw_content = ""
-        for line in stdout.decode('utf-8', errors='replace').split('\n'):
+        self._parse_postcat_output(
+                    stdout.decode('utf-8', errors='replace').split('\n'))
+
+        if stamp is not None:
+            header_cache.set([(self, stamp)])
+
+    def queue_file_stamp(self, path=None):
+        """
+        Get a stamp of the mail's queue file to detect its modifications.
+
+        By default, the queue file is searched in the mail's status queue
+        of the spool defined in :attr:`pymailq.CONFIG` attribute under the
+        key 'postfix_spool', with hashed subdirectories set by the
+        'hash_queue_depth' and 'hash_queue_names' keys, see
+        :func:`~queuefile.queue_file_path`.
+
+        :param str path: Queue file path (Default: ``None``)
+        :return: Queue file inode and modification time as :func:`tuple`,
+                 or ``None`` if the queue file cannot be accessed
+        """
+        if path is None:
+            core = CONFIG['core']
+            path = queue_file_path(core['postfix_spool'], self.status,
+                                   self.qid.rstrip("*!"),
+                                   core.get('hash_queue_depth', 1),
+                                   core.get('hash_queue_names',
+                                            ['deferred', 'defer']))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime
+
+    def _parse_postcat_output(self, lines):
+        """
+        Parse message content from Postfix mails content parsing command output.
+
+        Lines are expected as produced by `postcat`_ with ``-q`` option for a
+        single mail. Fields :attr:`~Mail.size`, :attr:`~Mail.date` and
+        :attr:`~Mail.sender` are set from envelope records if still unknown.
+        Regular text records are given to :func:`~email.message_from_string`
+        to set :attr:`~Mail.head` attributes.
+
+        :param list lines: Command's output lines for this mail
+        """
+        raw_content = []
+        for line in lines:
             if self.size == 0 and line.startswith("message_size: "):
                 self.size = int(line[14:].strip().split()[0])
             elif self.date is None and line.startswith("create_time: "):
@@ -246,7 +374,58 @@ class Mail(object):
             elif not len(self.sender) and line.startswith("sender: "):
                 self.sender = line[8:].strip()
             elif line.startswith("regular_text: "):
-                raw_content += "%s\n" % (line[14:],)
+                raw_content.append(line[14:])
+        self._parse_content(raw_content)
+
+    def parse_queue_file(self, path, mode="headers"):
+        """
+        Parse message content directly from its Postfix queue file.
+
+        Unlike :meth:`Mail.parse`, no Postfix command is called. The queue
+        file records are decoded with a :class:`~queuefile.QueueFile` object.
+        Fields :attr:`~Mail.size`, :attr:`~Mail.date`, :attr:`~Mail.sender`
+        and :attr:`~Mail.recipients` are set from envelope records if still
+        unknown. Message content is given to
+        :func:`~email.message_from_string` to set :attr:`~Mail.head`
+        attributes.
+
+        Optionnal argument ``mode`` is given to :meth:`QueueFile.load`. With
+        the ``envelope`` mode, only envelope fields are set and the mail is
+        not considered as parsed.
+
+        Errors encountered while reading the queue file are stored in
+        :attr:`Mail.parse_error` attribute.
+
+        :param str path: Path of the mail's queue file
+        :param str mode: Queue file reading mode (Default: ``headers``)
+        """
+        self.parse_error = ""
+
+        queue_file = QueueFile(path)
+        try:
+            queue_file.load(mode)
+        except (IOError, OSError, ValueError) as exc:
+            self.parse_error = "%s: %s" % (path, str(exc))
+            return
+
+        if self.size == 0:
+            self.size = queue_file.size
+        if self.date is None:
+            self.date = queue_file.date
+        if not len(self.sender):
+            self.sender = queue_file.sender
+        if not len(self.recipients):
+            self.recipients = queue_file.recipients
+        if mode != "envelope":
+            self._parse_content(queue_file.content)
+
+    def _parse_content(self, lines):
+        """
+        Parse message content lines to set :attr:`~Mail.head` attributes.
+
+        :param list lines: Message content lines, headers and body
+        """
+        raw_content = "".join(["%s\n" % (line,) for line in lines])
 
         # For python2.7 compatibility, encode unicode to str
         if not isinstance(raw_content, str):
@@ -254,12 +433,31 @@ class Mail(object):
 
         message = email.message_from_string(raw_content)
 
+        head = self.head
         for mailheader in set(message.keys()):
             value = message.get_all(mailheader)
-            setattr(self.head, mailheader, value)
+            setattr(head, mailheader, value)
+        self.head = head
 
         self.parsed = True
 
+    def _merge_parsed(self, mail):
+        """
+        Update mail with informations parsed in another :class:`~store.Mail`
+        object of the same queue ID, like a copy parsed by a worker process.
+
+        :param mail: Parsed :class:`~store.Mail` object
+        """
+        self.parse_error = mail.parse_error
+        self.parsed = mail.parsed
+        self.size = mail.size
+        self.date = mail.date
+        self.sender = mail.sender
+        head = self.head
+        for mailheader, value in vars(mail.head).items():
+            setattr(head, mailheader, value)
+        self.head = head
+
     @debug
     def dump(self):
         """
@@ -280,19 +478,188 @@ class Mail(object):
         datas = {'postqueue': {},
                  'headers': {}}
 
-        for attr in self.__dict__:
-            if attr[0] != "_" and attr != 'head':
+        for attr in Mail.__slots__:
+            if attr != 'head':
                 datas['postqueue'].update({attr: getattr(self, attr)})
 
-        for mailheader in self.head.__dict__:
-            if mailheader[0] != "_":
-                datas['headers'].update(
-                    {mailheader: getattr(self.head, mailheader)}
-                )
+        head = self.head
+        for mailheader in dir(head):
+            datas['headers'].update({mailheader: getattr(head, mailheader)})
 
         return datas
 
 
+class PostqueueDateParser(object):
+    """
+    Postqueue arrival dates parser.
+
+    Arrival dates from `postqueue`_ output look like ``Tue Apr 29 06:35:05``.
+    Postfix does not precise year in mails timestamps so we consider mails
+    have been sent this year. If gathered date is in the future, mail has been
+    received last year (or NTP problem). This decision is made against a
+    single reference time set at the parser initialization, a new parser
+    should be used for each mails queue load.
+
+    Dates are tokenized without :func:`~datetime.datetime.strptime` and
+    results are memoized with the raw date string as key. Mails in queue
+    usually share the same arrival dates and most of them are never parsed.
+
+    :param datetime.datetime now: Reference time (Default:
+                                  :meth:`datetime.datetime.now`)
+    :param int cache_size: Maximum number of memoized dates
+                           (Default: ``4096``)
+
+    The :class:`~store.PostqueueDateParser` class defines the following
+    attributes:
+
+        .. attribute:: now
+
+            Reference :class:`~datetime.datetime` used to guess dates year.
+
+        .. attribute:: cache_size
+
+            Maximum number of memoized dates. The cache is emptied when this
+            size is reached.
+
+        .. attribute:: months
+
+            Months abbreviated names :class:`dict` to months numbers.
+    """
+    months = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+              'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+
+    def __init__(self, now=None, cache_size=4096):
+        """Init method"""
+        self.now = now if now is not None else datetime.now()
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def parse(self, datestr):
+        """
+        Get the date corresponding to a postqueue arrival date string.
+
+        :param str datestr: Arrival date string like ``Tue Apr 29 06:35:05``,
+                            :func:`bytes` are also accepted.
+        :return: Arrival date and time
+        :rtype: :class:`datetime.datetime`
+
+        :raise ValueError: Date string is not a valid arrival date
+        """
+        date = self._cache.get(datestr)
+        if date is None:
+            date = self._tokenize(datestr)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[datestr] = date
+        return date
+
+    def _tokenize(self, datestr):
+        """
+        Convert an arrival date string without cache.
+
+        :param str datestr: Arrival date string like ``Tue Apr 29 06:35:05``
+        :return: Arrival date and time
+        :rtype: :class:`datetime.datetime`
+
+        :raise ValueError: Date string is not a valid arrival date
+        """
+        if isinstance(datestr, bytes):
+            datestr = datestr.decode('ascii', 'replace')
+        try:
+            _weekday, month, day, clock = datestr.split()
+            hour, minute, second = clock.split(':')
+            date = datetime(self.now.year, self.months[month.lower()],
+                            int(day), int(hour), int(minute), int(second))
+        except (KeyError, ValueError):
+            raise ValueError("invalid arrival date: %s" % (datestr,))
+
+        if date > self.now:
+            date = date - timedelta(days=365)
+        return date
+
+
+class StringPool(object):
+    """
+    Pool of strings shared by mails of a store.
+
+    Senders, recipients and error messages are repeated across many mails of
+    a mails queue. Loaders get these strings through the pool so every
+    occurrence is stored once. Domains of addresses are also computed once
+    per distinct address.
+
+    The :class:`~store.StringPool` class defines the following attributes:
+
+        .. attribute:: strings
+
+            :class:`dict` of pooled strings.
+
+        .. attribute:: decoded
+
+            :class:`dict` of pooled strings by their UTF-8 encoded
+            :func:`bytes` value.
+
+        .. attribute:: domains
+
+            :class:`dict` of pooled domains by address.
+    """
+
+    def __init__(self):
+        """Init method"""
+        self.strings = {}
+        self.decoded = {}
+        self.domains = {}
+
+    def __len__(self):
+        """Number of pooled strings"""
+        return len(self.strings)
+
+    def intern(self, value):
+        """
+        Get the pooled string equal to value.
+
+        :param str value: String to pool
+        :return: Pooled string
+        :rtype: :func:`str`
+        """
+        return self.strings.setdefault(value, value)
+
+    def decode(self, value):
+        """
+        Get the pooled string of an UTF-8 encoded value.
+
+        :param bytes value: Encoded string
+        :return: Pooled string
+        :rtype: :func:`str`
+        """
+        string = self.decoded.get(value)
+        if string is None:
+            string = self.intern(value.decode('utf-8', 'replace'))
+            self.decoded[value] = string
+        return string
+
+    def domain(self, address):
+        """
+        Get the domain of an address.
+
+        :param str address: Mail address
+        :return: Pooled domain or ``None`` if address has no domain part
+        """
+        try:
+            return self.domains[address]
+        except KeyError:
+            domain = None
+            if '@' in address:
+                domain = self.intern(address.split('@', 1)[1])
+            self.domains[address] = domain
+            return domain
+
+    def reset(self):
+        """Empty the pool"""
+        self.strings = {}
+        self.decoded = {}
+        self.domains = {}
+
+
 class PostqueueStore(object):
     """
     Postfix mails queue informations storage.
@@ -306,7 +673,67 @@ class PostqueueStore(object):
 
         .. attribute:: mails
 
-            Loaded :class:`MailClass` objects :func:`list`.
+            Loaded :class:`MailClass` objects :attr:`MailListClass` instance.
+
+        .. attribute:: strings
+
+            :class:`~store.StringPool` of senders, recipients, domains,
+            errors and headers values of loaded mails. The pool is emptied on
+            each
+            :meth:`~store.PostqueueStore.load` call.
+
+        .. attribute:: generation
+
+            Counter incremented each time :attr:`~PostqueueStore.mails`
+            content is replaced, by :meth:`~store.PostqueueStore.load` and
+            :meth:`~store.PostqueueStore.reload` methods. Call
+            :meth:`~store.PostqueueStore.touch` after modifying mails to
+            invalidate dependent structures.
+
+        .. attribute:: qids
+
+            :class:`dict` of positions of mails in
+            :attr:`~PostqueueStore.mails`, by mail ID. Rebuilt on
+            :meth:`~store.PostqueueStore.touch` call, when mails are loaded
+            or modified, and used by :meth:`~store.PostqueueStore.get` and
+            :class:`~selector.MailSelector` IDs lookups.
+
+        .. attribute:: updates
+
+            Changes made by the last :meth:`~store.PostqueueStore.reload`
+            call as a :class:`dict`, or ``None`` after a
+            :meth:`~store.PostqueueStore.load` call. Known keys are:
+
+                - ``generation``: :attr:`~PostqueueStore.generation` of the
+                  store before reload
+                - ``positions``: :func:`list` of new positions of mails, by
+                  position before reload. Position is ``-1`` for removed or
+                  modified mails.
+                - ``changed``: :func:`list` of positions of added or
+                  modified mails
+
+            Used by :class:`~selector.MailSelector` to only check changed
+            mails against its filters.
+
+        .. attribute:: index
+
+            :class:`~index.StoreIndex` of loaded mails, used by
+            :class:`~selector.MailSelector` exact lookups. Indexes are built
+            on first use for the current :attr:`~PostqueueStore.generation`.
+
+        .. attribute:: arrays
+
+            :class:`~vectorized.MailArrays` snapshot of loaded mails, used by
+            :class:`~index.StoreIndex` range lookups when
+            :attr:`~PostqueueStore.use_arrays` is set. Arrays are exported
+            on first use for the current :attr:`~PostqueueStore.generation`
+            and reused by :meth:`~store.PostqueueStore.summary`.
+
+        .. attribute:: use_arrays
+
+            Controls whether :attr:`~PostqueueStore.arrays` are used instead
+            of Python loops over mails. Ignored if :mod:`numpy` is not
+            installed. Default is ``True``.
 
         .. attribute:: loaded_at
 
@@ -323,11 +750,49 @@ class PostqueueStore(object):
             the key 'list_queue'. Command and arguments list is build on call
             with the configuration data.
 
+        .. attribute:: postqueue_json_cmd
+
+            :obj:`list` object to store Postfix command and arguments to view
+            the mails queue content in JSON format. This property use Postfix
+            command defined in :attr:`pymailq.CONFIG` attribute under the key
+            'list_queue_json'.
+
+        .. attribute:: postqueue_bufsize
+
+            Size in bytes of chunks read from the postqueue command output
+            when mails queue is streamed with
+            :meth:`~store.PostqueueStore._stream_postqueue_output`.
+            Default is ``65536``.
+
         .. attribute:: spool_path
 
             Postfix spool path string.
             Default is ``"/var/spool/postfix"``.
 
+        .. attribute:: hash_queue_depth
+
+            Number of subdirectory levels of hashed Postfix queues. This
+            property is read from :attr:`pymailq.CONFIG` attribute under the
+            key 'hash_queue_depth'. Default is ``1``.
+
+        .. attribute:: hash_queue_names
+
+            Names :func:`list` of hashed Postfix queues. This property is
+            read from :attr:`pymailq.CONFIG` attribute under the key
+            'hash_queue_names'. Default is ``['deferred', 'defer']``.
+
+        .. attribute:: fetch_mailstatus
+
+            Postfix queues searched by :meth:`~store.PostqueueStore.fetch`,
+            in search order.
+            Default is ``['incoming', 'active', 'deferred', 'hold']``.
+
+        .. attribute:: spool_workers
+
+            Number of threads walking spool directories in
+            :meth:`~store.PostqueueStore._load_from_spool` method.
+            Default is ``4``.
+
         .. attribute:: postqueue_mailstatus
 
             Postfix known queued mail status list.
@@ -352,11 +817,43 @@ class PostqueueStore(object):
             Default used regular expression is:
             ``r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]+$"``
 
+        .. attribute:: postqueue_record_re
+
+            Python compiled regular expression object (:class:`re.RegexObject`)
+            provided by :func:`re.compile` method to match mails, errors and
+            recipients records in bytes of postqueue command output. Used by
+            :meth:`~store.PostqueueStore._load_from_file` method.
+
+        .. attribute:: postcat_chunk_size
+
+            Maximum number of mails parsed with a single Postfix mails content
+            parsing command by :meth:`~store.PostqueueStore.parse_mails`.
+            Default is ``500``.
+
+        .. attribute:: postcat_file_re
+
+            Python compiled regular expression object (:class:`re.RegexObject`)
+            provided by :func:`re.compile` method to match the first line of
+            each mail in postcat command output.
+            Default used regular expression is:
+            ``r"^\\*\\*\\* ENVELOPE RECORDS (\\S+) \\*\\*\\*$"``
+
+        .. attribute:: postcat_word_re
+
+            Python compiled regular expression object (:class:`re.RegexObject`)
+            provided by :func:`re.compile` method to find queue IDs in postcat
+            command error messages.
+
         .. attribute:: MailClass
 
             The class used to manipulate/parse mails individually.
             Default is :class:`~store.Mail`.
 
+        .. attribute:: MailListClass
+
+            The class used to store loaded mails in
+            :attr:`~PostqueueStore.mails` attribute. Default is :func:`list`.
+
     .. seealso::
 
         Python modules:
@@ -370,21 +867,180 @@ class PostqueueStore(object):
         :rfc:`3696` -- Checking and Transformation of Names
     """
     postqueue_cmd = None
+    postqueue_json_cmd = None
+    postqueue_bufsize = 65536
     spool_path = None
     postqueue_mailstatus = ['active', 'deferred', 'hold']
+    fetch_mailstatus = ['incoming', 'active', 'deferred', 'hold']
+    hash_queue_depth = None
+    hash_queue_names = None
+    spool_workers = 4
+    use_arrays = True
     mail_id_re = re.compile(r"^([A-F0-9]{8,12}|[B-Zb-z0-9]{11,16})[*!]?$")
     mail_addr_re = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]+$")
+    postqueue_record_re = re.compile(
+        br"^[ \t]*(?:"
+        br"(?P<qid>(?:[A-F0-9]{8,12}|[B-Zb-z0-9]{11,16})[*!]?)[ \t]+"
+        br"(?P<size>[0-9]+)[ \t]+(?P<date>[A-Za-z]{3}[ \t]+[A-Za-z]{3}[ \t]+"
+        br"[0-9]{1,2}[ \t]+[0-9]{2}:[0-9]{2}:[0-9]{2})[ \t]+(?P<sender>[^\s]+)"
+        br"|(?P<error>\([^\n]*)"
+        br"|(?P<rcpt>[A-Za-z0-9._%+][A-Za-z0-9._%+-]*@[A-Za-z0-9.-]+"
+        br"\.[A-Za-z]+)"
+        br")[ \t\r]*$", re.M)
+    postcat_chunk_size = 500
+    postcat_file_re = re.compile(r"^\*\*\* ENVELOPE RECORDS (\S+) \*\*\*$")
+    postcat_word_re = re.compile(r"[A-Za-z0-9]+")
     MailClass = Mail
+    MailListClass = list
 
     def __init__(self):
         """Init method"""
         self.spool_path = CONFIG['core']['postfix_spool']
+        self.hash_queue_depth = CONFIG['core'].get('hash_queue_depth', 1)
+        self.hash_queue_names = list(CONFIG['core'].get(
+            'hash_queue_names', ['deferred', 'defer']))
         self.postqueue_cmd = CONFIG['commands']['list_queue']
+        self.postqueue_json_cmd = list(CONFIG['commands']['list_queue_json'])
         if CONFIG['commands']['use_sudo']:
             self.postqueue_cmd.insert(0, 'sudo')
+            self.postqueue_json_cmd.insert(0, 'sudo')
 
         self.loaded_at = None
-        self.mails = []
+        self.strings = StringPool()
+        self.generation = 0
+        self.qids = {}
+        self.updates = None
+        self.index = StoreIndex(self)
+        self.arrays = vectorized.MailArrays(self)
+        self.mails = self.MailListClass()
+
+    def touch(self):
+        """
+        Mark loaded mails as modified.
+
+        Increments the store :attr:`~PostqueueStore.generation` so indexes
+        are rebuilt on their next use, and rebuilds the
+        :attr:`~PostqueueStore.qids` map of mails positions.
+        """
+        self.generation += 1
+        self.qids = dict((qid, position) for position, qid in
+                         enumerate(self.get_qids()))
+
+    def get_arrays(self):
+        """
+        Get the :attr:`~PostqueueStore.arrays` snapshot of loaded mails.
+
+        :return: :class:`~vectorized.MailArrays` object, or ``None`` if
+                 :attr:`~PostqueueStore.use_arrays` is not set or if
+                 :mod:`numpy` is not installed
+        """
+        if not self.use_arrays or vectorized.numpy is None:
+            return None
+        return self.arrays
+
+    def get_qids(self):
+        """
+        Get IDs of loaded mails.
+
+        :return: Mails IDs, in :attr:`~PostqueueStore.mails` order
+        :rtype: :func:`list`
+        """
+        return [mail.qid for mail in self.mails]
+
+    def get(self, qid, default=None):
+        """
+        Get a loaded mail by ID.
+
+        The mail is found with the :attr:`~PostqueueStore.qids` map, without
+        scanning loaded mails.
+
+        :param str qid: Mail ID
+        :param default: Value returned if the mail is not loaded
+        :return: :class:`~store.Mail` object or ``default``
+        """
+        position = self.qids.get(qid)
+        if position is None:
+            return default
+        return self.mails[position]
+
+    def get_queue_file_path(self, queue_name, qid):
+        """
+        Get path of a queue file in the Postfix spool.
+
+        Queue files of queues listed in
+        :attr:`~PostqueueStore.hash_queue_names` are stored in
+        :attr:`~PostqueueStore.hash_queue_depth` levels of subdirectories
+        named after the queue ID, see :func:`~queuefile.queue_file_path`.
+
+        :param str queue_name: Postfix queue name, like ``deferred``
+        :param str qid: Mail ID
+        :return: Queue file path
+        :rtype: :func:`str`
+        """
+        return queue_file_path(self.spool_path, queue_name, qid,
+                               self.hash_queue_depth, self.hash_queue_names)
+
+    @debug
+    def fetch(self, qid, parse=False):
+        """
+        Fetch a single mail from the spool, without loading mails queue.
+
+        The mail queue file is searched in the
+        :attr:`~PostqueueStore.fetch_mailstatus` queues of
+        :attr:`~PostqueueStore.spool_path` with
+        :meth:`~store.PostqueueStore.get_queue_file_path` and read with
+        :meth:`Mail.parse_queue_file`. The mail status is the name of the
+        queue it was found in. Errors of deferred mails are read from their
+        ``defer`` log with :meth:`~store.PostqueueStore._read_defer_log`.
+
+        Fetched mail is not added to :attr:`~PostqueueStore.mails`.
+
+        :param str qid: Mail ID, optionally followed by ``*`` or ``!``
+        :param bool parse: Controls whether mail headers are parsed or not.
+        :return: :class:`~store.Mail` object, or ``None`` if no queue file
+                 is found for this ID
+        """
+        qid = qid.rstrip("*!")
+        if not self._is_mail_id(qid):
+            return None
+
+        mode = "headers" if parse else "envelope"
+        for status in self.fetch_mailstatus:
+            path = self.get_queue_file_path(status, qid)
+            if not os.path.isfile(path):
+                continue
+            mail = self.MailClass(qid)
+            mail.status = status
+            mail.parse_queue_file(path, mode)
+            if status == "deferred":
+                mail.errors = self._read_defer_log(qid)
+            return mail
+        return None
+
+    def _read_defer_log(self, qid):
+        """
+        Read errors of a deferred mail from its defer log.
+
+        Delivery errors are read from the ``reason`` attributes of the
+        recipients records. Like in `postqueue`_ output, consecutive
+        identical errors are only reported once.
+
+        :param str qid: Mail ID
+        :return: Error messages :func:`list`
+        """
+        errors = []
+        try:
+            with open(self.get_queue_file_path("defer", qid), "rb") as log:
+                for line in log:
+                    line = line.decode('utf-8', 'replace').rstrip("\n")
+                    if not line.startswith("reason="):
+                        continue
+                    reason = line[7:]
+                    if not len(errors) or errors[-1] != reason:
+                        errors.append(reason)
+        except (IOError, OSError):
+            pass
+        return errors
 
     @property
     @debug
@@ -401,31 +1057,40 @@ class PostqueueStore(object):
         return headers
 
     @debug
-    def _get_postqueue_output(self):
+    def _stream_postqueue_output(self, command=None):
         """
-        Get Postfix postqueue command output.
+        Stream Postfix postqueue command output.
 
-        This method used the postfix command defined in
-        :attr:`~PostqueueStore.postqueue_cmd` attribute to view the mails queue
-        content.
+        The command's output is never fully stored in memory. The child's
+        *stdout* is read by chunks of :attr:`~PostqueueStore.postqueue_bufsize`
+        bytes and lines are yielded as soon as they are available, allowing
+        callers to parse the mails queue while the command is still running.
 
-        Command defined in :attr:`~PostqueueStore.postqueue_cmd` attribute is
-        runned using a :class:`subprocess.Popen` instance.
+        Headers and footers lines are yielded as is and must be ignored by
+        the caller.
 
-        :return: Command's output lines.
-        :rtype: :func:`list`
+        :param list command: Command and arguments to run. (Default:
+                             :attr:`~PostqueueStore.postqueue_cmd`)
+        :return: Generator of command's output lines.
+        :rtype: :func:`generator`
 
         .. seealso::
 
             Python module:
                 :mod:`subprocess` -- Subprocess management
         """
-        child = subprocess.Popen(self.postqueue_cmd,
-                                 stdout=subprocess.PIPE)
-        stdout = child.communicate()[0]
+        if command is None:
+            command = self.postqueue_cmd
 
-        # return lines list without the headers and footers
-        return [line.strip() for line in stdout.decode().split('\n')][1:-2]
+        child = subprocess.Popen(command,
+                                 bufsize=self.postqueue_bufsize,
+                                 stdout=subprocess.PIPE)
+        try:
+            for line in iter(child.stdout.readline, b''):
+                yield line.decode().strip()
+        finally:
+            child.stdout.close()
+            child.wait()
 
     def _is_mail_id(self, mail_id):
         """
@@ -444,13 +1109,210 @@ class PostqueueStore(object):
             return False
         return True
 
+    @debug
+    def parse_mails(self, mails=None, chunk_size=None, workers=None):
+        """
+        Parse several mails content with batched postcat commands.
+
+        Unlike :meth:`Mail.parse`, the Postfix mails content parsing command
+        defined in :attr:`pymailq.CONFIG` attribute under the key
+        'cat_message' is called once for a chunk of mails. Command's output is
+        splitted back for each mail using the ``*** ENVELOPE RECORDS ***``
+        separators and parsed with :meth:`Mail._parse_postcat_output`.
+
+        Errors reported by the command for a specific queue ID are stored in
+        :attr:`Mail.parse_error` attribute of the related mail. Mails left
+        unprocessed after a command failure are sent again in a new command.
+
+        Mails found in the :class:`~cache.HeaderCache` instance returned by
+        :func:`~cache.get_header_cache` are not parsed again, and newly
+        parsed mails are stored in this cache.
+
+        Chunks may be parsed in parallel by a pool of ``workers`` processes.
+        Default number of workers is read from :attr:`pymailq.CONFIG`
+        attribute under the key 'parse_workers' and is always limited by the
+        'max_parse_workers' key. Mails are then distributed evenly between
+        workers and parsed informations are merged back in the given
+        :class:`~store.Mail` objects with :meth:`Mail._merge_parsed`.
+
+        :param list mails: :class:`~store.Mail` objects to parse
+                           (Default: :attr:`~PostqueueStore.mails`)
+        :param int chunk_size: Maximum number of mails per command (Default:
+                               :attr:`~PostqueueStore.postcat_chunk_size`)
+        :param int workers: Number of parsing processes (Default: from
+                            :attr:`pymailq.CONFIG`)
+
+        .. seealso::
+
+            Postfix manual:
+                `postcat`_ -- Show Postfix queue file contents
+
+            Python's module:
+                :mod:`multiprocessing` -- Process-based parallelism
+        """
+        if mails is None:
+            mails = self.mails
+        if chunk_size is None:
+            chunk_size = self.postcat_chunk_size
+        if workers is None:
+            workers = CONFIG['core']['parse_workers']
+        workers = max(1, min(workers, CONFIG['core']['max_parse_workers']))
+
+        mails = [mail for mail in mails]
+        for mail in mails:
+            mail.parse_error = ""
+        requested = mails
+
+        header_cache = get_header_cache()
+        if header_cache is not None:
+            stamps = dict((mail.qid, mail.queue_file_stamp(
+                self.get_queue_file_path(mail.status, mail.qid.rstrip("*!"))))
+                for mail in mails)
+            mails = [mail for mail in mails if stamps[mail.qid] is None or
+                     not header_cache.get(mail, stamps[mail.qid])]
+
+        if workers > 1:
+            # Spread mails over every workers
+            chunk_size = max(1, min(chunk_size, -(-len(mails) // workers)))
+        chunks = [mails[index:index + chunk_size]
+                  for index in range(0, len(mails), chunk_size)]
+
+        if workers == 1 or len(chunks) < 2:
+            for chunk in chunks:
+                self._parse_mails_chunk(chunk)
+        else:
+            # Only send envelope fields needed to parse mails to workers
+            tasks = [(self.__class__, CONFIG['commands'],
+                      [self.MailClass(mail.qid, mail.size, mail.date,
+                                      mail.sender) for mail in chunk])
+                     for chunk in chunks]
+            pool = multiprocessing.Pool(processes=min(workers, len(chunks)))
+            try:
+                results = pool.imap(_parse_mails_process, tasks)
+                for chunk, parsed_chunk in zip(chunks, results):
+                    for mail, parsed_mail in zip(chunk, parsed_chunk):
+                        mail._merge_parsed(parsed_mail)
+            finally:
+                pool.terminate()
+                pool.join()
+
+        if header_cache is not None:
+            header_cache.set([(mail, stamps[mail.qid]) for mail in mails
+                              if mail.parsed and stamps[mail.qid] is not None])
+
+        self._pool_headers(requested)
+
+    def _pool_headers(self, mails):
+        """
+        Share headers values strings of parsed mails through
+        :attr:`~PostqueueStore.strings` pool.
+
+        :param list mails: :class:`~store.Mail` objects
+        """
+        intern = self.strings.intern
+        for mail in mails:
+            if not mail.parsed:
+                continue
+            headers = vars(mail.head)
+            for mailheader, value in headers.items():
+                if not isinstance(value, list):
+                    continue
+                try:
+                    headers[mailheader] = [intern(entry) for entry in value]
+                except TypeError:
+                    # Unhashable values, like email.header.Header objects
+                    pass
+
+    @classmethod
+    def _parse_mails_chunk(cls, mails):
+        """
+        Parse a chunk of mails content with batched postcat commands.
+
+        :param list mails: :class:`~store.Mail` objects to parse
+        """
+        pending = [mail for mail in mails]
+        while len(pending):
+            pending = cls._postcat_mails(pending)
+
+    @classmethod
+    def _postcat_mails(cls, mails):
+        """
+        Parse a chunk of mails content with a single postcat command.
+
+        :param list mails: :class:`~store.Mail` objects to parse
+        :return: Mails left unprocessed which should be parsed again
+        :rtype: :func:`list`
+        """
+        postcat_cmd = CONFIG['commands']['cat_message'] + [
+                                                    mail.qid for mail in mails]
+        if CONFIG['commands']['use_sudo']:
+            postcat_cmd.insert(0, 'sudo')
+
+        child = subprocess.Popen(postcat_cmd,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        stdout, stderr = child.communicate()
+
+        mails_by_qid = dict((mail.qid, mail) for mail in mails)
+        processed = set()
+
+        output = stdout.decode('utf-8', errors='replace').split('\n')
+        for qid, lines in cls._split_postcat_output(output):
+            if qid in mails_by_qid and qid not in processed:
+                mails_by_qid[qid]._parse_postcat_output(lines)
+                processed.add(qid)
+
+        # Errors reported for a specific queue ID are associated to its mail
+        stderr = stderr.decode('utf-8', errors='replace').split('\n')
+        for line in stderr:
+            for word in cls.postcat_word_re.findall(line):
+                if word in mails_by_qid and word not in processed:
+                    mails_by_qid[word].parse_error = line.strip()
+                    processed.add(word)
+
+        unprocessed = [mail for mail in mails if mail.qid not in processed]
+        if len(unprocessed) == len(mails):
+            # Nothing done, ignore first 3 lines of verbose informations.
+            # See Mail.parse method.
+            for mail in unprocessed:
+                mail.parse_error = "\n".join(stderr[3:])
+            return []
+
+        return unprocessed
+
+    @classmethod
+    def _split_postcat_output(cls, lines):
+        """
+        Split postcat command output for several mails.
+
+        :param list lines: Command's output lines
+        :return: Generator of ``(qid, lines)`` tuples
+        :rtype: :func:`generator`
+        """
+        qid = None
+        mail_lines = []
+        for line in lines:
+            match = cls.postcat_file_re.match(line)
+            if match is not None:
+                if qid is not None:
+                    yield qid, mail_lines
+                qid = match.group(1).split('/')[-1]
+                mail_lines = []
+            elif qid is not None:
+                mail_lines.append(line)
+
+        if qid is not None:
+            yield qid, mail_lines
+
     @debug
     def _load_from_postqueue(self, filename=None, parse=False):
         """
         Load content from postfix queue using postqueue command output.
 
-        Output lines from :attr:`~store.PostqueueStore._get_postqueue_output`
-        are parsed to build :class:`~store.Mail` objects. Sample Postfix queue
+        Output lines from
+        :attr:`~store.PostqueueStore._stream_postqueue_output` are parsed to
+        build :class:`~store.Mail` objects as soon as they are read, while the
+        command is still running. Sample Postfix queue
         control tool (`postqueue`_) output::
 
             C0004979687     4769 Tue Apr 29 06:35:05  sender@domain.com
@@ -491,68 +1353,147 @@ class PostqueueStore(object):
         :param bool parse: Controls whether loaded mails are parsed or not.
         """
         if filename is None:
-            postqueue_output = self._get_postqueue_output()
+            postqueue_output = self._stream_postqueue_output()
         else:
-            postqueue_output = open(filename).readlines()
+            postqueue_output = open(filename)
 
+        parse_date = PostqueueDateParser().parse
+        intern = self.strings.intern
         mail = None
-        for line in postqueue_output:
-            line = line.strip()
+        try:
+            for line in postqueue_output:
+                line = line.strip()
+
+                # Headers and footers start with dash (-)
+                if line.startswith('-'):
+                    continue
+                # Mails are blank line separated
+                if not len(line):
+                    continue
+
+                fields = line.split()
+                if "(" == fields[0][0]:
+                    # Store error message without parenthesis: [1:-1]
+                    # gathered errors must be associated with specific
+                    # recipients
+                    # TODO: change recipients or errors structures to link
+                    #       these objects together.
+                    mail.errors.append(intern(" ".join(fields)[1:-1]))
+                else:
+                    if self._is_mail_id(fields[0]):
+                        date = parse_date(" ".join(fields[2:-1]))
+                        mail = self.MailClass(fields[0], size=fields[1],
+                                              date=date,
+                                              sender=intern(fields[-1]))
+                        self.mails.append(mail)
+                    elif mail is not None:
+                        # Email address validity check can be tricky. RFC3696
+                        # talks about. Fow now, we use a simple regular
+                        # expression to match most of email addresses.
+                        rcpt_email_addr = " ".join(fields)
+                        if self.mail_addr_re.match(rcpt_email_addr):
+                            mail.recipients.append(intern(rcpt_email_addr))
+        finally:
+            # stop the command or close the file, even on parsing errors
+            postqueue_output.close()
 
-            # Headers and footers start with dash (-)
-            if line.startswith('-'):
-                continue
-            # Mails are blank line separated
-            if not len(line):
-                continue
+        if parse:
+            self.parse_mails()
 
-            fields = line.split()
-            if "(" == fields[0][0]:
-                # Store error message without parenthesis: [1:-1]
-                # gathered errors must be associated with specific recipients
-                # TODO: change recipients or errors structures to link these
-                #       objects together.
-                mail.errors.append(" ".join(fields)[1:-1])
-            else:
-                if self._is_mail_id(fields[0]):
-                    # postfix does not precise year in mails timestamps so
-                    # we consider mails have been sent this year.
-                    # If gathered date is in the future:
-                    # mail has been received last year (or NTP problem).
-                    now = datetime.now()
-                    datestr = "{0} {1}".format(" ".join(fields[2:-1]), now.year)
-                    date = datetime.strptime(datestr, "%a %b %d %H:%M:%S %Y")
-                    if date > now:
-                        date = date - timedelta(days=365)
-
-                    mail = self.MailClass(fields[0], size=fields[1],
-                                          date=date,
-                                          sender=fields[-1])
-                    self.mails.append(mail)
-                else:
-                    # Email address validity check can be tricky. RFC3696 talks
-                    # about. Fow now, we use a simple regular expression to
-                    # match most of email addresses.
-                    rcpt_email_addr = " ".join(fields)
-                    if self.mail_addr_re.match(rcpt_email_addr):
-                        mail.recipients.append(rcpt_email_addr)
+    @debug
+    def _load_from_postqueue_json(self, filename=None, parse=False):
+        """
+        Load content from postfix queue using postqueue JSON output.
+
+        Output lines from the command defined in
+        :attr:`~PostqueueStore.postqueue_json_cmd` attribute are parsed to
+        build :class:`~store.Mail` objects. Each line is a JSON object
+        describing a single mail, as produced by `postqueue`_ ``-j`` since
+        Postfix 3.1::
+
+            {"queue_name": "deferred", "queue_id": "C0004979687",
+             "arrival_time": 1398746105, "message_size": 4769,
+             "sender": "sender@domain.com",
+             "recipients": [
+                {"address": "first.rcpt@remote1.org",
+                 "delay_reason": "error message from mx.remote1.org"}
+             ]}
+
+        Unlike :meth:`~store.PostqueueStore._load_from_postqueue`, mails
+        arrival date is a full timestamp and :attr:`~Mail.status` is always
+        set from the ``queue_name`` field. Recipients delay reasons are stored
+        in :attr:`~Mail.errors` attribute, consecutive recipients sharing the
+        same reason produce a single error message like in `postqueue`_ text
+        output.
+
+        Optionnal argument ``filename`` can be set with a file containing
+        output of the `postqueue`_ ``-j`` command. In this case, lines are
+        directly read from ``filename`` and parsed, the `postqueue`_ command
+        is never used.
+
+        Optionnal argument ``parse`` controls whether mails are parsed or not.
+        This is useful to load every known mail headers for later filtering.
+
+        :param str filename: File to load mails from
+        :param bool parse: Controls whether loaded mails are parsed or not.
+        """
+        if filename is None:
+            postqueue_output = self._stream_postqueue_output(
+                                                    self.postqueue_json_cmd)
+        else:
+            postqueue_output = open(filename)
+
+        intern = self.strings.intern
+        try:
+            for line in postqueue_output:
+                line = line.strip()
+                if not len(line):
+                    continue
+
+                entry = json.loads(line)
+                mail = self.MailClass(entry['queue_id'],
+                                      size=entry['message_size'],
+                                      date=datetime.fromtimestamp(
+                                                        entry['arrival_time']),
+                                      sender=intern(entry['sender']))
+                mail.status = entry['queue_name']
+
+                for recipient in entry['recipients']:
+                    mail.recipients.append(intern(recipient['address']))
+                    reason = recipient.get('delay_reason')
+                    if reason and (not len(mail.errors) or
+                                   mail.errors[-1] != reason):
+                        mail.errors.append(intern(reason))
+
+                self.mails.append(mail)
+        finally:
+            # stop the command or close the file, even on parsing errors
+            postqueue_output.close()
 
         if parse:
-            print("parsing mails")
-            [mail.parse() for mail in self.mails]
+            self.parse_mails()
 
     @debug
     def _load_from_spool(self, parse=True):
         """
         Load content from postfix queue using files from spool.
 
-        Mails are loaded using the command defined in
-        :attr:`~PostqueueStore.postqueue_cmd` attribute. Some informations may
+        Mails are loaded reading queue files found in the
+        :attr:`~PostqueueStore.postqueue_mailstatus` directories of
+        :attr:`~PostqueueStore.spool_path`. Hashed subdirectories are
+        walked with :func:`os.scandir` by a pool of
+        :attr:`~PostqueueStore.spool_workers` threads. Some informations may
         be missing using the :meth:`~store.PostqueueStore._load_from_spool`
-        method, including at least :attr:`Mail.status` field.
+        method, including at least :attr:`Mail.errors` field.
+
+        Mails are read from their queue file with
+        :meth:`Mail.parse_queue_file`, without any call to Postfix commands.
+        The spool directory may then be a copy of a Postfix spool. Only
+        envelope records are read, unless mails are parsed.
 
         Optionnal argument ``parse`` controls whether mails are parsed or not.
         This is useful to load every known mail headers for later filtering.
+        Reading of parsed mails stops at the end of headers.
 
         Loaded mails are stored as :class:`~store.Mail` objects in
         :attr:`~PostqueueStore.mails` attribute.
@@ -564,34 +1505,166 @@ class PostqueueStore(object):
             Be aware that parsing mails on disk is slow and can lead to
             high load usage on system with large mails queue.
         """
+        mode = "headers" if parse else "envelope"
+
+        tasks = []
         for status in self.postqueue_mailstatus:
-            for fs_data in os.walk("%s/%s" % (self.spool_path, status)):
-                for mail_id in fs_data[2]:
-                    mail = self.MailClass(mail_id)
-                    mail.status = status
+            path = os.path.join(self.spool_path, status)
+            try:
+                files, directories = self._scan_spool_directory(path)
+            except OSError:
+                continue
+            tasks.append((status, path, files, mode))
+            tasks += [(status, directory, None, mode)
+                      for directory in directories]
+
+        pool = ThreadPool(processes=max(1, self.spool_workers))
+        try:
+            for mails in pool.imap(self._load_spool_directory, tasks):
+                self.mails.extend(mails)
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def _scan_spool_directory(path):
+        """
+        List files and subdirectories of a spool directory.
 
-                    mail.parse()
+        :param str path: Spool directory path
+        :return: Files names and subdirectories paths :func:`list`
+        :rtype: :func:`tuple`
+        """
+        files = []
+        directories = []
+        if scandir is None:
+            for name in os.listdir(path):
+                entry_path = os.path.join(path, name)
+                if os.path.isdir(entry_path):
+                    directories.append(entry_path)
+                else:
+                    files.append(name)
+        else:
+            for entry in scandir(path):
+                if entry.is_dir():
+                    directories.append(entry.path)
+                else:
+                    files.append(entry.name)
+        return files, directories
 
-                    self.mails.append(mail)
+    def _load_spool_directory(self, task):
+        """
+        Load mails from a spool directory and its subdirectories.
+
+        :param tuple task: Mails status, directory path, files names or
+                           ``None`` to scan the directory, and queue files
+                           reading mode.
+        :return: Loaded :class:`~store.Mail` objects
+        :rtype: :func:`list`
+        """
+        status, path, files, mode = task
+        directories = []
+        if files is None:
+            try:
+                files, directories = self._scan_spool_directory(path)
+            except OSError:
+                return []
+
+        intern = self.strings.intern
+        mails = []
+        for mail_id in files:
+            mail = self.MailClass(mail_id)
+            mail.status = status
+            mail.parse_queue_file(os.path.join(path, mail_id), mode)
+            mail.sender = intern(mail.sender)
+            mail.recipients = [intern(rcpt) for rcpt in mail.recipients]
+            mails.append(mail)
+        self._pool_headers(mails)
+
+        for directory in directories:
+            mails += self._load_spool_directory((status, directory,
+                                                 None, mode))
+        return mails
 
     @debug
-    def _load_from_file(self, filename):
-        """Unimplemented method"""
+    def _load_from_file(self, filename, parse=False):
+        """
+        Load content from a file containing postqueue command output.
+
+        The file is mapped in memory with :mod:`mmap` and parsed as bytes with
+        the :class:`re.RegexObject` stored in
+        :attr:`~PostqueueStore.postqueue_record_re` attribute. Lines are never
+        copied to Python strings, only matched fields are decoded to build
+        :class:`~store.Mail` objects. Memory usage does not depend on the
+        file size, allowing to analyse huge archived mails queue dumps.
+
+        Parsing rules are the same as the
+        :meth:`~store.PostqueueStore._load_from_postqueue` method ones.
+
+        Optionnal argument ``parse`` controls whether mails are parsed or not.
+        This is useful to load every known mail headers for later filtering.
+
+        :param str filename: File to load mails from
+        :param bool parse: Controls whether loaded mails are parsed or not.
+
+        .. seealso::
+
+            Python module:
+                :mod:`mmap` -- Memory-mapped file support
+        """
+        with open(filename, "rb") as dump:
+            if not os.fstat(dump.fileno()).st_size:
+                return
+            dump_map = mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if hasattr(dump_map, "madvise"):
+            dump_map.madvise(mmap.MADV_SEQUENTIAL)
+
+        try:
+            parse_date = PostqueueDateParser().parse
+            decode = self.strings.decode
+            mail = None
+            for record in self.postqueue_record_re.finditer(dump_map):
+                qid, size, datestr, sender, error, rcpt = record.groups()
+                if qid is not None:
+                    date = parse_date(datestr)
+                    mail = self.MailClass(qid.decode(), size=size, date=date,
+                                          sender=decode(sender))
+                    self.mails.append(mail)
+                elif mail is None:
+                    # Ignore records found before the first mail
+                    continue
+                elif rcpt is not None:
+                    mail.recipients.append(decode(rcpt))
+                else:
+                    # Store error message without parenthesis: [1:-1]
+                    error = b" ".join(error.split())[1:-1]
+                    mail.errors.append(decode(error))
+        finally:
+            dump_map.close()
+
+        if parse:
+            self.parse_mails()
 
     @debug
-    def load(self, method="postqueue", filename=None, parse=False):
+    def load(self, method=None, filename=None, parse=False):
         """
         Load content from postfix mails queue.
 
         Mails are loaded using postqueue command line tool or reading directly
         from spool. The optionnal argument, if present, is a method string and
         specifies the method used to gather mails informations. By default,
-        method is set to ``"postqueue"`` and the standard Postfix queue
-        control tool: `postqueue`_ is used.
+        method is read from :attr:`pymailq.CONFIG` attribute under the key
+        'load_method', which defaults to ``"postqueue"`` and the standard
+        Postfix queue control tool: `postqueue`_ is used. Mails loaded from a
+        file always use the ``"postqueue"`` method by default.
 
         Optionnal argument ``parse`` controls whether mails are parsed or not.
         This is useful to load every known mail headers for later filtering.
 
+        When mails are loaded from Postfix queue, entries of mails no longer
+        in queue are evicted from the parsed headers cache.
+
         :param str method: Method used to load mails from Postfix queue
         :param str filename: File to load mails from
         :param bool parse: Controls whether loaded mails are parsed or not.
@@ -601,14 +1674,90 @@ class PostqueueStore(object):
         """
         # releasing memory
         del self.mails
+        self.strings.reset()
         gc.collect()
 
-        self.mails = []
+        self.mails = self.MailListClass()
+        if method is None:
+            method = "postqueue"
+            if filename is None:
+                method = CONFIG['core'].get('load_method', method)
+
         if filename is None:
             getattr(self, "_load_from_{0}".format(method))(parse=parse)
         else:
             getattr(self, "_load_from_{0}".format(method))(filename, parse)
         self.loaded_at = datetime.now()
+        self.updates = None
+        self.touch()
+
+        header_cache = get_header_cache()
+        if filename is None and header_cache is not None:
+            header_cache.evict([mail.qid for mail in self.mails])
+
+    @debug
+    def reload(self, method=None, filename=None, parse=False):
+        """
+        Reload content from postfix mails queue, keeping unchanged mails.
+
+        Mails queue is loaded again with :meth:`~store.PostqueueStore.load`
+        method and compared to current content using mails IDs. Mails
+        still present in queue are kept as the same :class:`~store.Mail`
+        objects, along with their parsed headers, and only their
+        :attr:`~Mail.status`, :attr:`~Mail.recipients` and
+        :attr:`~Mail.errors` attributes are updated.
+
+        Optionnal argument ``parse`` controls whether added mails are parsed
+        or not, with :meth:`~store.PostqueueStore.parse_mails` method. Parsing
+        cost then only depends on mails queue changes.
+
+        :param str method: Method used to load mails from Postfix queue
+        :param str filename: File to load mails from
+        :param bool parse: Controls whether added mails are parsed or not.
+        :return: Added and removed mails IDs :func:`list` under the ``added``
+                 and ``removed`` keys of a :func:`dict`
+        """
+        generation = self.generation
+        known_mails = dict((mail.qid, (position, mail))
+                           for position, mail in enumerate(self.mails))
+        positions = [-1] * len(known_mails)
+        self.load(method, filename, parse=False)
+
+        mails = self.MailListClass()
+        added = []
+        changed = []
+        for mail in self.mails:
+            position, known_mail = known_mails.pop(mail.qid, (None, None))
+            if known_mail is None:
+                added.append(mail)
+                changed.append(len(mails))
+                mails.append(mail)
+                continue
+            if (known_mail.status == mail.status and
+                    known_mail.recipients == mail.recipients and
+                    known_mail.errors == mail.errors):
+                positions[position] = len(mails)
+            else:
+                changed.append(len(mails))
+            known_mail.status = mail.status
+            known_mail.recipients = mail.recipients
+            known_mail.errors = mail.errors
+            mails.append(known_mail)
+        # mails are kept in loaded order, positions and indexes stay valid
+        self.mails = mails
+        self.updates = {
+            'generation': generation,
+            'positions': positions,
+            'changed': changed,
+        }
+
+        if parse and len(added):
+            self.parse_mails(added)
+
+        return {
+            'added': [mail.qid for mail in added],
+            'removed': sorted(known_mails),
+        }
 
     @debug
     def summary(self):
@@ -617,7 +1766,13 @@ class PostqueueStore(object):
 
         :return: Mail queue summary as :class:`dict`
 
-        Sizes are in bytes.
+        Sizes are in bytes. Top errors are counted by error template, see
+        :func:`~patterns.error_template`. Summary is computed with
+        :attr:`~PostqueueStore.arrays` when :meth:`~PostqueueStore.get_arrays`
+        returns them and they are already exported for the current
+        :attr:`~PostqueueStore.generation`. Arrays are not exported only for
+        a summary, as exporting them is slower than a single Python loop over
+        mails.
 
         Example response::
 
@@ -660,6 +1815,10 @@ class PostqueueStore(object):
                 'unique_senders': 8
             }
         """
+        arrays = self.get_arrays()
+        if arrays is not None and arrays.generation == self.generation:
+            return arrays.summary()
+
         senders = Counter()
         sender_domains = Counter()
         recipients = Counter()
@@ -676,15 +1835,18 @@ class PostqueueStore(object):
             'older_than_4_days': 0
         }
 
+        domain = self.strings.domain
         for mail in self.mails:
             status[mail.status] += 1
             senders[mail.sender] += 1
-            if '@' in mail.sender:
-                sender_domains[mail.sender.split('@', 1)[1]] += 1
+            sender_domain = domain(mail.sender)
+            if sender_domain is not None:
+                sender_domains[sender_domain] += 1
             for recipient in mail.recipients:
                 recipients[recipient] += 1
-                if '@' in recipient:
-                    recipient_domains[recipient.split('@', 1)[1]] += 1
+                recipient_domain = domain(recipient)
+                if recipient_domain is not None:
+                    recipient_domains[recipient_domain] += 1
             for error in mail.errors:
                 errors[error] += 1
             total_mails_size += mail.size
@@ -722,6 +1884,26 @@ class PostqueueStore(object):
             'top_sender_domains': sender_domains.most_common()[:5],
             'top_recipients': recipients.most_common()[:5],
             'top_recipient_domains': recipient_domains.most_common()[:5],
-            'top_errors': errors.most_common()[:5]
+            'top_errors': count_templates(errors).most_common()[:5]
         }
         return summary
+
+
+def _parse_mails_process(task):
+    """
+    Parse a chunk of mails content in a worker process.
+
+    Used by :meth:`~store.PostqueueStore.parse_mails` with a
+    :class:`multiprocessing.Pool` instance. Module's commands configuration
+    is given with mails to support processes started without
+    :func:`os.fork`.
+
+    :param tuple task: Store class, commands configuration and
+                       :class:`~store.Mail` objects to parse
+    :return: Parsed :class:`~store.Mail` objects
+    :rtype: :func:`list`
+    """
+    store_class, commands, mails = task
+    CONFIG['commands'] = commands
+    store_class._parse_mails_chunk(mails)
+    return mails
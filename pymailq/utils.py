@@ -22,6 +22,7 @@
 import re
 from functools import wraps
 from collections import Counter
+from pymailq.patterns import error_template
 
 
 FORMAT_PARSER = re.compile(r'\{[^{}]+\}')
@@ -31,6 +32,9 @@ FORMATS = {
              "  Rcpt: {recipients}\n"
              "   Err: {errors}")
 }
+RANK_TEMPLATES = {
+    'errors': error_template,
+}
 
 
 def viewer(function):
@@ -104,12 +108,23 @@ def viewer(function):
     return wrapper
 
 
-def sorter(function):
+def sorter(function=None, sorts_itself=False):
     """Result sorter decorator.
 
     This decorator inspect decorated function arguments and search for
     known keyword to sort decorated function result.
+
+    When used as ``@sorter(sorts_itself=True)``, the sort key and order are
+    passed to the decorated function in its ``sortby`` keyword argument as a
+    ``(sortkey, reverse)`` :func:`tuple`. Its result is expected to be
+    already sorted and unknown sort keys have to be reported with a
+    :class:`SyntaxError`.
+
+    :param bool sorts_itself: Decorated function sorts its result itself
     """
+    if function is None:
+        return lambda function: sorter(function, sorts_itself)
+
     @wraps(function)
     def wrapper(*args, **kwargs):
         args = list(args)  # conversion need for arguments cleaning
@@ -134,23 +149,33 @@ def sorter(function):
             except IndexError:
                 pass
 
-        elements = function(*args, **kwargs)
+        if sorts_itself:
+            kwargs['sortby'] = (sortkey, reverse)
+            return function(*args, **kwargs)
+
+        elements = list(function(*args, **kwargs))
 
         try:
-            sorted_elements = sorted(elements,
-                                     key=lambda x: getattr(x, sortkey),
-                                     reverse=reverse)
+            keys = [getattr(element, sortkey) for element in elements]
         except AttributeError:
             msg = "elements cannot be sorted by %s" % sortkey
             raise SyntaxError(msg)
 
-        return sorted_elements
+        order = sorted(range(len(elements)), key=keys.__getitem__,
+                       reverse=reverse)
+        return [elements[position] for position in order]
     wrapper.__doc__ = function.__doc__
     return wrapper
 
 
 def ranker(function):
     """Result ranker decorator
+
+    Elements are counted by value of the ranking field. Elements with a
+    :func:`list` field are counted once for each distinct value of the
+    list. Values of fields in :data:`RANK_TEMPLATES` are grouped by the
+    template returned by the associated function, such as errors grouped
+    by :func:`~patterns.error_template`.
     """
     @wraps(function)
     def wrapper(*args, **kwargs):
@@ -170,8 +195,19 @@ def ranker(function):
         if rankkey is not None:
             try:
                 rank = Counter()
+                template = RANK_TEMPLATES.get(rankkey)
+                templates = {}
                 for element in elements:
-                    rank[getattr(element, rankkey)] += 1
+                    values = getattr(element, rankkey)
+                    if not isinstance(values, (list, tuple)):
+                        values = [values]
+                    if template is not None:
+                        for value in values:
+                            if value not in templates:
+                                templates[value] = template(value)
+                        values = [templates[value] for value in values]
+                    for value in set(values):
+                        rank[value] += 1
 
                 # XXX: headers are taken in elements display limit :(
                 ranked_elements = ['%-40s  count' % rankkey, '='*48]
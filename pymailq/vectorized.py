@@ -0,0 +1,397 @@
+# coding: utf-8
+#
+#    Postfix queue control python tool (pymailq)
+#
+#    Copyright (C) 2014 Denis Pompilio (jawa) <denis.pompilio@gmail.com>
+#
+#    This file is part of pymailq
+#
+#    This program is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU General Public License
+#    as published by the Free Software Foundation; either version 2
+#    of the License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+from collections import Counter
+from datetime import datetime
+from pymailq import debug
+from pymailq.patterns import count_templates
+
+try:
+    import numpy
+except ImportError:  # numpy is an optional dependency
+    numpy = None
+
+#: Reference of mails dates, stored as microseconds since this naive date.
+EPOCH = datetime(1970, 1, 1)
+
+#: Value stored for unknown mails dates.
+UNKNOWN_DATE = -2 ** 63
+
+#: Microseconds in a day
+DAY = 86400 * 1000000
+
+
+def date_value(date):
+    """
+    Convert a date to microseconds since :data:`~vectorized.EPOCH`.
+
+    :param date: :class:`datetime.datetime` object or ``None``
+    :return: Microseconds since :data:`~vectorized.EPOCH` or
+             :data:`~vectorized.UNKNOWN_DATE`
+    :rtype: :func:`int`
+    """
+    if date is None:
+        return UNKNOWN_DATE
+    delta = date - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _renumber(codes):
+    """
+    Renumber codes by order of first occurrence.
+
+    :param codes: Codes :class:`numpy.ndarray`
+    :return: :func:`tuple` of renumbered codes and of original codes by new
+             code
+    """
+    uniques, first, inverse = numpy.unique(codes, return_index=True,
+                                           return_inverse=True)
+    order = numpy.argsort(first, kind="stable")
+    ranks = numpy.empty(len(order), dtype=numpy.int64)
+    ranks[order] = numpy.arange(len(order))
+    return ranks[inverse.ravel()], uniques[order]
+
+
+class MailArrays(object):
+    """
+    Columnar snapshot of mails stored in a :class:`~store.PostqueueStore`,
+    as :mod:`numpy` arrays.
+
+    Mails fields are exported to arrays once per store
+    :attr:`~store.PostqueueStore.generation`, on first use of the snapshot.
+    Range and equality filters are then computed as boolean masks over
+    mails, and queue statistics as array reductions instead of Python loops
+    over mails. Results are the same as the ones of the store's Python
+    implementations.
+
+    Senders, recipients, domains, status and errors are stored as integer
+    IDs in tables of distinct values. IDs are given by order of first
+    occurrence in mails, so counters ties are ordered like with
+    :class:`collections.Counter`. Recipients and errors lists of every mails
+    are concatenated in a single array, with an array of offsets to find
+    each mail's ones.
+
+    This requires the optional :mod:`numpy` package.
+
+    The :class:`~vectorized.MailArrays` instance provides the following
+    attributes:
+
+        .. attribute:: store
+
+            Exported :class:`~store.PostqueueStore` object.
+
+        .. attribute:: generation
+
+            Store generation of exported arrays.
+
+        .. attribute:: sizes
+
+            Mails sizes array.
+
+        .. attribute:: dates
+
+            Mails dates array, as microseconds since
+            :data:`~vectorized.EPOCH` or :data:`~vectorized.UNKNOWN_DATE`.
+
+        .. attribute:: columns
+
+            :class:`dict` of IDs arrays by column name. Known columns are
+            ``status``, ``sender``, ``sender_domain``, ``recipient``,
+            ``recipient_domain`` and ``error``. Domain IDs are ``-1`` for
+            addresses without domain.
+
+        .. attribute:: tables
+
+            :class:`dict` of distinct values :func:`list` by column name,
+            indexed by their ID.
+
+        .. attribute:: offsets
+
+            :class:`dict` of offsets arrays of ``recipient``,
+            ``recipient_domain`` and ``error`` columns, with a last entry
+            for the end of the last mail's values.
+    """
+
+    def __init__(self, store):
+        """Init method"""
+        self.store = store
+        self.generation = None
+        self.sizes = None
+        self.dates = None
+        self.columns = {}
+        self.tables = {}
+        self.offsets = {}
+
+    def check_generation(self):
+        """Export store mails if the store generation has changed"""
+        if self.generation != self.store.generation:
+            self.build()
+            self.generation = self.store.generation
+
+    @debug
+    def build(self):
+        """
+        Export store mails to arrays.
+
+        :raise ImportError: :mod:`numpy` is not installed
+        """
+        if numpy is None:
+            raise ImportError("numpy is required by mails arrays")
+
+        mails = self.store.mails
+        if hasattr(mails, "recipients_offsets"):
+            self.build_columns(mails)
+        else:
+            self.build_mails(mails)
+
+        domain = self.store.strings.domain
+        for name in ("sender", "recipient"):
+            ids = {}
+            domains = [ids.setdefault(domain(address), len(ids))
+                       for address in self.tables[name]]
+            codes = numpy.array(domains, dtype=numpy.int64)
+            self.tables[name + "_domain"] = list(ids)
+            if None in ids:
+                # addresses without domain are not counted
+                codes[codes == ids[None]] = -1
+                codes[codes > ids[None]] -= 1
+                self.tables[name + "_domain"].remove(None)
+            self.columns[name + "_domain"] = codes[self.columns[name]]
+        self.offsets["recipient_domain"] = self.offsets["recipient"]
+
+    def build_mails(self, mails):
+        """
+        Export mails fields by iterating over mails.
+
+        :param list mails: :class:`~store.Mail` objects
+        """
+        sizes = []
+        dates = []
+        values = dict((name, []) for name in ("status", "sender",
+                                              "recipient", "error"))
+        ids = dict((name, {}) for name in values)
+        offsets = {"recipient": [0], "error": [0]}
+        date_values = {}
+        for mail in mails:
+            sizes.append(mail.size)
+            value = date_values.get(mail.date)
+            if value is None:
+                value = date_values[mail.date] = date_value(mail.date)
+            dates.append(value)
+            for name, keys in (("status", (mail.status,)),
+                               ("sender", (mail.sender,)),
+                               ("recipient", mail.recipients),
+                               ("error", mail.errors)):
+                column_ids = ids[name]
+                values[name].extend([column_ids.setdefault(key,
+                                                           len(column_ids))
+                                     for key in keys])
+            offsets["recipient"].append(len(values["recipient"]))
+            offsets["error"].append(len(values["error"]))
+
+        self.sizes = numpy.array(sizes, dtype=numpy.int64)
+        self.dates = numpy.array(dates, dtype=numpy.int64)
+        for name in values:
+            self.columns[name] = numpy.array(values[name], dtype=numpy.int64)
+            self.tables[name] = list(ids[name])
+        for name in offsets:
+            self.offsets[name] = numpy.array(offsets[name], dtype=numpy.int64)
+
+    def build_columns(self, columns):
+        """
+        Export mails fields of a :class:`~columnar.MailColumns` object.
+
+        Columns arrays are copied without iterating over mails.
+
+        :param columns: :class:`~columnar.MailColumns` object
+        """
+        columns.flush()
+        self.sizes = numpy.array(columns.sizes, dtype=numpy.int64)
+        dates = numpy.array(columns.dates, dtype=numpy.int64)
+        known = dates != -1  # columnar.UNKNOWN_DATE
+        self.dates = numpy.where(known, dates * 1000000, UNKNOWN_DATE)
+
+        for name, codes, table in (
+                ("status", columns.statuses, columns.status_table),
+                ("sender", columns.senders, columns.strings),
+                ("recipient", columns.recipients, columns.strings),
+                ("error", columns.errors, columns.strings)):
+            codes = numpy.array(codes, dtype=numpy.int64)
+            self.columns[name], codes = _renumber(codes)
+            self.tables[name] = [table[code] for code in codes.tolist()]
+        self.offsets["recipient"] = numpy.array(columns.recipients_offsets,
+                                                dtype=numpy.int64)
+        self.offsets["error"] = numpy.array(columns.errors_offsets,
+                                            dtype=numpy.int64)
+
+    def range_mask(self, name, low=None, high=None):
+        """
+        Get mask of mails with a ``date`` or ``size`` value in a range.
+
+        Mails with unknown dates are never in range.
+
+        :param str name: ``date`` or ``size``
+        :param low: Minimum value, included. Ignored if ``None``
+        :param high: Maximum value, included. Ignored if ``None``
+        :return: Mails boolean mask as :class:`numpy.ndarray`
+        """
+        self.check_generation()
+        if name == "date":
+            values = self.dates
+            mask = values != UNKNOWN_DATE
+            low = None if low is None else date_value(low)
+            high = None if high is None else date_value(high)
+        else:
+            values = self.sizes
+            mask = numpy.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    def equal_mask(self, name, keys):
+        """
+        Get mask of mails with one of the specified values in a column.
+
+        :param str name: Column name, from :attr:`~MailArrays.columns`
+        :param list keys: Matching values
+        :return: Mails boolean mask as :class:`numpy.ndarray`
+        """
+        self.check_generation()
+        table = self.tables[name]
+        keys = set(keys)
+        ids = [code for code, value in enumerate(table) if value in keys]
+        matches = numpy.isin(self.columns[name], ids)
+        offsets = self.offsets.get(name)
+        if offsets is None:
+            return matches
+
+        # values lists are matched when any of their values matches
+        counts = numpy.diff(offsets)
+        mails = numpy.repeat(numpy.arange(len(counts)), counts)
+        mask = numpy.zeros(len(counts), dtype=bool)
+        mask[mails[matches]] = True
+        return mask
+
+    @staticmethod
+    def positions(mask):
+        """
+        Get positions of mails in a mask.
+
+        :param mask: Mails boolean mask as :class:`numpy.ndarray`
+        :return: Sorted positions in store :attr:`~store.PostqueueStore.mails`
+        :rtype: :func:`list`
+        """
+        return numpy.flatnonzero(mask).tolist()
+
+    def count(self, name):
+        """
+        Count occurrences of each value of a column.
+
+        :param str name: Column name, from :attr:`~MailArrays.columns`
+        :return: Counts array, by value ID
+        """
+        self.check_generation()
+        codes = self.columns[name]
+        return numpy.bincount(codes[codes >= 0],
+                              minlength=len(self.tables[name]))
+
+    def most_common(self, name, limit=5):
+        """
+        Get most common values of a column.
+
+        Values with the same count are ordered by first occurrence, like with
+        :meth:`collections.Counter.most_common`.
+
+        :param str name: Column name, from :attr:`~MailArrays.columns`
+        :param int limit: Number of values
+        :return: :func:`list` of ``(value, count)`` :func:`tuple`
+        """
+        counts = self.count(name)
+        table = self.tables[name]
+        order = numpy.argsort(-counts, kind="stable")[:limit]
+        return [(table[code], int(counts[code])) for code in order.tolist()]
+
+    @debug
+    def summary(self, now=None):
+        """
+        Summarize the mails queue content.
+
+        :param now: :class:`datetime.datetime` reference of mails ages
+                    (Default: :meth:`datetime.datetime.now`)
+        :return: Mail queue summary as :class:`dict`, see
+                 :meth:`~store.PostqueueStore.summary`
+        """
+        self.check_generation()
+        if now is None:
+            now = datetime.now()
+
+        status = Counter(active=0, hold=0, deferred=0)
+        for value, count in zip(self.tables["status"],
+                                self.count("status").tolist()):
+            status[value] += count
+        errors = Counter()
+        for value, count in zip(self.tables["error"],
+                                self.count("error").tolist()):
+            errors[value] = count
+
+        sizes = self.sizes
+        total_mails = len(sizes)
+        total_mails_size = int(sizes.sum())
+        average_mail_size = 0
+        max_mail_size = 0
+        min_mail_size = 0
+        if total_mails:
+            average_mail_size = total_mails_size / total_mails
+            max_mail_size = max(0, int(sizes.max()))
+            # a zero size resets the minimum to the next mail size
+            zeros = numpy.flatnonzero(sizes == 0)
+            tail = sizes[zeros[-1] + 1:] if len(zeros) else sizes
+            min_mail_size = int(tail.min()) if len(tail) else 0
+
+        dates = self.dates[self.dates != UNKNOWN_DATE]
+        days = (date_value(now) - dates) // DAY
+        mails_by_age = {
+            'last_24h': int(numpy.count_nonzero(days == 0)),
+            '1_to_4_days_ago': int(numpy.count_nonzero(days == 1)),
+            'older_than_4_days': int(numpy.count_nonzero(days >= 4))
+        }
+
+        summary = {
+            'total_mails': total_mails,
+            'mails_by_age': mails_by_age,
+            'total_mails_size': total_mails_size,
+            'average_mail_size': average_mail_size,
+            'max_mail_size': max_mail_size,
+            'min_mail_size': min_mail_size,
+            'top_status': status.most_common()[:5],
+            'unique_senders': len(self.tables["sender"]),
+            'unique_sender_domains': len(self.tables["sender_domain"]),
+            'unique_recipients': len(self.tables["recipient"]),
+            'unique_recipient_domains': len(self.tables["recipient_domain"]),
+            'top_senders': self.most_common("sender"),
+            'top_sender_domains': self.most_common("sender_domain"),
+            'top_recipients': self.most_common("recipient"),
+            'top_recipient_domains': self.most_common("recipient_domain"),
+            'top_errors': count_templates(errors).most_common()[:5]
+        }
+        return summary
@@ -21,8 +21,9 @@
 import sys
 import pytest
 import pymailq
-from datetime import datetime
-from pymailq import store, control, selector
+from datetime import datetime, timedelta
+from pymailq import (store, control, selector, queuefile, cache, columnar,
+                     index, query, patterns, utils)
 
 try:
     from unittest.mock import Mock, patch
@@ -56,6 +57,37 @@ def test_load_config():
     pymailq.load_config("tests/samples/pymailq.ini")
     assert 'postfix_spool' in pymailq.CONFIG['core']
     assert pymailq.CONFIG['commands']['use_sudo'] is True
+    assert pymailq.CONFIG['core']['hash_queue_depth'] == 1
+    assert pymailq.CONFIG['core']['hash_queue_names'] == ["deferred", "defer"]
+
+
+def test_store_date_parser():
+    """Test PostqueueDateParser.parse method"""
+    now = datetime(2017, 8, 1, 12, 0, 0)
+    parser = store.PostqueueDateParser(now=now, cache_size=2)
+    assert parser.parse("Mon Jul 31 16:16:12") == datetime(2017, 7, 31,
+                                                           16, 16, 12)
+    assert parser.parse(b"Tue Aug  1 12:00:01") == datetime(2016, 8, 1,
+                                                            12, 0, 1)
+    assert parser.parse("Mon Jul 31 16:16:12") == datetime(2017, 7, 31,
+                                                           16, 16, 12)
+    assert len(parser._cache) == 2
+    parser.parse("Mon Jan  2 03:04:05")
+    assert len(parser._cache) == 1
+    for datestr in ("Mon Jul 32 16:16:12", "Mon Foo 31 16:16:12",
+                    "Mon Jul 31 16:16"):
+        with pytest.raises(ValueError):
+            parser.parse(datestr)
+
+    parser = store.PostqueueDateParser()
+    for delta in range(0, 400 * 86400, 86400 * 7 + 3661):
+        date = (parser.now - timedelta(seconds=delta)).replace(microsecond=0)
+        datestr = date.strftime("%a %b %d %H:%M:%S")
+        expected = datetime.strptime("%s %d" % (datestr, parser.now.year),
+                                     "%a %b %d %H:%M:%S %Y")
+        if expected > parser.now:
+            expected = expected - timedelta(days=365)
+        assert parser.parse(datestr) == expected
 
 
 def test_store_load_from_spool():
@@ -70,12 +102,96 @@ def test_store_load_from_filename():
     assert PSTORE.loaded_at is not None
 
 
+def test_store_load_from_filename_closed():
+    """Test PostqueueStore load from file closes the file"""
+    opened = []
+
+    def tracked_open(*args):
+        opened.append(open(*args))
+        return opened[-1]
+
+    pstore = store.PostqueueStore()
+    with patch("pymailq.store.open", tracked_open, create=True):
+        pstore.load(method="postqueue", filename="tests/samples/mailq.sample")
+    assert len(pstore.mails) == 30
+    assert opened[0].closed
+
+
 def test_store_load_from_postqueue():
     """Test PostqueueStore load from postqueue"""
     PSTORE.load()
     assert PSTORE.loaded_at is not None
 
 
+def test_store_load_from_postqueue_stream():
+    """Test PostqueueStore load from streamed postqueue output"""
+    pstore = store.PostqueueStore()
+    pstore.postqueue_cmd = ["cat", "tests/samples/mailq.sample"]
+    pstore.load()
+    assert len(pstore.mails) == 30
+    assert pstore.mails[0].qid == "10DFD11830F2"
+    assert pstore.mails[0].recipients == ["user-1@test-domain.tld"]
+    assert pstore.mails[0].errors == ["mail transport unavailable"]
+
+
+def test_store_load_from_postqueue_json():
+    """Test PostqueueStore load from postqueue JSON output"""
+    pstore = store.PostqueueStore()
+    pstore.load(method="postqueue_json",
+                filename="tests/samples/postqueue_json.sample")
+    assert len(pstore.mails) == 30
+    assert pstore.mails[0].date == datetime.fromtimestamp(1514736972)
+    assert pstore.mails[0].errors == ["mail transport unavailable"]
+    assert len([mail for mail in pstore.mails if mail.status == "hold"]) == 1
+
+
+def test_store_load_from_postqueue_json_error(tmpdir):
+    """Test PostqueueStore JSON loader closes its file on errors"""
+    sample = tmpdir.join("postqueue_json.sample")
+    sample.write('{"queue_id": \n')
+    opened = []
+
+    def tracked_open(*args):
+        opened.append(open(*args))
+        return opened[-1]
+
+    pstore = store.PostqueueStore()
+    with patch("pymailq.store.open", tracked_open, create=True):
+        with pytest.raises(ValueError):
+            pstore.load(method="postqueue_json", filename=str(sample))
+    assert opened[0].closed
+
+
+def test_store_load_from_file():
+    """Test PostqueueStore load from memory-mapped file"""
+    pstore = store.PostqueueStore()
+    pstore.load(method="file", filename="tests/samples/mailq.sample")
+    reference = store.PostqueueStore()
+    reference.load(method="postqueue", filename="tests/samples/mailq.sample")
+    assert len(pstore.mails) == 30
+    for mail, expected in zip(pstore.mails, reference.mails):
+        assert mail.dump() == expected.dump()
+
+
+def test_store_string_pool():
+    """Test PostqueueStore strings pool"""
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    senders = [mail.sender for mail in pstore.mails
+               if mail.sender == "sender-9@testsend_domain.tld"]
+    assert len(senders) == 6
+    assert all(sender is senders[0] for sender in senders)
+    assert pstore.strings.domain(senders[0]) == "testsend_domain.tld"
+    assert pstore.strings.domain("MAILER-DAEMON") is None
+    assert pstore.strings.decode(b"user-1@test-domain.tld") is \
+        pstore.mails[0].recipients[0]
+
+    pstore.load(method="file", filename="tests/samples/mailq.sample")
+    errors = [error for mail in pstore.mails for error in mail.errors]
+    assert all(error is errors[0] for error in errors
+               if error == errors[0])
+
+
 def test_store_summary():
     """Test PostqueueStore.summary method"""
     summary = PSTORE.summary()
@@ -95,6 +211,797 @@ def test_mail_parse_and_dump():
     assert "postqueue" in datas
 
 
+def test_mail_headers():
+    """Test MailHeaders class"""
+    mail = store.Mail("10DFD11830F2")
+    mail._parse_content(["From: Sender <sender-1@testsend_domain.tld>",
+                         "Subject: Test email", "", "This is test."])
+    other = store.Mail("1FD2B11832C4")
+    other._parse_content(["From: Sender <sender-1@testsend_domain.tld>"])
+    assert getattr(mail.head, "From") == [
+        "Sender <sender-1@testsend_domain.tld>"]
+    pstore = store.PostqueueStore()
+    pstore._pool_headers([mail, other, store.Mail("23A4B11834D6")])
+    assert mail.head.From[0] is other.head.From[0]
+    assert pstore.strings.intern("Test email") is mail.head.Subject[0]
+    assert dir(mail.head) == ["From", "Subject"]
+    assert vars(mail.head) == {"From": mail.head.From,
+                               "Subject": ["Test email"]}
+    assert mail.dump()['headers'] == vars(mail.head)
+    assert getattr(other.head, "Subject", None) is None
+    with pytest.raises(AttributeError):
+        mail.undefined = True
+
+
+def test_store_parse_mails(monkeypatch):
+    """Test PostqueueStore.parse_mails method"""
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'use_sudo', False)
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'cat_message',
+                        ["cat", "tests/samples/postcat.sample"])
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pstore.parse_mails(chunk_size=20)
+
+    parsed = [mail for mail in pstore.mails if mail.parsed]
+    assert [mail.qid for mail in parsed] == ["10DFD11830F2", "1FD2B11832C4"]
+    assert parsed[0].head.Subject == ["Test email from "
+                                      "sender-1@testsend_domain.tld"]
+    assert not len(parsed[0].parse_error)
+    for mail in pstore.mails[2:]:
+        assert mail.parsed is False
+        assert mail.qid in mail.parse_error
+
+
+def test_store_parse_mails_workers(monkeypatch):
+    """Test PostqueueStore.parse_mails method with worker processes"""
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'use_sudo', False)
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'cat_message',
+                        ["cat", "tests/samples/postcat.sample"])
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pstore.parse_mails(workers=2)
+
+    parsed = [mail for mail in pstore.mails if mail.parsed]
+    assert [mail.qid for mail in parsed] == ["10DFD11830F2", "1FD2B11832C4"]
+    assert parsed[1].head.Subject == ["Test email from "
+                                      "sender-9@testsend_domain.tld"]
+    for mail in pstore.mails[2:]:
+        assert mail.parsed is False
+        assert mail.qid in mail.parse_error
+
+
+def test_store_parse_mails_cache(tmpdir, monkeypatch):
+    """Test PostqueueStore.parse_mails method with headers cache"""
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'use_sudo', False)
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'cat_message',
+                        ["cat", "tests/samples/postcat.sample"])
+    monkeypatch.setitem(pymailq.CONFIG['core'], 'header_cache',
+                        str(tmpdir.join("cache.db")))
+    monkeypatch.setitem(pymailq.CONFIG['core'], 'postfix_spool',
+                        str(tmpdir.mkdir("spool")))
+    queue_dir = tmpdir.join("spool").mkdir("deferred").mkdir("1")
+    for qid in ("10DFD11830F2", "1FD2B11832C4"):
+        queue_dir.join(qid).write("\x00")
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pstore.parse_mails()
+    assert pstore.mails[0].queue_file_stamp() is not None
+    assert pstore.mails[2].queue_file_stamp() is None
+    long_mail = store.Mail("3yWfR91kTbz2bHZ")
+    long_mail.status = "deferred"
+    tmpdir.join("spool", "deferred").mkdir("3").join(
+        "3yWfR91kTbz2bHZ").write("\x00")
+    assert long_mail.queue_file_stamp() is not None
+
+    # Parsing command is not called for cached mails
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'cat_message',
+                        ["cat", "/dev/null"])
+    pstore.load(filename="tests/samples/mailq.sample")
+    pstore.parse_mails()
+    parsed = [mail for mail in pstore.mails if mail.parsed]
+    assert [mail.qid for mail in parsed] == ["10DFD11830F2", "1FD2B11832C4"]
+    assert parsed[0].head.Subject == ["Test email from "
+                                      "sender-1@testsend_domain.tld"]
+
+    # Cached headers of modified or missing queue files are not used
+    queue_dir.join("10DFD11830F2").setmtime(0)
+    queue_dir.join("1FD2B11832C4").remove()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pstore.parse_mails()
+    assert not [mail for mail in pstore.mails if mail.parsed]
+
+    header_cache = cache.get_header_cache()
+    try:
+        assert header_cache.evict(["10DFD11830F2"]) == 1
+        assert header_cache.get(pstore.MailClass("1FD2B11832C4"),
+                                (0, 0.0)) is False
+    finally:
+        header_cache.close()
+    assert cache.get_header_cache() is not header_cache
+    cache.get_header_cache().close()
+
+
+def test_store_reload(tmpdir):
+    """Test PostqueueStore.reload method"""
+    with open("tests/samples/mailq.sample") as sample:
+        lines = sample.readlines()
+    # Remove first mail and hold the second one
+    reloaded = tmpdir.join("mailq.sample")
+    reloaded.write("".join(lines[:1] + [lines[5].replace("4 ", "4!")] +
+                           lines[6:]))
+
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    mail = pstore.mails[1]
+    mail.head.Subject = ["Test email"]
+    changes = pstore.reload(filename=str(reloaded))
+    assert changes == {'added': [], 'removed': ["10DFD11830F2"]}
+    assert len(pstore.mails) == 29
+    assert pstore.mails[0] is mail
+    assert mail.status == "hold"
+    assert mail.head.Subject == ["Test email"]
+
+    changes = pstore.reload(filename="tests/samples/mailq.sample")
+    assert changes == {'added': ["10DFD11830F2"], 'removed': []}
+    assert pstore.mails[1] is mail
+    assert mail.status == "deferred"
+
+
+def test_store_get(tmpdir):
+    """Test PostqueueStore.get method"""
+    pstore = store.PostqueueStore()
+    assert pstore.get("10DFD11830F2") is None
+    pstore.load(filename="tests/samples/mailq.sample")
+    assert len(pstore.qids) == len(pstore.mails)
+    assert pstore.get("10DFD11830F2") is pstore.mails[0]
+    assert pstore.get("XXXXXXXXXX", "missing") == "missing"
+
+    with open("tests/samples/mailq.sample") as sample:
+        lines = sample.readlines()
+    reloaded = tmpdir.join("mailq.sample")
+    reloaded.write("".join(lines[:1] + lines[5:]))
+    mail = pstore.mails[1]
+    pstore.reload(filename=str(reloaded))
+    assert pstore.get("10DFD11830F2") is None
+    assert pstore.get(mail.qid) is mail
+    assert pstore.qids[mail.qid] == 0
+
+    pselector = selector.MailSelector(pstore)
+    qids = tuple([mail.qid for mail in pstore.mails[:3]][::-1])
+    assert pselector.get_mails_by_qids(qids + ("XXXXXXXXXX",) + qids) == \
+        pstore.mails[:3]
+    assert pselector.lookup_qids(qids[:2]) == pstore.mails[1:3]
+    assert pselector.get_mails_by_qids(qids) == pstore.mails[1:3]
+
+    cstore = columnar.ColumnarPostqueueStore()
+    cstore.load(filename="tests/samples/mailq.sample")
+    assert cstore.get("10DFD11830F2").qid == "10DFD11830F2"
+
+
+def test_columnar_store(monkeypatch):
+    """Test ColumnarPostqueueStore class"""
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    cstore = columnar.ColumnarPostqueueStore()
+    cstore.load(filename="tests/samples/mailq.sample")
+    assert len(cstore.mails) == len(pstore.mails)
+    for mail, view in zip(pstore.mails, cstore.mails):
+        assert (mail.qid, mail.size, mail.date, mail.status, mail.sender,
+                mail.recipients, mail.errors) == (
+                    view.qid, view.size, view.date, view.status, view.sender,
+                    view.recipients, view.errors)
+    assert cstore.summary() == pstore.summary()
+    assert cstore.mails[-1].qid == pstore.mails[-1].qid
+    assert [view.qid for view in cstore.mails[1:3]] == [
+        mail.qid for mail in pstore.mails[1:3]]
+
+    cselector = selector.MailSelector(cstore)
+    mails = cselector.lookup_sender("sender-9@testsend_domain.tld")
+    assert type(mails) == list
+    assert len(mails) == 6
+
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'use_sudo', False)
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'cat_message',
+                        ["cat", "tests/samples/postcat.sample"])
+    cstore.parse_mails()
+    assert cstore.mails[0].parsed is True
+    assert "Subject" in cstore.known_headers
+    assert cstore.mails[0].dump()['headers']['Subject'] == [
+        "Test email from sender-1@testsend_domain.tld"]
+
+    changes = cstore.reload(filename="tests/samples/mailq.sample")
+    assert changes == {'added': [], 'removed': []}
+    assert cstore.mails[0].head.Subject == [
+        "Test email from sender-1@testsend_domain.tld"]
+
+    cstore = columnar.ColumnarPostqueueStore()
+    cstore.load(filename="tests/samples/mailq.sample")
+    view = cstore.mails[0]
+    assert not isinstance(view, store.Mail)
+    assert not hasattr(view, "__dict__")
+    pselector = selector.MailSelector(cstore)
+    assert pselector.lookup_header("Subject", "Test") == []
+    assert view.dump()['headers'] == {}
+    assert cstore.mails.heads == {}
+    assert cstore.known_headers == set()
+    head = view.head
+    head.Subject = ["Test"]
+    view.head = head
+    assert cstore.mails[0].head.Subject == ["Test"]
+    assert list(cstore.mails.heads) == [0]
+    cstore.mails.append(store.Mail("ABCDEF12345"))
+    assert view.qid == pstore.mails[0].qid
+    assert cstore.mails._pending is None
+
+
+def test_mail_arrays(tmpdir):
+    """Test MailArrays snapshots of stores"""
+    pytest.importorskip("numpy")
+    with open("tests/samples/mailq.sample") as sample:
+        lines = sample.readlines()
+    # Null size and sender without domain for the first mail
+    lines[1] = lines[1].replace("    263 ", "      0 ").replace(
+        "sender-1@testsend_domain.tld", "MAILER-DAEMON")
+    lines[7] = lines[7].replace("test-domain.tld", "other.tld")
+    sample = tmpdir.join("mailq.sample")
+    sample.write("".join(lines))
+
+    for store_class in (store.PostqueueStore,
+                        columnar.ColumnarPostqueueStore):
+        pstore = store_class()
+        pstore.load(filename=str(sample))
+        assert pstore.mails[0].size == 0
+        assert pstore.get_arrays() is pstore.arrays
+
+        summary = pstore.summary()
+        assert pstore.arrays.generation is None
+        pstore.arrays.check_generation()
+        assert pstore.summary() == summary
+        pstore.use_arrays = False
+        assert pstore.get_arrays() is None
+        assert pstore.summary() == summary
+
+        pselector = selector.MailSelector(pstore)
+        start = datetime.now() - timedelta(days=60)
+        sizes = pselector.lookup_size(smin=500, smax=1000)
+        dates = pselector.lookup_date(start=start)
+        pstore.use_arrays = True
+        pstore.touch()
+        pselector.reset()
+        assert pselector.lookup_size(smin=500, smax=1000) == sizes
+        pselector.reset()
+        assert pselector.lookup_date(start=start) == dates
+        assert "size" not in pstore.index.sorts
+
+        arrays = pstore.arrays
+        for name, keys in (("status", ["deferred"]),
+                           ("sender", ["MAILER-DAEMON"]),
+                           ("recipient", ["user-1@other.tld"]),
+                           ("recipient_domain", ["other.tld"]),
+                           ("error", ["mail transport unavailable"])):
+            mask = arrays.equal_mask(name, keys)
+            assert arrays.positions(mask) == pstore.index.positions(name,
+                                                                    keys)
+        assert "MAILER-DAEMON" in arrays.tables["sender"]
+        assert None not in arrays.tables["sender_domain"]
+
+
+def test_store_index():
+    """Test MailSelector lookups with store indexes"""
+    for store_class in (store.PostqueueStore,
+                        columnar.ColumnarPostqueueStore):
+        pstore = store_class()
+        pstore.load(filename="tests/samples/mailq.sample")
+        pselector = selector.MailSelector(pstore)
+        sender = "sender-9@testsend_domain.tld"
+        mails = pselector.lookup_sender(sender)
+        assert type(mails) == list
+        assert mails == [mail for mail in pstore.mails
+                         if mail.sender == sender]
+        recipient = "user-1@test-domain.tld"
+        mails = pselector.lookup_recipient(recipient)
+        assert mails == [mail for mail in pstore.mails
+                         if mail.sender == sender and
+                         recipient in mail.recipients]
+        assert pselector.lookup_status("active") == []
+        assert pselector.lookup_status(["deferred"]) == []
+
+        pselector.reset()
+        mails = pselector.lookup_sender_domain("testsend_domain.tld")
+        assert len(mails) == len(pstore.mails)
+        mails = pselector.lookup_recipient_domain("test-domain.tld")
+        assert mails == [mail for mail in pstore.mails
+                         if [rcpt for rcpt in mail.recipients
+                             if rcpt.endswith("@test-domain.tld")]]
+
+        for pattern in ("sender-1", "@testsend", "r-", "", "nomatch"):
+            pselector.reset()
+            mails = pselector.lookup_sender(pattern, exact=False)
+            assert mails == [mail for mail in pstore.mails
+                             if pattern in mail.sender]
+            pselector.reset()
+            mails = pselector.lookup_recipient(pattern, exact=False)
+            assert mails == [mail for mail in pstore.mails
+                             if [rcpt for rcpt in mail.recipients
+                                 if pattern in rcpt]]
+        pselector.reset()
+        pselector.lookup_sender("sender-1", exact=False)
+        mails = pselector.lookup_error("transport")
+        assert type(mails) == list
+        assert mails == [mail for mail in pstore.mails
+                         if "sender-1" in mail.sender and
+                         [err for err in mail.errors if "transport" in err]]
+
+        pselector.reset()
+        dates = sorted(set(mail.date for mail in pstore.mails))
+        start, stop = dates[1], dates[-2]
+        mails = pselector.lookup_date(start, stop)
+        assert type(mails) == list
+        assert mails == [mail for mail in pstore.mails
+                         if start <= mail.date <= stop]
+        for smin, smax in ((0, 0), (263, 263), (264, 0), (0, 500)):
+            pselector.reset()
+            mails = pselector.lookup_size(smin, smax)
+            assert mails == [mail for mail in pstore.mails
+                             if (smin <= mail.size <= smax or
+                                 smin <= mail.size and smax == 0)]
+        for sortkey in ("date", "size", "qid"):
+            for reverse in (True, False):
+                for ratio in (1, 16):
+                    pselector.sorted_index_ratio = ratio
+                    assert pselector.sorted_mails(sortkey, reverse) == \
+                        sorted(mails, key=lambda x: getattr(x, sortkey),
+                               reverse=reverse)
+
+        generation = pstore.generation
+        pstore.reload(filename="tests/samples/mailq.sample")
+        assert pstore.generation > generation
+        pstore.mails[0].status = "active"
+        pstore.touch()
+        pselector.reset()
+        assert pselector.lookup_status("active") == [pstore.mails[0]]
+
+
+def test_ngram_index():
+    """Test NgramIndex class"""
+    ngrams = index.NgramIndex(["user@gmail.com", "user@mail.org", "us"])
+    assert ngrams.search("@gmail.com") == ["user@gmail.com"]
+    assert ngrams.search("mail.") == ["user@gmail.com", "user@mail.org"]
+    assert ngrams.search("us") == ["user@gmail.com", "user@mail.org", "us"]
+    assert ngrams.search("lia") == []
+    assert ngrams.search("user@mail.com") == []
+
+
+def test_selector_mask():
+    """Test MailSelector bitmap selection"""
+    positions = [0, 3, 8, 15, 16, 1000]
+    mask = index.positions_mask(positions, 1001)
+    assert mask == sum(1 << position for position in positions)
+    assert index.mask_positions(mask, 1001) == positions
+    assert index.mask_count(mask) == len(positions)
+    mask = index.positions_mask(positions[:-1], 20)
+    assert index.mask_bytes(mask, 20) == bytearray([9, 129, 1])
+
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pselector = selector.MailSelector(pstore)
+    assert len(pselector) == len(pstore.mails)
+    assert pselector.mails == pstore.mails
+    assert pselector.mails is not pstore.mails
+
+    mails = pselector.lookup_sender("sender-9@testsend_domain.tld")
+    assert len(pselector) == len(mails) == 6
+    pselector.lookup_qids([mail.qid for mail in mails[::2]] + ["XXXXXXXX"])
+    assert pselector.mails == mails[::2]
+
+    pselector.mails = pstore.mails[-2:]
+    assert pselector.mails == pstore.mails[-2:]
+    assert len(pselector) == 2
+
+    pselector.reset()
+    pselector.lookup_status(["hold"])
+    selected = len(pselector)
+    pstore.load(filename="tests/samples/mailq.sample")
+    assert len(pselector) == selected
+    assert pselector.mails[0] in pstore.mails
+
+
+def test_query():
+    """Test MailSelector.lookup_query method"""
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pselector = selector.MailSelector(pstore)
+    words = ["not", "status", "hold", "and", "(", "sender", "sender-1",
+             "or", "recipient", "user-2@test-domain.tld", "exact", ")",
+             "and", "not", "size", "-262"]
+    expression = query.parse_query(words)
+    assert str(expression) == (
+        "(not status(['hold']) and (sender('sender-1', exact=False) or "
+        "recipient('user-2@test-domain.tld', exact=True)) and "
+        "not size(0, 262))")
+    mails = pselector.lookup_query(expression)
+    assert type(mails) == list
+    assert mails == [mail for mail in pstore.mails
+                     if mail.status != "hold" and mail.size > 262 and
+                     ("sender-1" in mail.sender or
+                      "user-2@test-domain.tld" in mail.recipients)]
+    assert len(mails)
+    assert pselector.filters == [("lookup_query", (expression,), {})]
+    pselector.replay_filters()
+    assert pselector.mails == mails
+
+    pselector.reset()
+    pselector.lookup_status(["deferred"])
+    mails = pselector.lookup_query(query.Match("sender_domain", "nowhere") |
+                                   ~query.Match("size", 0, 262))
+    assert mails == [mail for mail in pstore.mails
+                     if mail.status == "deferred" and mail.size > 262]
+
+    for words in ([], ["status"], ["(", "status", "deferred"], ["foo"],
+                  ["size", "12", "12"], ["status", "and"],
+                  ["date", "XXXX-XX-XX"]):
+        with pytest.raises(SyntaxError):
+            query.parse_query(words)
+
+
+def test_selector_planner():
+    """Test MailSelector lazy filters planning"""
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pselector = selector.MailSelector(pstore, lazy=True)
+    qids = [mail.qid for mail in pstore.mails[:3]]
+    assert pselector.lookup_error("transport") is None
+    assert pselector.lookup_sender("sender-", exact=False) is None
+    assert pselector.lookup_qids(qids) is None
+    assert len(pselector.pending) == 3
+    assert len(pselector) == len([mail for mail in pstore.mails[:3]
+                                  if mail.errors])
+    assert not len(pselector.pending)
+    plan = pselector.explain()
+    assert [step['filter'][0] for step in plan] == [
+        "lookup_qids", "lookup_error", "lookup_sender"]
+    assert [step['method'] for step in plan] == ["index", "scan", "scan"]
+    assert plan[0]['estimate'] == 3
+    assert plan[-1]['mails'] == len(pselector.mails)
+
+    lazy_mails = pselector.mails
+    pselector = selector.MailSelector(pstore)
+    pselector.lookup_error("transport")
+    pselector.lookup_sender("sender-", exact=False)
+    assert pselector.lookup_qids(qids) == lazy_mails
+    assert [step['method'] for step in pselector.explain()] == [
+        "index", "index", "index"]
+    pstore.touch()
+    pselector.replay_filters()
+    assert pselector.mails == lazy_mails
+    assert pselector.explain()[0]['filter'][0] == "lookup_qids"
+
+    for name in ("status", "sender", "recipient", "error"):
+        assert pselector.estimate(name, ("-",)) <= len(pstore.mails)
+    assert pselector.estimate("size", (), {"smin": 263}) == len(
+        [mail for mail in pstore.mails if mail.size >= 263])
+    assert pselector.estimate("header", ("Subject", "")) == len(pstore.mails)
+    assert pselector.estimate("sender_domain", ("testsend_domain.tld",)) == \
+        len(pstore.mails)
+
+
+def test_selector_prefixes(tmpdir):
+    """Test MailSelector filters prefixes cache"""
+    with open("tests/samples/mailq.sample") as sample:
+        lines = sample.readlines()
+    # Remove first mail and hold the second one
+    reloaded = tmpdir.join("mailq.sample")
+    reloaded.write("".join(lines[:1] + [lines[5].replace("4 ", "4!")] +
+                           lines[6:]))
+
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    assert pstore.updates is None
+    pselector = selector.MailSelector(pstore)
+    pselector.lookup_status("deferred")
+    pselector.lookup_error("transport")
+    mails = pselector.lookup_sender("sender-1", exact=False)
+    assert len(pselector.prefixes) == 3
+
+    pselector.remove_filter(-1)
+    assert [step.get('cached') for step in pselector.explain()] == [
+        True, True]
+    assert pselector.lookup_sender("sender-1", exact=False) == mails
+    pselector.remove_filter(1)
+    assert [step['filter'][0] for step in pselector.explain()] == [
+        "lookup_status", "lookup_sender"]
+    assert pselector.mails == mails
+    with pytest.raises(IndexError):
+        pselector.remove_filter(2)
+
+    pselector.replay_filters()
+    assert pselector.explain()[-1]['cached'] is True
+    assert pselector.mails == mails
+
+    pselector.reset()
+    pselector.lookup_status("deferred")
+    pselector.lookup_error("transport")
+    pstore.reload(filename=str(reloaded))
+    assert pstore.updates['changed'] == [0]
+    assert pstore.updates['positions'][:3] == [-1, -1, 1]
+    fselector = selector.MailSelector(pstore)
+    fselector.lookup_status("deferred")
+    fselector.lookup_error("transport")
+    assert pselector.mails == fselector.mails
+    assert pselector.explain()[-1]['cached'] is True
+    assert pselector.explain()[-1]['mails'] == len(fselector)
+
+    pselector.mails = pstore.mails[:2]
+    assert pselector.prefixes is None
+    pselector.replay_filters()
+    assert pselector.mails == fselector.mails
+
+
+def test_selector_stream():
+    """Test MailSelector.stream method"""
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    pselector = selector.MailSelector(pstore)
+    stream = pselector.stream().status("deferred").sender(
+        "sender-9@", exact=False).size(smin=200)
+    assert isinstance(stream, selector.MailStream)
+    expected = pselector.lookup_status("deferred")
+    expected = pselector.lookup_sender("sender-9@", exact=False)
+    expected = pselector.lookup_size(smin=200)
+    assert list(stream) == expected
+    assert list(stream) == expected
+    assert len(expected) == 6
+
+    pselector.reset()
+    start = datetime(2017, 1, 1)
+    assert list(pselector.stream().date(start=start).recipient_domain(
+        "test-domain.tld")) == pselector.lookup_date(start=start)
+
+    checked = []
+    stream = pselector.stream().where(checked.append).limit(3)
+    assert list(stream) == []
+    assert len(checked) == 30
+    del checked[:]
+    stream = pselector.stream().where(
+        lambda mail: checked.append(mail) or True).limit(3)
+    assert list(stream) == pstore.mails[:3]
+    assert len(checked) == 3
+    assert list(stream.limit(0)) == []
+
+    pselector.lookup_qids([pstore.mails[5].qid, pstore.mails[8].qid])
+    assert list(pselector.stream().qids([pstore.mails[8].qid])) == [
+        pstore.mails[8]]
+    with pytest.raises(AttributeError):
+        pselector.stream().filter("header", "Subject", "test")
+
+
+def test_patterns(tmpdir):
+    """Test patterns module"""
+    matcher = patterns.PatternMatcher(["he", "she", "his", "hers", "out"])
+    assert matcher.search("ushers") == [0, 1, 3]
+    assert matcher.search("timed out") == [4]
+    assert matcher.search("") == []
+    assert matcher.classify(["ushers", "his", "ushers"]) == [
+        ["ushers"], ["ushers"], ["his"], ["ushers"], []]
+    assert patterns.PatternMatcher([""]).search("any") == [0]
+
+    assert patterns.error_template(
+        "connect to mx.remote12.org[192.0.2.5]:25: Connection timed out"
+    ) == "connect to mx.remote<n>.org[<ip>]:<n>: Connection timed out"
+    assert patterns.error_template(
+        "host mx[2001:db8::1] said: 450 4.7.1 Busy, id 4ABCD12345EF"
+    ) == "host mx[<ip>] said: 450 4.7.1 Busy, id <qid>"
+    assert patterns.error_template("mail transport unavailable") == \
+        "mail transport unavailable"
+    assert patterns.error_template(
+        "host mx[192.0.2.5] said: 550 User unknown (in reply to RCPT TO)"
+    ) == "host mx[<ip>] said: 550 User unknown (in reply to RCPT TO)"
+    assert patterns.error_template("421-Too many connections") == \
+        "421-Too many connections"
+    assert patterns.error_template("delayed 450 seconds") == \
+        "delayed <n> seconds"
+
+    with open("tests/samples/mailq.sample") as sample:
+        lines = sample.readlines()
+    # Replace error of the first two mails
+    lines[2] = lines[2].replace("mail transport unavailable",
+                                "connect to [192.0.2.1]:25: timed out")
+    lines[6] = lines[6].replace("mail transport unavailable",
+                                "connect to [192.0.2.2]:25: timed out")
+    sample = tmpdir.join("mailq.sample")
+    sample.write("".join(lines))
+    pstore = store.PostqueueStore()
+    pstore.load(filename=str(sample))
+    assert pstore.summary()['top_errors'] == [
+        ("mail transport unavailable", 28),
+        ("connect to [<ip>]:<n>: timed out", 2)]
+
+    pselector = selector.MailSelector(pstore)
+    classes = pselector.classify_errors(["timed out", "transport", "none"])
+    assert [(pattern, len(mails)) for pattern, mails in classes] == [
+        ("timed out", 2), ("transport", 28), ("none", 0)]
+    pselector.lookup_qids([pstore.mails[0].qid])
+    assert pselector.classify_errors(["timed out"]) == [
+        ("timed out", [pstore.mails[0]])]
+
+    ranking = utils.ranker(lambda *args: pstore.mails)("rankby", "errors")
+    assert ranking[2:] == ["%-40s  %s" % ("mail transport unavailable", 28),
+                           "%-40s  %s" % ("connect to [<ip>]:<n>: timed out",
+                                          2)]
+
+
+def write_queue_file(path, sender, recipients, content, ctime,
+                     extracted=(), xtra_pointer=True):
+    """Write a synthetic Postfix queue file with pointer records"""
+    with open(path, "wb") as stream:
+        queuefile.write_record(stream, b"C", (
+            "%15d %15d %15d %15d %15d" % (
+                sum(len(line) + 1 for line in content), 0,
+                len(recipients) + len(extracted), 0, 0)).encode())
+        queuefile.write_record(stream, b"T", ("%d 0" % (ctime,)).encode())
+        queuefile.write_record(stream, b"c", ("%d 0" % (ctime,)).encode())
+        queuefile.write_record(stream, b"S", sender)
+        pointer = stream.tell()
+        queuefile.write_record(stream, b"p", ("%15d" % (0,)).encode())
+        message = stream.tell()
+        queuefile.write_record(stream, b"M", ("%15d" % (0,)).encode())
+        for line in content:
+            while len(line) > 20:
+                queuefile.write_record(stream, b"L", line[:20])
+                line = line[20:]
+            queuefile.write_record(stream, b"N", line)
+        xtra_offset = stream.tell()
+        queuefile.write_record(stream, b"X", b"")
+        # Recipients extracted from headers, as done by Postfix
+        for rcpt in extracted:
+            queuefile.write_record(stream, b"R", rcpt)
+        queuefile.write_record(stream, b"E", b"")
+        # Recipients appended after message end
+        recipients_offset = stream.tell()
+        for rcpt in recipients:
+            queuefile.write_record(stream, b"R", rcpt)
+        queuefile.write_record(stream, b"p", ("%15d" % (message,)).encode())
+        stream.seek(pointer)
+        queuefile.write_record(stream, b"p",
+                               ("%15d" % (recipients_offset,)).encode())
+        if xtra_pointer:
+            stream.seek(message)
+            queuefile.write_record(stream, b"M",
+                                   ("%15d" % (xtra_offset,)).encode())
+
+
+def test_queuefile_load(tmpdir):
+    """Test QueueFile.load method"""
+    path = str(tmpdir.join("10DFD11830F2"))
+    content = [b"From: Sender <sender-1@testsend_domain.tld>",
+               b"Subject: Test email with a very long subject line",
+               b"", b"This is test."]
+    write_queue_file(path, b"sender-1@testsend_domain.tld",
+                     [b"user-1@test-domain.tld", b"user-2@test-domain.tld"],
+                     content, 1501510572)
+    qfile = queuefile.QueueFile(path)
+    qfile.load()
+    assert qfile.size == 109
+    assert qfile.date == datetime.fromtimestamp(1501510572)
+    assert qfile.sender == "sender-1@testsend_domain.tld"
+    assert qfile.recipients == ["user-1@test-domain.tld",
+                                "user-2@test-domain.tld"]
+    assert qfile.content == [line.decode() for line in content]
+
+    qfile = queuefile.QueueFile(path)
+    qfile.load(mode="envelope")
+    assert qfile.sender == "sender-1@testsend_domain.tld"
+    assert len(qfile.recipients) == 2
+    assert qfile.content == []
+    qfile = queuefile.QueueFile(path)
+    qfile.load(mode="headers")
+    assert qfile.content == [line.decode() for line in content[:2]]
+    with pytest.raises(ValueError):
+        queuefile.QueueFile(path).load(mode="unknown")
+
+    for xtra_pointer in (True, False):
+        write_queue_file(path, b"sender-1@testsend_domain.tld",
+                         [b"user-1@test-domain.tld"], content, 1501510572,
+                         extracted=[b"user-2@test-domain.tld"],
+                         xtra_pointer=xtra_pointer)
+        for mode in queuefile.QueueFile.modes:
+            qfile = queuefile.QueueFile(path)
+            qfile.load(mode=mode)
+            assert qfile.recipients == ["user-1@test-domain.tld",
+                                        "user-2@test-domain.tld"]
+            assert len(qfile.content) == {"envelope": 0, "headers": 2,
+                                          "full": 4}[mode]
+
+    with open(path, "r+b") as stream:
+        stream.truncate(len(stream.read()) - 5)
+    with pytest.raises(ValueError):
+        queuefile.QueueFile(path).load()
+
+
+def test_store_load_from_spool_copy(tmpdir, monkeypatch):
+    """Test PostqueueStore._load_from_spool method on a spool copy"""
+    content = [b"From: Sender <sender-1@testsend_domain.tld>",
+               b"To: User <user-1@test-domain.tld>",
+               b"Subject: Test email", b"", b"This is test."]
+    tmpdir.mkdir("active")
+    write_queue_file(str(tmpdir.mkdir("deferred").mkdir("1")
+                         .join("10DFD11830F2")),
+                     b"sender-1@testsend_domain.tld",
+                     [b"user-1@test-domain.tld"], content, 1501510572)
+    tmpdir.mkdir("hold").join("1FD2B11832C4").write("\x00")
+
+    pstore = store.PostqueueStore()
+    pstore.spool_path = str(tmpdir)
+    pstore.load(method="spool")
+    mails = sorted(pstore.mails, key=lambda mail: mail.qid)
+    assert mails[0].sender == "sender-1@testsend_domain.tld"
+    assert mails[0].parsed is False
+
+    monkeypatch.setitem(pymailq.CONFIG['core'], 'load_method', "spool")
+    pstore.load(parse=True)
+    mails = sorted(pstore.mails, key=lambda mail: mail.qid)
+    assert [mail.status for mail in mails] == ["deferred", "hold"]
+    assert mails[0].parsed is True
+    assert mails[0].sender == "sender-1@testsend_domain.tld"
+    assert mails[0].recipients == ["user-1@test-domain.tld"]
+    assert mails[0].date == datetime.fromtimestamp(1501510572)
+    assert mails[0].head.Subject == ["Test email"]
+    assert mails[1].parsed is False
+    assert "1FD2B11832C4" in mails[1].parse_error
+
+
+def test_store_fetch(tmpdir):
+    """Test PostqueueStore.fetch method"""
+    assert queuefile.queue_id_hash("10DFD11830F2") == "10DFD11830F2"
+    # Long queue ID microseconds field "1kTb" is 244691
+    assert queuefile.queue_id_hash("3yWfR91kTbz2bHZ") == "3BBD3"
+    assert queuefile.queue_id_directories("3yWfR91kTbz2bHZ", 2) == [
+        "3", "B"]
+    assert queuefile.queue_id_directories("ABC", 4) == ["A", "B", "C", "_"]
+
+    content = [b"From: Sender <sender-1@testsend_domain.tld>",
+               b"Subject: Test email", b"", b"This is test."]
+    write_queue_file(str(tmpdir.mkdir("deferred").mkdir("1").mkdir("0")
+                         .join("10DFD11830F2")),
+                     b"sender-1@testsend_domain.tld",
+                     [b"user-1@test-domain.tld", b"user-2@test-domain.tld"],
+                     content, 1501510572)
+    tmpdir.mkdir("defer").mkdir("1").mkdir("0").join("10DFD11830F2").write(
+        "recipient=user-1@test-domain.tld\nstatus=4.4.1\n"
+        "reason=connect to test-domain.tld: Connection timed out\n\n"
+        "recipient=user-2@test-domain.tld\nstatus=4.4.1\n"
+        "reason=connect to test-domain.tld: Connection timed out\n\n")
+    write_queue_file(str(tmpdir.mkdir("hold").join("3yWfR91kTbz2bHZ")),
+                     b"sender-2@testsend_domain.tld",
+                     [b"user-1@test-domain.tld"], content, 1501510572)
+
+    pstore = store.PostqueueStore()
+    pstore.spool_path = str(tmpdir)
+    pstore.hash_queue_depth = 2
+    assert pstore.get_queue_file_path("hold", "3yWfR91kTbz2bHZ") == str(
+        tmpdir.join("hold").join("3yWfR91kTbz2bHZ"))
+
+    mail = pstore.fetch("10DFD11830F2")
+    assert mail.status == "deferred"
+    assert mail.sender == "sender-1@testsend_domain.tld"
+    assert mail.recipients == ["user-1@test-domain.tld",
+                               "user-2@test-domain.tld"]
+    assert mail.errors == ["connect to test-domain.tld: Connection timed out"]
+    assert mail.parsed is False
+    assert not len(pstore.mails)
+
+    mail = pstore.fetch("3yWfR91kTbz2bHZ!", parse=True)
+    assert mail.qid == "3yWfR91kTbz2bHZ"
+    assert mail.status == "hold"
+    assert mail.errors == []
+    assert mail.head.Subject == ["Test email"]
+
+    assert pstore.fetch("1FD2B11832C4") is None
+    assert pstore.fetch("../../10DFD11830F2") is None
+    pstore.hash_queue_depth = 1
+    assert pstore.fetch("10DFD11830F2") is None
+
+
 def test_selector_get_mails_by_qids():
     """Test MailSelector.get_mails_by_qids method"""
     pymailq.CONFIG['commands']['use_sudo'] = True
@@ -207,6 +1114,20 @@ def test_control_unknown_command():
     pymailq.CONFIG['commands']['hold_message'] = orig_command
 
 
+def test_control_stream(monkeypatch):
+    """Test QueueControl operations on a mails stream"""
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'use_sudo', False)
+    monkeypatch.setitem(pymailq.CONFIG['commands'], 'hold_message',
+                        ["sh", "-c", "cat >&2"])
+    pstore = store.PostqueueStore()
+    pstore.load(filename="tests/samples/mailq.sample")
+    stream = selector.MailSelector(pstore).stream().limit(2)
+    result = QCONTROL.hold_messages(mail for mail in stream)
+    assert result == [mail.qid for mail in pstore.mails[:2]]
+    with pytest.raises(AttributeError):
+        QCONTROL.hold_messages([None])
+
+
 def test_control_nothing_done():
     """Test QueueControl on unexistent mail ID"""
     pymailq.CONFIG['commands']['use_sudo'] = True
@@ -165,6 +165,12 @@ def test_shell_store_load():
     assert "mails loaded from queue" in resp
 
 
+def test_shell_store_reload():
+    """Test 'store reload' command"""
+    resp = run_cmd("store reload")
+    assert "mails loaded from queue (0 added, 0 removed)" in resp
+
+
 def test_shell_store_status_loaded():
     """Test 'store status' command with loaded store"""
     resp = run_cmd("store status")
@@ -234,6 +240,17 @@ def test_shell_show_selected_rankby():
     assert len(resp.split('\n')) == 5
 
 
+def test_shell_show_errors():
+    """Test 'show errors' command"""
+    resp = run_cmd("show errors")
+    assert "mail transport unavailable" in resp
+    resp = run_cmd("show errors transport unknown")
+    assert "signature" in resp
+    assert len(resp.split('\n')) == 4
+    resp = run_cmd("show selected rankby errors")
+    assert "mail transport unavailable" in resp
+
+
 def test_shell_show_selected_long_format():
     """Test 'show selected format' command"""
     resp = run_cmd("show selected limit 2 long")
@@ -370,6 +387,47 @@ def test_shell_select_date():
     assert "'XXXX-XX-XX' does not match format '%Y-%m-%d'" in resp
 
 
+def test_shell_select_where():
+    """Test 'select where' command"""
+    resp = run_cmd("select where")
+    assert "empty query" in resp
+    resp = run_cmd("select where status")
+    assert "unexpected end of query, a value expected" in resp
+    resp = run_cmd("select where ( status deferred")
+    assert "unexpected end of query, ')' expected" in resp
+    resp = run_cmd("select where foo bar")
+    assert "unknown predicate: foo" in resp
+    resp = run_cmd("select where size 12 12")
+    assert "unexpected word: 12" in resp
+    assert 'mails loaded from queue' in run_cmd("store load")
+    assert 'Selector resetted with store content' in run_cmd("select reset")
+    assert not len(run_cmd("select where status deferred and ( sender "
+                           "sender-1@test-domain.tld exact or recipient "
+                           "user-3@test-domain.tld exact ) and not size -100"))
+    resp = run_cmd("show selected")
+    assert len(resp.split("\n")) == 300
+
+
+def test_shell_explain():
+    """Test 'explain' command"""
+    run_cmd("select reset")
+    resp = run_cmd("explain")
+    assert "No filters applied on current selection" in resp
+    run_cmd("select qids XXXXXXXXXX")
+    run_cmd("select status deferred")
+    resp = run_cmd("explain")
+    assert "0: select qids: " in resp
+    assert "estimated 1 mails, 0 mails selected in" in resp
+    assert "1: select status: " in resp
+    assert "    status: deferred" in resp
+    run_cmd("select replay")
+    resp = run_cmd("explain")
+    assert "select qids: " in resp
+    assert "select status: " in resp
+    assert "(cached)" in resp
+    run_cmd("select reset")
+
+
 def test_shell_select_error():
     """Test 'select date' command"""
     assert 'mails loaded from queue' in run_cmd("store load")